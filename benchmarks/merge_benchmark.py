@@ -0,0 +1,133 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Benchmark the enrichment of sales journal rows with promo and segments columns, against the previous pandas merge
+implementation, and check both produce the same output.
+
+Usage: python benchmarks/merge_benchmark.py [-n <number of sales journal ids>] [-r <repeats>]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sales_journal.solids.read_cvs_node import merge_promo_df, merge_segments_df
+
+
+def generate_dfs(ids: int, seed: int = 0) -> tuple:
+    """
+    Generate sales journal, promo and segments DataFrames, with promos for about a third and segments for most of the
+    sales journal ids
+    :param ids: number of sales journal ids
+    :param seed: random seed
+    :return: tuple of sales journal, promo and segments DataFrames
+    """
+    rng = np.random.default_rng(seed)
+    sj_ids = np.arange(ids, dtype=np.int64) + 11000000
+    sj_df = pd.DataFrame({
+        'ID': sj_ids,
+        'SEQUENCE': rng.integers(1, 3, ids).astype(np.int32),
+        'AMOUNT': rng.random(ids).astype(np.float32) * 1000,
+        'CURRENCY': pd.Categorical(rng.choice(['EUR', 'GBP', 'USD'], ids)),
+    })
+    promo_ids = np.sort(rng.choice(sj_ids, ids // 3, replace=False))
+    promo_df = pd.DataFrame({
+        'SALESJOURNALID': promo_ids,
+        'SEQUENCE': rng.integers(1, 3, len(promo_ids)).astype(np.int32),
+        'PROMOCODE': rng.choice(['SPRING', 'SUMMER', 'WINTER'], len(promo_ids)).astype(object),
+        'PROMOAMOUNT': rng.random(len(promo_ids)) * 100,
+    })
+    seg_ids = np.sort(rng.choice(sj_ids, ids * 9 // 10, replace=False))
+    segments = pd.DataFrame({
+        'SALESJOURNALID': seg_ids,
+        'SEGMENTS': rng.choice(['DUB-LHR', 'DUB-LHR,LHR-JFK', 'CDG-AMS'], len(seg_ids)).astype(object),
+    })
+    return sj_df, promo_df, segments
+
+
+def pandas_merge(sj_df: pd.DataFrame, promo_df: pd.DataFrame, segments: pd.DataFrame) -> pd.DataFrame:
+    """
+    Previous implementation of merge_promo_df() followed by merge_segments_df()
+    :param sj_df: sales journal DataFrame
+    :param promo_df: promo DataFrame
+    :param segments: segments DataFrame
+    :return: merged DataFrame
+    """
+    merged = sj_df.merge(promo_df, left_on=['ID', 'SEQUENCE'], right_on=['SALESJOURNALID', 'SEQUENCE'],
+                         how='left', suffixes=('_left', '_right'))
+    merged = merged.drop(['SALESJOURNALID'], axis=1)
+    merged = merged.merge(segments, left_on=['ID'], right_on=['SALESJOURNALID'],
+                          how='left', suffixes=('_left', '_right'))
+    return merged.drop(['SALESJOURNALID'], axis=1)
+
+
+def sorted_merge(sj_df: pd.DataFrame, promo_df: pd.DataFrame, segments: pd.DataFrame) -> pd.DataFrame:
+    """
+    Current implementation
+    :param sj_df: sales journal DataFrame
+    :param promo_df: promo DataFrame
+    :param segments: segments DataFrame
+    :return: merged DataFrame
+    """
+    return merge_segments_df(merge_promo_df(sj_df, promo_df), segments)
+
+
+def best_time(func, dfs: tuple, repeats: int) -> tuple:
+    """
+    Time a function
+    :param func: function to time
+    :param dfs: DataFrames to pass to the function, a copy of the first is passed on each run
+    :param repeats: number of runs
+    :return: tuple of best time in seconds and result of the last run
+    """
+    best = None
+    result = None
+    for _ in range(repeats):
+        data = dfs[0].copy()
+        start = time.perf_counter()
+        result = func(data, *dfs[1:])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark promo and segments enrichment')
+    parser.add_argument('-n', type=int, default=1000000, help='number of sales journal ids')
+    parser.add_argument('-r', type=int, default=3, help='number of repeats')
+    args = parser.parse_args()
+
+    dfs = generate_dfs(args.n)
+    print(f'{args.n} sales journal rows, {len(dfs[1])} promos, {len(dfs[2])} segments')
+
+    merge_time, expected = best_time(pandas_merge, dfs, args.r)
+    sorted_time, result = best_time(sorted_merge, dfs, args.r)
+    pd.testing.assert_frame_equal(result, expected)
+
+    print(f'pandas merge: {merge_time:.3f}s')
+    print(f'sorted join:  {sorted_time:.3f}s ({merge_time / sorted_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
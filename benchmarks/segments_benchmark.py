@@ -0,0 +1,122 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Benchmark the aggregation of segs files to one row per sales journal id, against the previous groupby/apply
+implementation, and check both produce the same output.
+
+Usage: python benchmarks/segments_benchmark.py [-n <number of sales journal ids>] [-r <repeats>]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sales_journal.solids.read_cvs_node import aggregate_segments_df
+
+AIRPORTS = ['DUB', 'LHR', 'JFK', 'CDG', 'AMS', 'FRA', 'MAD', 'BCN', 'ORD', 'LAX']
+CARRIERS = ['EI', 'BA', 'AA', 'AF', 'KL', 'LH', 'IB', 'UA']
+
+
+def generate_segs_df(ids: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a segs DataFrame, as read with the default read plan, with 1 to 4 flights per sales journal id in random
+    order and a few missing airport codes
+    :param ids: number of sales journal ids
+    :param seed: random seed
+    :return: segs DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    flights = rng.integers(1, 5, ids)
+    rows = int(flights.sum())
+    sequence = np.arange(rows) - np.repeat(np.cumsum(flights) - flights, flights) + 1
+    df = pd.DataFrame({
+        'SALESJOURNALID': np.repeat(np.arange(ids, dtype=np.int64) + 11000000, flights),
+        'ORIGINCODE': rng.choice(AIRPORTS, rows).astype(object),
+        'DESTINATIONCODE': rng.choice(AIRPORTS, rows).astype(object),
+        'OPERATINGCARRIER': rng.choice(CARRIERS, rows).astype(object),
+        'MARKETINGCARRIER': rng.choice(CARRIERS, rows).astype(object),
+        'FLIGHTSEQUENCE': sequence.astype(np.int32),
+    })
+    df.loc[rng.random(rows) < 0.01, 'DESTINATIONCODE'] = np.nan
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def groupby_aggregate_segments_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Previous implementation of aggregate_segments_df(), a Python call per sales journal id
+    :param df: segs DataFrame
+    :return: segments DataFrame
+    """
+    df['SEG'] = df['ORIGINCODE'] + '-' + df['DESTINATIONCODE']
+    df = df.drop(['ID', 'ORIGINCODE', 'DESTINATIONCODE'], axis=1, errors='ignore')
+    df.sort_values(by=['SALESJOURNALID', 'FLIGHTSEQUENCE'], inplace=True)
+    segments = df.groupby(['SALESJOURNALID'])['SEG']. \
+        apply(lambda segs: segs.str.cat(sep=','))
+    segments = df.merge(segments.to_frame(), left_on=['SALESJOURNALID'], right_index=True,
+                        how='left', suffixes=('_left', '_right'))
+    segments = segments.drop(['FLIGHTSEQUENCE', 'SEG_left'], axis=1)
+    segments = segments.rename(columns={'SEG_right': 'SEGMENTS'})
+    segments.drop_duplicates(subset='SALESJOURNALID', keep='first', inplace=True)
+    return segments.reset_index(drop=True)
+
+
+def best_time(func, df: pd.DataFrame, repeats: int) -> tuple:
+    """
+    Time a function
+    :param func: function to time
+    :param df: DataFrame to pass to the function, a copy is passed on each run
+    :param repeats: number of runs
+    :return: tuple of best time in seconds and result of the last run
+    """
+    best = None
+    result = None
+    for _ in range(repeats):
+        data = df.copy()
+        start = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark segs aggregation')
+    parser.add_argument('-n', type=int, default=200000, help='number of sales journal ids')
+    parser.add_argument('-r', type=int, default=3, help='number of repeats')
+    args = parser.parse_args()
+
+    df = generate_segs_df(args.n)
+    print(f'{len(df)} flights for {args.n} sales journal ids')
+
+    groupby_time, expected = best_time(groupby_aggregate_segments_df, df, args.r)
+    vectorized_time, result = best_time(aggregate_segments_df, df, args.r)
+    pd.testing.assert_frame_equal(result, expected)
+
+    print(f'groupby/apply: {groupby_time:.3f}s')
+    print(f'vectorized:    {vectorized_time:.3f}s ({groupby_time / vectorized_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
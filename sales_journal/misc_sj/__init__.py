@@ -21,10 +21,145 @@
 
 from .DataSet import DataSet
 from .sj_types import BitArray
+from .archives import (
+    ARCHIVE_EXTENSIONS,
+    is_archive,
+    list_archive_members,
+    archive_member_path,
+    split_archive_path,
+    open_archive_member,
+)
+from .compression import (
+    COMPRESSION_EXTENSIONS,
+    get_compression,
+    open_decompressed,
+    register_decompressor,
+)
+from .manifest import (
+    LIST_WORKERS,
+    FileManifest,
+    get_data_roots,
+    parse_date_window,
+)
+from .watch import DirectoryWatcher
+from .memory import (
+    MemoryGovernor,
+    get_memory_governor,
+    format_bytes,
+)
+from .external_sort import (
+    ExternalSorter,
+    get_external_sorter,
+    is_file_sorted,
+)
+from .scheduling import (
+    SCHEDULE_ORDERS,
+    FileSetScheduler,
+    get_file_set_scheduler,
+)
+from .work_claims import (
+    WORK_LEASE_SECONDS,
+    WorkClaims,
+    get_work_claims,
+    start_claim_heartbeat,
+    complete_claims,
+    stop_claim_heartbeats,
+)
+from .fingerprint import (
+    HASH_WORKERS,
+    read_cost,
+    content_hash,
+    hash_files,
+)
+from .timestamps import (
+    is_fixed_width_format,
+    parse_timestamps,
+)
+from .staging_cache import (
+    StagingCache,
+    get_staging_cache,
+)
+from .readers import (
+    ENGINE_C,
+    ENGINE_PYARROW,
+    CSV_ENGINES,
+    PARALLEL_READ_MIN_SIZE,
+    COLUMNAR_EXTENSIONS,
+    is_columnar_file,
+    columnar_row_count,
+    read_data_file,
+    iter_data_file,
+    read_columnar_file,
+    read_csv_file,
+    read_csv_file_parallel,
+    iter_csv_file,
+)
 
 # if somebody does "from sales_journal.pipelines import *", this is what they will
 # be able to access:
 __all__ = [
     'DataSet',
     'BitArray',
+
+    'ARCHIVE_EXTENSIONS',
+    'is_archive',
+    'list_archive_members',
+    'archive_member_path',
+    'split_archive_path',
+    'open_archive_member',
+
+    'COMPRESSION_EXTENSIONS',
+    'get_compression',
+    'open_decompressed',
+    'register_decompressor',
+
+    'LIST_WORKERS',
+    'FileManifest',
+    'get_data_roots',
+    'parse_date_window',
+    'DirectoryWatcher',
+
+    'MemoryGovernor',
+    'get_memory_governor',
+    'format_bytes',
+
+    'ExternalSorter',
+    'get_external_sorter',
+    'is_file_sorted',
+
+    'SCHEDULE_ORDERS',
+    'FileSetScheduler',
+    'get_file_set_scheduler',
+
+    'WORK_LEASE_SECONDS',
+    'WorkClaims',
+    'get_work_claims',
+    'start_claim_heartbeat',
+    'complete_claims',
+    'stop_claim_heartbeats',
+
+    'HASH_WORKERS',
+    'read_cost',
+    'content_hash',
+    'hash_files',
+
+    'is_fixed_width_format',
+    'parse_timestamps',
+
+    'StagingCache',
+    'get_staging_cache',
+
+    'ENGINE_C',
+    'ENGINE_PYARROW',
+    'CSV_ENGINES',
+    'PARALLEL_READ_MIN_SIZE',
+    'COLUMNAR_EXTENSIONS',
+    'is_columnar_file',
+    'columnar_row_count',
+    'read_data_file',
+    'iter_data_file',
+    'read_columnar_file',
+    'read_csv_file',
+    'read_csv_file_parallel',
+    'iter_csv_file',
 ]
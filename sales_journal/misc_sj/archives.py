@@ -0,0 +1,175 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import re
+import tarfile
+import zipfile
+
+# separator between the archive path and member name in the path of a file in an archive;
+# e.g. 'data/export.zip!SJ_01-04-2019-to-01-05-2019.csv'
+ARCHIVE_SEPARATOR = '!'
+
+ARCHIVE_ZIP = 'zip'
+ARCHIVE_TAR = 'tar'
+
+# archive types by file extension
+ARCHIVE_EXTENSIONS = {
+    '.zip': ARCHIVE_ZIP,
+    '.tar': ARCHIVE_TAR,
+    '.tar.gz': ARCHIVE_TAR,
+    '.tgz': ARCHIVE_TAR,
+    '.tar.bz2': ARCHIVE_TAR,
+    '.tar.xz': ARCHIVE_TAR,
+}
+
+_ARCHIVE_PATH_REGEX = re.compile(
+    '^(.+(' + '|'.join([re.escape(ext) for ext in ARCHIVE_EXTENSIONS.keys()]) + '))' +
+    re.escape(ARCHIVE_SEPARATOR) + '(.+)$', re.IGNORECASE)
+
+
+def get_archive_type(filepath: str) -> str:
+    """
+    Get the archive type of a file from its extension
+    :param filepath: path to file
+    :return: name of archive type or None if not an archive
+    """
+    archive_type = None
+    lower_path = filepath.lower()
+    for extension, a_type in ARCHIVE_EXTENSIONS.items():
+        if lower_path.endswith(extension):
+            archive_type = a_type
+            break
+    return archive_type
+
+
+def is_archive(filepath: str) -> bool:
+    """
+    Check if a file is an archive
+    :param filepath: path to file
+    :return: True if archive
+    """
+    return get_archive_type(filepath) is not None
+
+
+def archive_member_path(archive_path: str, member: str) -> str:
+    """
+    Generate the path of a file in an archive
+    :param archive_path: path to archive
+    :param member: name of file in archive
+    :return: path
+    """
+    return f'{archive_path}{ARCHIVE_SEPARATOR}{member}'
+
+
+def split_archive_path(filepath) -> tuple:
+    """
+    Split the path of a file in an archive into the archive path and member name
+    :param filepath: path to file
+    :return: tuple of archive path and member name, or None if not the path of a file in an archive
+    """
+    split = None
+    if isinstance(filepath, str):
+        match = _ARCHIVE_PATH_REGEX.match(filepath)
+        if match:
+            split = (match.group(1), match.group(3))
+    return split
+
+
+def list_archive_members(archive_path: str) -> list:
+    """
+    List the files in an archive
+    :param archive_path: path to archive
+    :return: list of member names
+    """
+    if get_archive_type(archive_path) == ARCHIVE_ZIP:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [info.filename for info in archive.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(archive_path, 'r:*') as archive:
+            members = [info.name for info in archive.getmembers() if info.isfile()]
+    return members
+
+
+def open_archive_member(filepath: str):
+    """
+    Open a file in an archive for reading, without extracting it
+    :param filepath: path to file in archive
+    :return: binary file-like object
+    """
+    split = split_archive_path(filepath)
+    if split is None:
+        raise ValueError(f'Not the path of a file in an archive: {filepath}')
+    archive_path, member = split
+
+    if get_archive_type(archive_path) == ARCHIVE_ZIP:
+        archive = zipfile.ZipFile(archive_path)
+        try:
+            fhandle = archive.open(member)
+        except KeyError:
+            archive.close()
+            raise FileNotFoundError(f'{member} not found in {archive_path}')
+    else:
+        # streaming mode, so compressed tar files are not decompressed twice to find the member
+        archive = tarfile.open(archive_path, 'r|*')
+        fhandle = None
+        for info in archive:
+            if info.name == member:
+                fhandle = archive.extractfile(info)
+                break
+        if fhandle is None:
+            archive.close()
+            raise FileNotFoundError(f'{member} not found in {archive_path}')
+
+    return io.BufferedReader(ArchiveMemberReader(fhandle, archive))
+
+
+class ArchiveMemberReader(io.RawIOBase):
+    """
+    Raw stream reading a file in an archive, which closes the archive when closed
+    """
+
+    def __init__(self, member, *resources):
+        """
+        Initialise object
+        :param member: binary file-like object to read from
+        :param resources: objects to close, in order, after closing member; e.g. the archive
+        """
+        super().__init__()
+        self._member = member
+        self._resources = resources
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._member.read(len(buffer))
+        count = len(data)
+        buffer[:count] = data
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._member.close()
+            for resource in self._resources:
+                resource.close()
+        super().close()
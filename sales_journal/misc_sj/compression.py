@@ -0,0 +1,244 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from .archives import split_archive_path, open_archive_member, ArchiveMemberReader
+
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+try:
+    import pgzip
+except ImportError:
+    pgzip = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_XZ = 'xz'
+COMPRESSION_BZ2 = 'bz2'
+
+# compression types by file extension
+COMPRESSION_EXTENSIONS = {
+    '.gz': COMPRESSION_GZIP,
+    '.zst': COMPRESSION_ZSTD,
+    '.xz': COMPRESSION_XZ,
+    '.bz2': COMPRESSION_BZ2,
+}
+
+# size of blocks passed from the background decompression thread
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+# number of decompressed blocks which may be queued ahead of the reader
+DECOMPRESS_QUEUE_BLOCKS = 8
+
+
+def open_gzip(filepath: str, threads: int = 0):
+    """
+    Open a gzip file for reading, using the fastest available implementation
+    :param filepath: path to file or binary file-like object
+    :param threads: number of decompression threads, if supported; 0 for the number of cpus
+    :return: binary file-like object
+    """
+    if threads is None or threads <= 0:
+        threads = os.cpu_count() or 1
+    if pgzip is not None and threads > 1:
+        # multi-threaded inflate
+        fhandle = pgzip.open(filepath, 'rb', thread=threads)
+    elif igzip is not None:
+        fhandle = igzip.open(filepath, 'rb')
+    else:
+        fhandle = gzip.open(filepath, 'rb')
+    return fhandle
+
+
+def open_zstd(filepath: str, threads: int = 0):
+    """
+    Open a zstandard file for reading
+    :param filepath: path to file or binary file-like object
+    :param threads: number of decompression threads, not used
+    :return: binary file-like object
+    """
+    if zstandard is None:
+        raise ImportError(f"Reading '{filepath}' requires the zstandard package")
+    # the zstandard reader doesn't support readline()
+    return io.BufferedReader(zstandard.open(filepath, 'rb'))
+
+
+def open_xz(filepath: str, threads: int = 0):
+    """
+    Open an xz file for reading
+    :param filepath: path to file or binary file-like object
+    :param threads: number of decompression threads, not used
+    :return: binary file-like object
+    """
+    return lzma.open(filepath, 'rb')
+
+
+def open_bz2(filepath: str, threads: int = 0):
+    """
+    Open a bzip2 file for reading
+    :param filepath: path to file or binary file-like object
+    :param threads: number of decompression threads, not used
+    :return: binary file-like object
+    """
+    return bz2.open(filepath, 'rb')
+
+
+# functions to open files by compression type; additional types may be added via register_decompressor()
+DECOMPRESSORS = {
+    COMPRESSION_GZIP: open_gzip,
+    COMPRESSION_ZSTD: open_zstd,
+    COMPRESSION_XZ: open_xz,
+    COMPRESSION_BZ2: open_bz2,
+}
+
+
+def register_decompressor(extension: str, compression: str, opener):
+    """
+    Register a function to open compressed files
+    :param extension: file extension, including the leading '.'
+    :param compression: name of compression type
+    :param opener: function taking a file path & thread count, and returning a binary file-like object
+    """
+    COMPRESSION_EXTENSIONS[extension.lower()] = compression
+    DECOMPRESSORS[compression] = opener
+
+
+def get_compression(filepath) -> str:
+    """
+    Get the compression type of a file from its extension
+    :param filepath: path to file
+    :return: name of compression type or None if not compressed
+    """
+    compression = None
+    if isinstance(filepath, str):
+        compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(filepath)[1].lower())
+    return compression
+
+
+def open_decompressed(filepath: str, threads: int = 0, background: bool = True):
+    """
+    Open a possibly compressed file, or a file in an archive, for reading
+    :param filepath: path to file
+    :param threads: number of decompression threads, if supported by the compression type; 0 for the number of cpus
+    :param background: decompress in a background thread so decompression overlaps with the consumer
+    :return: binary file-like object
+    """
+    compression = get_compression(filepath)
+    in_archive = split_archive_path(filepath) is not None
+    if in_archive:
+        fhandle = open_archive_member(filepath)
+        if compression is not None:
+            # e.g. csv.gz in a zip; decompressors don't close file objects they are passed, so close it with them
+            member = fhandle
+            fhandle = io.BufferedReader(ArchiveMemberReader(DECOMPRESSORS[compression](member, threads), member))
+    elif compression is not None:
+        fhandle = DECOMPRESSORS[compression](filepath, threads)
+    else:
+        fhandle = open(filepath, 'rb')
+
+    if background and (in_archive or compression is not None):
+        fhandle = io.BufferedReader(BackgroundReader(fhandle), buffer_size=DECOMPRESS_BLOCK_SIZE)
+    return fhandle
+
+
+def is_compressed_source(filepath) -> bool:
+    """
+    Check if a file needs to be opened via open_decompressed() to be read
+    :param filepath: path to file
+    :return: True if a compressed file or a file in an archive
+    """
+    return get_compression(filepath) is not None or split_archive_path(filepath) is not None
+
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Raw stream which reads blocks from a file-like object in a background thread
+    """
+
+    def __init__(self, source, block_size: int = DECOMPRESS_BLOCK_SIZE, queue_blocks: int = DECOMPRESS_QUEUE_BLOCKS):
+        """
+        Initialise object
+        :param source: binary file-like object to read from
+        :param block_size: size of blocks to read
+        :param queue_blocks: max number of blocks to read ahead
+        """
+        super().__init__()
+        self._source = source
+        self._block_size = block_size
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                block = self._source.read(self._block_size)
+                self._put(block)
+                if not block:
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+            self._pending = memoryview(item)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
@@ -0,0 +1,286 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .memory import MB, file_size
+from .readers import (
+    ENGINE_C,
+    pa,
+    pa_parquet,
+    iter_data_file,
+    iter_csv_file,
+    is_columnar_file,
+    iter_columnar_tables,
+    columnar_to_pandas,
+)
+
+# default number of rows in each sorted run
+DEFAULT_RUN_ROWS = 1000000
+# min number of rows to buffer from each run while merging
+MIN_MERGE_ROWS = 10000
+# column holding the row number in the original file, which makes every sort key unique so the sort is stable
+ROW_COLUMN = '__sj_row'
+
+
+class ExternalSorter:
+    """
+    Sorts data files by key columns with bounded memory. The file is read in runs of 'run_rows' rows, each run is
+    sorted and spilled to a temporary directory, and the runs are merged a chunk at a time into a sorted file. Csv
+    files are sorted into a csv file, Parquet & Feather files into a Parquet file with the same column types.
+    Key columns must be numeric and not null
+    :param threshold: min size in bytes of a file to sort on disk
+    :param run_rows: number of rows in each sorted run
+    :param tmp_dir: directory for temporary files, or None for the system default
+    """
+
+    def __init__(self, threshold: int, run_rows: int = DEFAULT_RUN_ROWS, tmp_dir: str = None):
+        self.threshold = threshold
+        self.run_rows = max(1, run_rows)
+        self.tmp_dir = tmp_dir
+
+    def applies(self, filepath: str) -> bool:
+        """
+        Check if a file is large enough to be sorted on disk
+        :param filepath: path to file
+        :return: True if the file should be sorted on disk
+        """
+        try:
+            return file_size(filepath) >= self.threshold
+        except OSError:
+            return False
+
+    def sort(self, filepath: str, keys: list, dtype: dict = None, usecols: list = None,
+             engine: str = ENGINE_C) -> str:
+        """
+        Sort a data file by key columns. Rows with equal keys keep their order in the file
+        :param filepath: path to file
+        :param keys: names of the key columns
+        :param dtype: dict of dtypes with column name as the key
+        :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+        :param engine: csv parse engine to use
+        :return: path of a csv or Parquet file of the sorted rows, which should be removed with remove(), or None if
+                 the file is already sorted
+        """
+        if is_file_sorted(filepath, keys, self.run_rows, dtype=dtype, engine=engine):
+            return None
+
+        extension = 'parquet' if is_columnar_file(filepath) else 'csv'
+        sorted_dir = tempfile.mkdtemp(prefix='sj_sorted_', dir=self.tmp_dir)
+        sorted_path = os.path.join(sorted_dir, f'{os.path.basename(filepath).split(".")[0]}.{extension}')
+        try:
+            with tempfile.TemporaryDirectory(prefix='sj_runs_', dir=self.tmp_dir) as run_dir:
+                runs, columns, schema = self._write_runs(filepath, keys, run_dir, dtype, usecols, engine)
+                self._merge_runs(runs, columns, keys, sorted_path, dtype, schema)
+        except BaseException:
+            shutil.rmtree(sorted_dir, ignore_errors=True)
+            raise
+        return sorted_path
+
+    @staticmethod
+    def remove(sorted_path: str):
+        """
+        Remove a sorted file created by sort()
+        :param sorted_path: path of the sorted file
+        """
+        if sorted_path is not None:
+            shutil.rmtree(os.path.dirname(sorted_path), ignore_errors=True)
+
+    def _write_runs(self, filepath: str, keys: list, run_dir: str, dtype: dict, usecols: list, engine: str) -> tuple:
+        """
+        Read a file in runs, sort each run and save it to a csv file, or a Parquet file for Parquet & Feather files
+        :return: tuple of list of run file paths, list of the column names in the file, and Arrow schema of the runs
+                 or None for csv files
+        """
+        runs = []
+        columns = None
+        schema = None
+        start = 0
+        for chunk in self._iter_runs(filepath, dtype, usecols, engine):
+            if isinstance(chunk, tuple):
+                # the file's own types are kept, dtype is applied when the sorted file is read
+                schema, chunk = chunk
+                schema = schema.append(pa.field(ROW_COLUMN, pa.int64()))
+            if columns is None:
+                columns = list(chunk.columns)
+            sort_by = key_columns(chunk, keys) + [ROW_COLUMN]
+            chunk[ROW_COLUMN] = np.arange(start, start + len(chunk), dtype=np.int64)
+            start += len(chunk)
+            chunk.sort_values(by=sort_by, inplace=True)
+            if schema is None:
+                run_path = os.path.join(run_dir, f'run{len(runs)}.csv')
+                chunk.to_csv(run_path, index=False)
+            else:
+                run_path = os.path.join(run_dir, f'run{len(runs)}.parquet')
+                pa_parquet.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), run_path)
+            runs.append(run_path)
+        return runs, columns, schema
+
+    def _iter_runs(self, filepath: str, dtype: dict, usecols: list, engine: str):
+        """
+        Read a file in runs
+        :return: generator of DataFrames for csv files, or of tuples of Arrow schema & DataFrame for Parquet & Feather
+                 files
+        """
+        if is_columnar_file(filepath):
+            for table in iter_columnar_tables(filepath, self.run_rows, usecols):
+                yield table.schema, columnar_to_pandas(table)
+        else:
+            for chunk in iter_data_file(filepath, self.run_rows, dtype=dtype, usecols=usecols, engine=engine):
+                yield chunk
+
+    def _merge_runs(self, runs: list, columns: list, keys: list, sorted_path: str, dtype: dict, schema):
+        """
+        Merge sorted runs into a sorted file. Each round writes the rows of all runs up to the smallest last key
+        in the buffered chunks, and refills the buffer which supplied it
+        """
+        merge_rows = max(MIN_MERGE_ROWS, self.run_rows // max(1, len(runs)))
+        if schema is None:
+            run_dtype = None
+            if dtype is not None:
+                run_dtype = {column: dtype[column.strip()] for column in columns if column.strip() in dtype}
+                run_dtype[ROW_COLUMN] = np.int64
+            readers = [iter_csv_file(run, merge_rows, dtype=run_dtype) for run in runs]
+            with open(sorted_path, 'w', newline='') as fhandle:
+                header = True
+
+                def write(merged):
+                    nonlocal header
+                    merged.to_csv(fhandle, index=False, header=header)
+                    header = False
+                self._merge_buffers(readers, keys, write)
+        else:
+            readers = [iter_data_file(run, merge_rows) for run in runs]
+            sorted_schema = schema.remove(schema.get_field_index(ROW_COLUMN))
+            with pa_parquet.ParquetWriter(sorted_path, sorted_schema) as writer:
+                self._merge_buffers(readers, keys, lambda merged: writer.write_table(
+                    pa.Table.from_pandas(merged, schema=sorted_schema, preserve_index=False)))
+
+    @staticmethod
+    def _merge_buffers(readers: list, keys: list, write):
+        """
+        Merge sorted runs a chunk at a time
+        :param readers: generators of DataFrames of the sorted runs
+        :param keys: names of the key columns
+        :param write: function to write a DataFrame of merged rows, without the row column
+        """
+        buffers = [next(reader, None) for reader in readers]
+        while any(buffer is not None for buffer in buffers):
+            sort_by = None
+            bound = None
+            for buffer in buffers:
+                if buffer is not None and len(buffer) > 0:
+                    sort_by = key_columns(buffer, keys) + [ROW_COLUMN]
+                    last = tuple(buffer[sort_by].iloc[-1])
+                    bound = last if bound is None or last < bound else bound
+
+            parts = []
+            for idx, buffer in enumerate(buffers):
+                if buffer is None:
+                    continue
+                count = 0 if bound is None else \
+                    int(lex_less_equal([buffer[column].to_numpy() for column in sort_by], bound).sum())
+                if count > 0:
+                    parts.append(buffer.iloc[:count])
+                if count < len(buffer):
+                    buffers[idx] = buffer.iloc[count:]
+                else:
+                    buffers[idx] = next(readers[idx], None)
+
+            if len(parts) > 0:
+                merged = pd.concat(parts).sort_values(by=sort_by)
+                write(merged.drop(columns=[ROW_COLUMN]))
+
+
+def key_columns(df: pd.DataFrame, keys: list) -> list:
+    """
+    Get the names of key columns in a DataFrame, ignoring whitespace around the names
+    :param df: DataFrame
+    :param keys: names of the key columns
+    :return: list of column names
+    """
+    names = {column.strip(): column for column in df.columns}
+    return [names[key] for key in keys]
+
+
+def lex_less_equal(left: list, right) -> np.ndarray:
+    """
+    Compare rows lexicographically
+    :param left: list of arrays, one per key column
+    :param right: list of arrays, one per key column, or tuple of scalar values
+    :return: array of flags, True if the left row is less than or equal to the right row
+    """
+    less = np.zeros(len(left[0]), dtype=bool)
+    equal = np.ones(len(left[0]), dtype=bool)
+    for left_values, right_values in zip(left, right):
+        less |= equal & (left_values < right_values)
+        equal &= left_values == right_values
+    return less | equal
+
+
+def is_file_sorted(filepath: str, keys: list, chunk_rows: int, dtype: dict = None, engine: str = ENGINE_C) -> bool:
+    """
+    Check if a data file is sorted by key columns, only reading the key columns
+    :param filepath: path to file
+    :param keys: names of the key columns
+    :param chunk_rows: number of rows to read at a time
+    :param dtype: dict of dtypes with column name as the key
+    :param engine: csv parse engine to use
+    :return: True if sorted
+    """
+    key_dtype = None
+    if dtype is not None:
+        key_dtype = {key: dtype[key] for key in keys if key in dtype}
+    last = None
+    for chunk in iter_data_file(filepath, chunk_rows, dtype=key_dtype, usecols=keys, engine=engine):
+        if len(chunk) == 0:
+            continue
+        values = [chunk[column].to_numpy() for column in key_columns(chunk, keys)]
+        if last is not None and not lex_less_equal([np.asarray([value]) for value in last],
+                                                   tuple(column[0] for column in values))[0]:
+            return False
+        if not lex_less_equal([column[:-1] for column in values], [column[1:] for column in values]).all():
+            return False
+        last = tuple(column[-1] for column in values)
+    return True
+
+
+def get_external_sorter(sort_cfg: dict):
+    """
+    Get the external sorter
+    :param sort_cfg: external sort configuration;
+                 {'threshold_mb': min size in MB of a file to sort on disk, 'run_rows': number of rows in each sorted
+                  run, 'tmp_dir': directory for temporary files}
+    :return: ExternalSorter or None if not configured
+    """
+    sorter = None
+    if sort_cfg is not None and sort_cfg.get('threshold_mb') is not None:
+        run_rows = DEFAULT_RUN_ROWS
+        if sort_cfg.get('run_rows') is not None:
+            run_rows = int(sort_cfg['run_rows'])
+        sorter = ExternalSorter(int(float(sort_cfg['threshold_mb']) * MB), run_rows=run_rows,
+                                tmp_dir=sort_cfg.get('tmp_dir') or None)
+    return sorter
@@ -0,0 +1,129 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .archives import split_archive_path
+from .compression import (
+    get_compression,
+    open_decompressed,
+    COMPRESSION_ZSTD,
+    COMPRESSION_GZIP,
+    COMPRESSION_BZ2,
+    COMPRESSION_XZ,
+    DECOMPRESS_BLOCK_SIZE,
+)
+from .readers import is_columnar_file
+
+# relative cost of reading a file by compression type; zstd decompresses several times faster than gzip, which is
+# faster than bz2 or xz
+DECOMPRESSION_COSTS = {
+    None: 0,
+    COMPRESSION_ZSTD: 1,
+    COMPRESSION_GZIP: 2,
+    COMPRESSION_BZ2: 3,
+    COMPRESSION_XZ: 3,
+}
+
+# default number of threads used to hash files
+HASH_WORKERS = 4
+
+# content hashes of files, by path; entries are reused while the size and modification time of the file are unchanged
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def read_cost(filepath: str) -> tuple:
+    """
+    Get the relative cost of reading a file, based on its format, compression and whether it's in an archive
+    :param filepath: path to file
+    :return: tuple which sorts cheapest first
+    """
+    return (
+        0 if is_columnar_file(filepath) else 1,    # columnar files only decode the columns required
+        DECOMPRESSION_COSTS.get(get_compression(filepath), max(DECOMPRESSION_COSTS.values())),
+        0 if split_archive_path(filepath) is None else 1,
+    )
+
+
+def file_state(filepath: str) -> tuple:
+    """
+    Get the size and modification time of a file, or of its archive if it's a file in an archive
+    :param filepath: path to file
+    :return: tuple of size and modification time in nanoseconds
+    """
+    split = split_archive_path(filepath)
+    stat = os.stat(split[0] if split is not None else filepath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def content_hash(filepath: str) -> str:
+    """
+    Hash the contents of a file, decompressing it first if it's compressed, so compressed and uncompressed copies of a
+    file have the same hash
+    :param filepath: path to file
+    :return: hex digest of the contents
+    """
+    state = file_state(filepath)
+    with _hashes_lock:
+        cached = _hashes.get(filepath)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    digest = hashlib.blake2b()
+    with open_decompressed(filepath, threads=1, background=False) as fhandle:
+        block = fhandle.read(DECOMPRESS_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = fhandle.read(DECOMPRESS_BLOCK_SIZE)
+    content = digest.hexdigest()
+
+    with _hashes_lock:
+        _hashes[filepath] = (state, content)
+    return content
+
+
+def hash_files(filepaths: list, workers: int = HASH_WORKERS) -> dict:
+    """
+    Hash the contents of files in a pool of threads. Decompression and hashing release the GIL, so files are hashed
+    concurrently
+    :param filepaths: paths of files to hash
+    :param workers: number of threads
+    :return: dict of content hashes with path as the key, the hash is None if the file couldn't be read
+    """
+    def try_content_hash(filepath):
+        try:
+            return content_hash(filepath)
+        except (OSError, EOFError, zlib.error):
+            return None
+
+    filepaths = list(dict.fromkeys(filepaths))
+    if workers <= 1 or len(filepaths) <= 1:
+        hashes = {filepath: try_content_hash(filepath) for filepath in filepaths}
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(filepaths))) as executor:
+            hashes = dict(zip(filepaths, executor.map(try_content_hash, filepaths)))
+    return hashes
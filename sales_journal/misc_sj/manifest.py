@@ -0,0 +1,373 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import calendar
+import fnmatch
+import json
+import os
+import re
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from .archives import is_archive, list_archive_members, archive_member_path
+
+# increment when the manifest layout changes, so old manifests are discarded
+MANIFEST_VERSION = 2
+
+# default number of threads listing directories
+LIST_WORKERS = 8
+
+GLOB_MAGIC = re.compile(r'[*?[]')
+# year, month & day directories, e.g. 2019/04 or 2019/04/01
+YEAR_DIR = re.compile(r'^\d{4}$')
+MONTH_DAY_DIR = re.compile(r'^\d{1,2}$')
+
+
+def split_data_root(root: str) -> tuple:
+    """
+    Split a data root into its base directory and the pattern the paths of files below the base directory must match.
+    A root without wildcards matches the files directly in it, '**' matches any number of directories
+    :param root: directory, or directory and glob pattern, e.g. 'data', 'archive/**' or 'archive/*/*/*.csv.gz'
+    :return: tuple of base directory and list of pattern components
+    """
+    parts = os.path.normpath(root).split(os.sep)
+    for index, part in enumerate(parts):
+        if GLOB_MAGIC.search(part):
+            base = os.sep.join(parts[:index])
+            if base == '':
+                base = os.sep if root.startswith(os.sep) else os.curdir
+            return base, parts[index:]
+    return root, ['*']
+
+
+def get_data_roots(db_data_path) -> list:
+    """
+    Get the data roots from the data path configuration
+    :param db_data_path: data root or list of data roots
+    :return: list of tuples of base directory and list of pattern components
+    """
+    if isinstance(db_data_path, str):
+        db_data_path = [db_data_path]
+    return [split_data_root(root) for root in db_data_path]
+
+
+def parse_date_window(window_cfg: dict, date_in_name_format: str):
+    """
+    Parse the date window configuration
+    :param window_cfg: date window configuration; {'start': start date, 'end': end date}, dates in
+                       date_in_name_format, either may be blank for an open window
+    :param date_in_name_format: datetime format of dates in csv filenames
+    :return: tuple of start & end datetime, either may be None, or None if no window
+    """
+    window = None
+    if window_cfg is not None:
+        window = tuple([datetime.strptime(str(window_cfg[key]), date_in_name_format) if window_cfg.get(key) else None
+                        for key in ['start', 'end']])
+        if window == (None, None):
+            window = None
+    return window
+
+
+def match_path(pattern: list, parts: list) -> bool:
+    """
+    Check if a path matches a pattern
+    :param pattern: list of pattern components, '**' matches any number of components
+    :param parts: list of path components
+    :return: True if matches
+    """
+    if len(pattern) == 0:
+        return len(parts) == 0
+    if pattern[0] == '**':
+        return match_path(pattern[1:], parts) or (len(parts) > 0 and match_path(pattern, parts[1:]))
+    return len(parts) > 0 and fnmatch.fnmatchcase(parts[0], pattern[0]) and match_path(pattern[1:], parts[1:])
+
+
+def may_match_below(pattern: list, parts: list) -> bool:
+    """
+    Check if files in a directory, or its subdirectories, may match a pattern
+    :param pattern: list of pattern components, '**' matches any number of components
+    :param parts: list of path components of the directory
+    :return: True if files below the directory may match
+    """
+    if len(pattern) == 0:
+        return False
+    if pattern[0] == '**' or len(parts) == 0:
+        return True
+    return fnmatch.fnmatchcase(parts[0], pattern[0]) and may_match_below(pattern[1:], parts[1:])
+
+
+class FileManifest:
+    """
+    On-disk record of the files in the data directories, so only new or changed files need to be examined on each run.
+    Directories are listed in parallel, and directories whose modification time is unchanged aren't relisted
+    """
+
+    def __init__(self, manifest_path: str, db_data_path, date_in_name_pattern: str, date_in_name_format: str,
+                 date_window: tuple = None, list_workers: int = LIST_WORKERS):
+        """
+        Initialise object
+        :param manifest_path: path to manifest file, or None to not save the manifest between runs
+        :param db_data_path: directory containing database csv files, or list of directories; directories may include
+                             glob patterns, see split_data_root()
+        :param date_in_name_pattern: regex to match dates in csv filenames
+        :param date_in_name_format: datetime format to convert dates in csv filenames
+        :param date_window: tuple of start & end datetime, either may be None, of the start dates of files to list, or
+                            None for all files; files and directories dated outside the window are skipped without
+                            being examined
+        :param list_workers: number of threads listing directories
+        """
+        self._manifest_path = manifest_path
+        self._roots = get_data_roots(db_data_path)
+        self._date_in_name_pattern = date_in_name_pattern
+        self._date_in_name_format = date_in_name_format
+        self._date_window = date_window
+        self._list_workers = max(list_workers, 1)
+        self._regex = re.compile(date_in_name_pattern)
+        self._dirs = {}     # modification time, subdirectory names & file entries, by directory path
+        self._load()
+
+    def _header(self) -> dict:
+        return {
+            'version': MANIFEST_VERSION,
+            'data_roots': [[os.path.abspath(base), pattern] for base, pattern in self._roots],
+            'date_in_name_pattern': self._date_in_name_pattern,
+            'date_in_name_format': self._date_in_name_format,
+            'date_window': [date.isoformat() if date is not None else None for date in self._date_window]
+            if self._date_window is not None else None,
+        }
+
+    def _load(self):
+        if self._manifest_path is not None and os.path.isfile(self._manifest_path):
+            try:
+                with open(self._manifest_path, 'r') as fhandle:
+                    manifest = json.load(fhandle)
+            except (IOError, ValueError):
+                manifest = {}   # unreadable, so rebuild it
+            header = self._header()
+            if all([manifest.get(key) == value for key, value in header.items()]):
+                self._dirs = manifest['dirs']
+
+    def save(self):
+        """
+        Save the manifest
+        """
+        if self._manifest_path is not None:
+            manifest = self._header()
+            manifest['dirs'] = self._dirs
+            if self._in_data_dir() and os.path.isfile(self._manifest_path):
+                # overwrite in place, as replacing the file would change the directory modification time
+                with open(self._manifest_path, 'w') as fhandle:
+                    json.dump(manifest, fhandle)
+            else:
+                temp_path = self._manifest_path + '.tmp'
+                with open(temp_path, 'w') as fhandle:
+                    json.dump(manifest, fhandle)
+                os.replace(temp_path, self._manifest_path)
+
+    def _in_data_dir(self) -> bool:
+        if self._manifest_path is None:
+            return False
+        manifest_dir = os.path.abspath(os.path.dirname(self._manifest_path))
+        return any([os.path.abspath(dirpath) == manifest_dir for dirpath in self._dirs])
+
+    def _name_dates(self, name: str) -> dict:
+        dates = {}
+        match = self._regex.search(name)
+        if match:
+            dates['start_date'] = datetime.strptime(match.group(1), self._date_in_name_format).isoformat()
+            dates['end_date'] = datetime.strptime(match.group(2), self._date_in_name_format).isoformat()
+        return dates
+
+    def _dir_dates(self, parts: list) -> dict:
+        """
+        Get the dates spanned by a directory, from its name or from year, month & day directories
+        :param parts: list of path components of the directory below its root
+        :return: dict of 'start_date' & 'end_date', or empty dict if undated
+        """
+        dates = self._name_dates(parts[-1])
+        if len(dates) == 0:
+            numbers = []
+            for part in parts:
+                if YEAR_DIR.match(part):
+                    numbers = [int(part)]
+                elif MONTH_DAY_DIR.match(part) and 0 < len(numbers) < 3:
+                    numbers.append(int(part))
+                else:
+                    numbers = []
+            try:
+                if len(numbers) == 1:
+                    start, end = datetime(numbers[0], 1, 1), datetime(numbers[0], 12, 31)
+                elif len(numbers) == 2:
+                    start = datetime(numbers[0], numbers[1], 1)
+                    end = datetime(numbers[0], numbers[1], calendar.monthrange(numbers[0], numbers[1])[1])
+                elif len(numbers) == 3:
+                    start = end = datetime(*numbers)
+                if len(numbers) > 0:
+                    dates = {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+            except ValueError:
+                pass    # not a valid date, so undated
+        return dates
+
+    def _in_window(self, dates: dict, span: bool = False) -> bool:
+        """
+        Check if a file starts in the date window, or if a directory may hold such files; undated files & directories
+        are always in the window
+        :param dates: dict of 'start_date' & 'end_date' in ISO format
+        :param span: check if the whole span of the dates overlaps the window, rather than just the start date
+        :return: True if in the window
+        """
+        if self._date_window is None or 'start_date' not in dates:
+            return True
+        window_start, window_end = self._date_window
+        end_date = dates['end_date'] if span else dates['start_date']
+        return (window_end is None or datetime.fromisoformat(dates['start_date']) <= window_end) and \
+            (window_start is None or datetime.fromisoformat(end_date) >= window_start)
+
+    def _list_dir(self, dirpath: str, parts: list, pattern: list, ignore: list, on_error, force: bool) -> tuple:
+        """
+        List a directory
+        :param dirpath: path to directory
+        :param parts: list of path components of the directory below its root
+        :param pattern: list of pattern components files must match
+        :param ignore: absolute paths of files to ignore
+        :param on_error: function to call with a message if the directory or an archive can't be listed
+        :param force: list the directory even if its modification time is unchanged
+        :return: tuple of directory record or None if the directory can't be listed, and number of files examined
+        """
+        try:
+            dir_mtime_ns = os.stat(dirpath).st_mtime_ns
+            cached = self._dirs.get(dirpath)
+            if cached is not None and cached['mtime_ns'] == dir_mtime_ns and not force:
+                return cached, 0
+
+            cached_files = cached['files'] if cached is not None else {}
+            examined = 0
+            record = {'mtime_ns': dir_mtime_ns, 'subdirs': [], 'files': {}}
+            with os.scandir(dirpath) as dir_entries:
+                for dir_entry in dir_entries:
+                    if dir_entry.is_dir():
+                        record['subdirs'].append(dir_entry.name)
+                        continue
+                    if not dir_entry.is_file() or not match_path(pattern, parts + [dir_entry.name]) or \
+                            os.path.abspath(dir_entry.path) in ignore:
+                        continue
+                    dates = self._name_dates(dir_entry.name)
+                    if not self._in_window(dates):
+                        continue    # skip without a stat
+
+                    stat = dir_entry.stat()
+                    entry = cached_files.get(dir_entry.name)
+                    if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                        entry.update(dates)
+                        if is_archive(dir_entry.name):
+                            try:
+                                entry['members'] = [dict(self._name_dates(os.path.basename(member)), member=member)
+                                                    for member in list_archive_members(dir_entry.path)]
+                            except (IOError, zipfile.BadZipFile, tarfile.TarError) as e:
+                                if on_error is not None:
+                                    on_error(f'Error listing archive {dir_entry.path}: {e}')
+                                entry['members'] = []
+                        examined += 1
+                    record['files'][dir_entry.name] = entry
+        except OSError as e:
+            if on_error is not None:
+                on_error(f'Error listing directory {dirpath}: {e}')
+            return None, 0
+        return record, examined
+
+    def refresh(self, on_error=None, force: bool = False) -> int:
+        """
+        Update the manifest from the data directories. Directories whose modification time is unchanged have had no
+        files added or removed, so aren't listed. Otherwise only new files, or files whose size or modification time
+        changed, are examined. Subdirectories are listed in parallel, skipping any outside the date window
+        :param on_error: function to call with a message if a directory or an archive can't be listed
+        :param force: list directories even if their modification time is unchanged, to pick up files which have
+                      been written to since the last refresh
+        :return: number of files examined
+        """
+        ignore = []
+        if self._manifest_path is not None:
+            ignore = [os.path.abspath(self._manifest_path), os.path.abspath(self._manifest_path + '.tmp')]
+
+        examined = 0
+        dirs = {}
+        with ThreadPoolExecutor(max_workers=self._list_workers) as executor:
+            pending = {}
+            for base, pattern in self._roots:
+                pending[executor.submit(self._list_dir, base, [], pattern, ignore, on_error, force)] = \
+                    (base, [], pattern)
+            while len(pending) > 0:
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirpath, parts, pattern = pending.pop(future)
+                    record, count = future.result()
+                    if record is None:
+                        continue
+                    examined += count
+                    if dirpath in dirs:
+                        # listed by more than one root
+                        dirs[dirpath] = dict(record, files=dict(dirs[dirpath]['files'], **record['files']))
+                    else:
+                        dirs[dirpath] = record
+
+                    for subdir in record['subdirs']:
+                        sub_parts = parts + [subdir]
+                        if may_match_below(pattern, sub_parts) and \
+                                self._in_window(self._dir_dates(sub_parts), span=True):
+                            sub_path = os.path.join(dirpath, subdir)
+                            pending[executor.submit(self._list_dir, sub_path, sub_parts, pattern, ignore, on_error,
+                                                    force)] = (sub_path, sub_parts, pattern)
+
+        self._dirs = dirs
+        return examined
+
+    def files(self) -> list:
+        """
+        Get the files in the data directories, with files in archives listed as virtual files
+        :return: list of dictionaries of file details; {
+                    'name': filename, 'path': path including filename,
+                    'start_date': start date in filename, 'end_date': end date in filename
+                    }
+        """
+        def file_details(name, file_path, entry):
+            details = {'name': name, 'path': file_path}
+            if 'start_date' in entry:
+                details['start_date'] = datetime.fromisoformat(entry['start_date'])
+                details['end_date'] = datetime.fromisoformat(entry['end_date'])
+            return details
+
+        files_lst = []
+        for dirpath in sorted(self._dirs.keys()):
+            dir_files = self._dirs[dirpath]['files']
+            for name in sorted(dir_files.keys()):
+                entry = dir_files[name]
+                file_path = os.path.join(dirpath, name)
+                if 'members' in entry:
+                    files_lst.extend([file_details(os.path.basename(member['member']),
+                                                   archive_member_path(file_path, member['member']), member)
+                                      for member in entry['members'] if self._in_window(member)])
+                else:
+                    files_lst.append(file_details(name, file_path, entry))
+        return files_lst
@@ -0,0 +1,277 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+import threading
+
+import psutil
+
+from .archives import split_archive_path
+from .compression import get_compression, open_decompressed
+from .readers import is_columnar_file
+
+MB = 1024 * 1024
+
+# default fraction of the available system memory to leave free
+DEFAULT_HEADROOM = 0.2
+# default ratios of in-memory DataFrame size to uncompressed file size, until ratios are observed
+DEFAULT_EXPANSION_RATIOS = {
+    'csv': 4.0,         # object columns for text fields take several times the size of the text
+    'columnar': 10.0,   # Parquet & Feather files are encoded and compressed internally
+}
+# default ratio of uncompressed to compressed size, for compressed files & files in archives
+DEFAULT_COMPRESSION_RATIO = 6.0
+# weight of a new observation in the smoothed expansion ratio
+RATIO_SMOOTHING = 0.3
+# multiple of the memory used by a streamed chunk needed to merge, transform and upload it
+CHUNK_OVERHEAD = 4.0
+# min number of rows in a streamed chunk
+MIN_CHUNK_SIZE = 1000
+# bytes of a csv file sampled to estimate the size of a row
+ROW_SAMPLE_SIZE = MB
+
+# observed expansion ratios by format key, shared by all governors in the process
+_observed_ratios = {}
+_observed_ratios_lock = threading.Lock()
+
+
+def format_bytes(size: float) -> str:
+    """
+    Format a size in bytes for logging
+    :param size: size in bytes
+    :return: size in MB or GB
+    """
+    return f'{size / (1024 * MB):.2f}GB' if size >= 1024 * MB else f'{size / MB:.1f}MB'
+
+
+def format_key(filepath: str) -> str:
+    """
+    Get the key to record the expansion ratio of a file under, based on its format and compression
+    :param filepath: path to file
+    :return: key, e.g. 'csv', 'csv.gzip', 'columnar' or 'csv.archive'
+    """
+    key = 'columnar' if is_columnar_file(filepath) else 'csv'
+    compression = get_compression(filepath)
+    if compression is not None:
+        key += f'.{compression}'
+    if split_archive_path(filepath) is not None:
+        key += '.archive'
+    return key
+
+
+def file_size(filepath: str) -> int:
+    """
+    Get the size of a file on disk, or of its archive if it's a file in an archive
+    :param filepath: path to file
+    :return: size in bytes
+    """
+    split = split_archive_path(filepath)
+    return os.path.getsize(split[0] if split is not None else filepath)
+
+
+def sample_row_bytes(filepath: str) -> float:
+    """
+    Estimate the average size of a row in a csv file from a sample at the start of the file
+    :param filepath: path to file
+    :return: average uncompressed bytes per row, or None if it couldn't be determined
+    """
+    try:
+        with open_decompressed(filepath, background=False) as fhandle:
+            sample = fhandle.read(ROW_SAMPLE_SIZE)
+    except OSError:
+        return None
+    lines = sample.count(b'\n')
+    return len(sample) / lines if lines > 0 else None
+
+
+class MemoryGovernor:
+    """
+    Sizes the work done in a run to the memory available. The in-memory footprint of a file set is estimated from the
+    size of its files and the ratio of DataFrame size to file size observed for files of the same format
+    """
+
+    def __init__(self, budget: int = None, headroom: float = DEFAULT_HEADROOM, ratios_file: str = None):
+        """
+        Initialise object
+        :param budget: max bytes of memory to use, or None to only limit to the available system memory
+        :param headroom: fraction of the available system memory to leave free
+        :param ratios_file: file to keep observed expansion ratios in between runs, or None
+        """
+        self.budget = budget
+        self.headroom = headroom
+        self.ratios_file = ratios_file
+        if ratios_file is not None and os.path.isfile(ratios_file):
+            try:
+                with open(ratios_file, 'r') as fhandle:
+                    saved = json.load(fhandle)
+                with _observed_ratios_lock:
+                    for key, ratio in saved.items():
+                        _observed_ratios.setdefault(key, float(ratio))
+            except (IOError, ValueError):
+                pass    # unreadable, so start from the defaults
+
+    def expansion_ratio(self, filepath: str) -> float:
+        """
+        Get the expected ratio of in-memory DataFrame size to file size for a file
+        :param filepath: path to file
+        :return: ratio
+        """
+        key = format_key(filepath)
+        with _observed_ratios_lock:
+            ratio = _observed_ratios.get(key)
+        if ratio is None:
+            ratio = DEFAULT_EXPANSION_RATIOS[key.split('.')[0]]
+            if key.count('.') > 0:
+                ratio *= DEFAULT_COMPRESSION_RATIO
+        return ratio
+
+    def estimate_file(self, filepath: str) -> int:
+        """
+        Estimate the in-memory size of a file
+        :param filepath: path to file
+        :return: size in bytes
+        """
+        try:
+            size = file_size(filepath)
+        except OSError:
+            size = 0
+        return int(size * self.expansion_ratio(filepath))
+
+    def estimate_set(self, entries: list) -> int:
+        """
+        Estimate the in-memory size of a file set. An archive is counted once however many set files it holds, its
+        size being divided across them
+        :param entries: list of dictionaries of the files in the set
+        :return: size in bytes
+        """
+        members = {}
+        for entry in entries:
+            split = split_archive_path(entry['path'])
+            if split is not None:
+                members[split[0]] = members.get(split[0], 0) + 1
+
+        estimate = 0
+        for entry in entries:
+            split = split_archive_path(entry['path'])
+            count = members[split[0]] if split is not None else 1
+            estimate += self.estimate_file(entry['path']) // count
+        return estimate
+
+    def available(self) -> int:
+        """
+        Get the memory available for file sets
+        :return: available memory in bytes
+        """
+        available = int(psutil.virtual_memory().available * (1 - self.headroom))
+        if self.budget is not None:
+            available = min(available, self.budget)
+        return available
+
+    def admit(self, estimates: list, max_sets: int) -> int:
+        """
+        Get the number of file sets which fit in the available memory, at least one set is always admitted
+        :param estimates: estimated in-memory sizes of the sets, in order of processing
+        :param max_sets: max number of sets
+        :return: number of sets to admit
+        """
+        available = self.available()
+        admitted = 0
+        total = 0
+        for estimate in estimates[:max_sets]:
+            total += estimate
+            if admitted > 0 and total > available:
+                break
+            admitted += 1
+        return admitted
+
+    def chunk_size(self, filepath: str, max_chunk_size: int) -> int:
+        """
+        Get the number of rows to stream at a time from a csv file, so a chunk fits in the available memory
+        :param filepath: path to file
+        :param max_chunk_size: max number of rows
+        :return: number of rows
+        """
+        if is_columnar_file(filepath):
+            return max_chunk_size
+        line_bytes = sample_row_bytes(filepath)
+        if line_bytes is None:
+            return max_chunk_size
+
+        # uncompressed ratio, as the row size is measured on the decompressed text
+        with _observed_ratios_lock:
+            ratio = _observed_ratios.get('csv', DEFAULT_EXPANSION_RATIOS['csv'])
+        row_bytes = line_bytes * ratio * CHUNK_OVERHEAD
+        rows = int(self.available() / row_bytes)
+        return max(min(MIN_CHUNK_SIZE, max_chunk_size), min(rows, max_chunk_size))
+
+    def observe(self, filepath: str, df) -> float:
+        """
+        Record the ratio of the in-memory size of a DataFrame to the size of the file it was read from
+        :param filepath: path to file
+        :param df: DataFrame read from the file
+        :return: observed ratio, or None if it couldn't be determined
+        """
+        try:
+            size = file_size(filepath)
+        except OSError:
+            size = 0
+        if size == 0 or split_archive_path(filepath) is not None:
+            return None     # archive size isn't the size of the file
+
+        observed = df.memory_usage(index=True, deep=True).sum() / size
+        key = format_key(filepath)
+        with _observed_ratios_lock:
+            ratio = _observed_ratios.get(key)
+            _observed_ratios[key] = observed if ratio is None else \
+                (RATIO_SMOOTHING * observed) + ((1 - RATIO_SMOOTHING) * ratio)
+            saved = dict(_observed_ratios)
+
+        if self.ratios_file is not None:
+            try:
+                temp_path = self.ratios_file + '.tmp'
+                with open(temp_path, 'w') as fhandle:
+                    json.dump(saved, fhandle)
+                os.replace(temp_path, self.ratios_file)
+            except IOError:
+                pass
+        return observed
+
+
+def get_memory_governor(governor_cfg: dict):
+    """
+    Get the memory governor
+    :param governor_cfg: memory governor configuration;
+                 {'budget_mb': max memory to use in MB, 'headroom': fraction of available memory to leave free,
+                  'ratios_file': file to keep observed expansion ratios in}
+    :return: MemoryGovernor or None if not configured
+    """
+    governor = None
+    if governor_cfg is not None:
+        budget = None
+        if governor_cfg.get('budget_mb') is not None:
+            budget = int(float(governor_cfg['budget_mb']) * MB)
+        headroom = DEFAULT_HEADROOM
+        if governor_cfg.get('headroom') is not None:
+            headroom = float(governor_cfg['headroom'])
+        governor = MemoryGovernor(budget=budget, headroom=headroom, ratios_file=governor_cfg.get('ratios_file') or None)
+    return governor
@@ -0,0 +1,620 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from pandas.api.types import is_categorical_dtype, union_categoricals
+from .compression import is_compressed_source, open_decompressed
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from pyarrow import feather as pa_feather
+    from pyarrow import parquet as pa_parquet
+except ImportError:
+    pa = None
+    pa_csv = None
+    pa_feather = None
+    pa_parquet = None
+
+# csv parse engines; 'c' is the default single-threaded pandas parser, 'pyarrow' the multi-threaded Arrow reader
+ENGINE_C = 'c'
+ENGINE_PYARROW = 'pyarrow'
+CSV_ENGINES = [ENGINE_C, ENGINE_PYARROW]
+
+# data file formats
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_FEATHER = 'feather'
+# columnar data file formats by file extension, anything else is read as csv
+COLUMNAR_EXTENSIONS = {
+    '.parquet': FORMAT_PARQUET,
+    '.pq': FORMAT_PARQUET,
+    '.feather': FORMAT_FEATHER,
+}
+
+# files smaller than this are not worth splitting across processes
+PARALLEL_READ_MIN_SIZE = 64 * 1024 * 1024
+# bytes at the start of a file checked for quoted fields before splitting it across processes
+QUOTE_SAMPLE_SIZE = 1024 * 1024
+
+
+def check_csv_engine(engine: str) -> str:
+    """
+    Verify a csv parse engine is supported
+    :param engine: name of parse engine
+    :return: name of parse engine
+    """
+    if engine is None or engine == '':
+        engine = ENGINE_C
+    engine = engine.lower()
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown csv parse engine '{engine}', expected one of {CSV_ENGINES}")
+    if engine == ENGINE_PYARROW and pa_csv is None:
+        raise ImportError(f"The '{ENGINE_PYARROW}' csv parse engine requires the pyarrow package")
+    return engine
+
+
+def read_csv_file(filepath_or_buffer, dtype: dict = None, usecols: list = None, engine: str = ENGINE_C,
+                  sep: str = ',', skiprows: int = 0, encoding: str = None) -> DataFrame:
+    """
+    Read a csv file into a pandas DataFrame
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: parse engine to use
+    :param sep: field delimiter
+    :param skiprows: number of lines to skip at the start of the file
+    :param encoding: file encoding
+    :return: pandas DataFrame
+    """
+    engine = check_csv_engine(engine)
+    include_columns = None
+    if engine == ENGINE_PYARROW:
+        # get the columns before opening the file, as a decompression stream can't be rewound after reading the header
+        include_columns = arrow_include_columns(filepath_or_buffer, usecols, sep, skiprows, encoding)
+
+    source = open_csv_source(filepath_or_buffer)
+    try:
+        if engine == ENGINE_PYARROW:
+            table = pa_csv.read_csv(source,
+                                    read_options=arrow_read_options(skiprows, encoding),
+                                    parse_options=pa_csv.ParseOptions(delimiter=sep),
+                                    convert_options=arrow_convert_options(dtype, include_columns))
+            df = arrow_to_pandas(table, dtype)
+        else:
+            # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html#pandas.read_csv
+            df = pd.read_csv(source, dtype=dtype, usecols=usecols_filter(usecols), sep=sep,
+                             skiprows=skiprows, encoding=encoding)
+    finally:
+        close_csv_source(source, filepath_or_buffer)
+    return df
+
+
+def open_csv_source(filepath_or_buffer):
+    """
+    Open a csv file for reading, decompressing it if it is a compressed file or extracting it if it is in an archive
+    :param filepath_or_buffer: path to file or file-like object to read
+    :return: file-like object for compressed or archived files, otherwise filepath_or_buffer
+    """
+    if is_compressed_source(filepath_or_buffer):
+        source = open_decompressed(filepath_or_buffer)
+    else:
+        source = filepath_or_buffer
+    return source
+
+
+def close_csv_source(source, filepath_or_buffer):
+    """
+    Close a csv file opened by open_csv_source()
+    :param source: object returned by open_csv_source()
+    :param filepath_or_buffer: path to file or file-like object passed to open_csv_source()
+    """
+    if source is not filepath_or_buffer:
+        source.close()
+
+
+def iter_csv_file(filepath_or_buffer, chunksize: int, dtype: dict = None, usecols: list = None,
+                  engine: str = ENGINE_C):
+    """
+    Read a csv file as an iterator of pandas DataFrames
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param chunksize: number of rows in each DataFrame
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: parse engine to use
+    :return: generator of pandas DataFrames
+    """
+    engine = check_csv_engine(engine)
+    include_columns = None
+    if engine == ENGINE_PYARROW:
+        include_columns = arrow_include_columns(filepath_or_buffer, usecols)
+
+    source = open_csv_source(filepath_or_buffer)
+    try:
+        if engine == ENGINE_PYARROW:
+            reader = pa_csv.open_csv(source,
+                                     read_options=arrow_read_options(),
+                                     convert_options=arrow_convert_options(dtype, include_columns))
+            # arrow batches are sized in bytes, so re-slice to the requested number of rows
+            pending = None
+            start = 0
+            for batch in reader:
+                table = pa.Table.from_batches([batch])
+                pending = table if pending is None else pa.concat_tables([pending, table])
+                while pending.num_rows >= chunksize:
+                    df = arrow_to_pandas(pending.slice(0, chunksize), dtype)
+                    df.index = pd.RangeIndex(start, start + len(df))
+                    start += len(df)
+                    yield df
+                    pending = pending.slice(chunksize)
+            if pending is not None and pending.num_rows > 0:
+                df = arrow_to_pandas(pending, dtype)
+                df.index = pd.RangeIndex(start, start + len(df))
+                yield df
+        else:
+            # https://pandas.pydata.org/pandas-docs/stable/user_guide/io.html#io-chunking
+            for chunk in pd.read_csv(source, dtype=dtype, usecols=usecols_filter(usecols),
+                                     chunksize=chunksize):
+                yield chunk
+    finally:
+        close_csv_source(source, filepath_or_buffer)
+
+
+def get_file_format(filepath) -> str:
+    """
+    Get the format of a data file from its extension
+    :param filepath: path to file
+    :return: name of file format
+    """
+    file_format = FORMAT_CSV
+    if isinstance(filepath, str):
+        file_format = COLUMNAR_EXTENSIONS.get(os.path.splitext(filepath)[1].lower(), FORMAT_CSV)
+    return file_format
+
+
+def is_columnar_file(filepath) -> bool:
+    """
+    Check if a data file is in a columnar format, i.e. Parquet or Feather
+    :param filepath: path to file
+    :return: True if columnar format
+    """
+    return get_file_format(filepath) != FORMAT_CSV
+
+
+def read_data_file(filepath_or_buffer, dtype: dict = None, usecols: list = None,
+                   engine: str = ENGINE_C) -> DataFrame:
+    """
+    Read a csv, Parquet or Feather file into a pandas DataFrame
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: csv parse engine to use
+    :return: pandas DataFrame
+    """
+    if is_columnar_file(filepath_or_buffer):
+        df = read_columnar_file(filepath_or_buffer, dtype=dtype, usecols=usecols)
+    else:
+        df = read_csv_file(filepath_or_buffer, dtype=dtype, usecols=usecols, engine=engine)
+    return df
+
+
+def iter_data_file(filepath_or_buffer, chunksize: int, dtype: dict = None, usecols: list = None,
+                   engine: str = ENGINE_C):
+    """
+    Read a csv, Parquet or Feather file as an iterator of pandas DataFrames
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param chunksize: number of rows in each DataFrame
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: csv parse engine to use
+    :return: generator of pandas DataFrames
+    """
+    if is_columnar_file(filepath_or_buffer):
+        start = 0
+        for table in iter_columnar_tables(filepath_or_buffer, chunksize, usecols):
+            df = columnar_to_pandas(table, dtype)
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+    else:
+        for chunk in iter_csv_file(filepath_or_buffer, chunksize, dtype=dtype, usecols=usecols, engine=engine):
+            yield chunk
+
+
+def read_columnar_file(filepath_or_buffer, dtype: dict = None, usecols: list = None) -> DataFrame:
+    """
+    Read a Parquet or Feather file into a pandas DataFrame. Columns are cast to dtype, except for dates and timestamps
+    which keep their stored types
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :return: pandas DataFrame
+    """
+    return columnar_to_pandas(read_columnar_table(filepath_or_buffer, usecols), dtype)
+
+
+def read_columnar_table(filepath_or_buffer, usecols: list = None):
+    """
+    Read a Parquet or Feather file into an Arrow table
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :return: Arrow Table
+    """
+    source = open_columnar_source(filepath_or_buffer)
+    if get_file_format(filepath_or_buffer) == FORMAT_PARQUET:
+        parquet_file = pa_parquet.ParquetFile(source)
+        table = parquet_file.read(columns=columnar_include_columns(parquet_file.schema_arrow.names, usecols))
+    else:
+        table = read_feather_table(source, usecols)
+    return table
+
+
+def iter_columnar_tables(filepath_or_buffer, chunksize: int, usecols: list = None):
+    """
+    Read a Parquet or Feather file as an iterator of Arrow tables
+    :param filepath_or_buffer: path to file or file-like object to read
+    :param chunksize: max number of rows in each table
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :return: generator of Arrow Tables
+    """
+    source = open_columnar_source(filepath_or_buffer)
+    if get_file_format(filepath_or_buffer) == FORMAT_PARQUET:
+        # batches don't span row groups, so may be smaller than chunksize
+        parquet_file = pa_parquet.ParquetFile(source)
+        for batch in parquet_file.iter_batches(
+                batch_size=chunksize, columns=columnar_include_columns(parquet_file.schema_arrow.names, usecols)):
+            yield pa.Table.from_batches([batch])
+    else:
+        table = read_feather_table(source, usecols)
+        for start in range(0, table.num_rows, chunksize):
+            yield table.slice(start, chunksize)
+
+
+def open_columnar_source(filepath_or_buffer):
+    """
+    Open a Parquet or Feather file for reading
+    :param filepath_or_buffer: path to file or file-like object to read
+    :return: path to file or Arrow readable file
+    """
+    if pa is None:
+        raise ImportError(f"Reading '{filepath_or_buffer}' requires the pyarrow package")
+    source = filepath_or_buffer
+    if is_compressed_source(filepath_or_buffer):
+        # both formats need random access, so read compressed or archived files into memory
+        with open_decompressed(filepath_or_buffer, background=False) as fhandle:
+            source = pa.BufferReader(fhandle.read())
+    return source
+
+
+def columnar_row_count(filepath: str) -> int:
+    """
+    Get the number of rows in a Parquet or Feather file from its metadata, without reading the data
+    :param filepath: path to file
+    :return: number of rows, or None if the file is compressed or in an archive, or pyarrow is not available
+    """
+    count = None
+    if pa is not None and not is_compressed_source(filepath):
+        if get_file_format(filepath) == FORMAT_PARQUET:
+            count = pa_parquet.ParquetFile(filepath).metadata.num_rows
+        else:
+            with pa.memory_map(filepath) as source:
+                reader = pa.ipc.open_file(source)
+                count = sum([reader.get_batch(index).num_rows for index in range(reader.num_record_batches)])
+    return count
+
+
+def read_feather_table(source, usecols: list = None):
+    """
+    Read a Feather file into an Arrow table
+    :param source: path to file or Arrow readable file
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :return: Arrow Table
+    """
+    # memory map files so only the projected columns are read from disk
+    table = pa_feather.read_table(source, memory_map=isinstance(source, str))
+    include_columns = columnar_include_columns(table.column_names, usecols)
+    if include_columns is not None:
+        table = table.select(include_columns)
+    return table
+
+
+def columnar_include_columns(names: list, usecols: list) -> list:
+    """
+    Get the names, as they appear in a columnar file, of the columns to read
+    :param names: names of columns in the file
+    :param usecols: list of names of columns to read, or None for all
+    :return: list of column names or None for all
+    """
+    if usecols is None:
+        return None
+    wanted = set(usecols)
+    return [column for column in names if column.strip() in wanted]
+
+
+def columnar_to_pandas(table, dtype: dict = None) -> DataFrame:
+    """
+    Convert an Arrow table read from a Parquet or Feather file to a pandas DataFrame
+    :param table: Arrow Table
+    :param dtype: dict of dtypes with column name as the key
+    :return: pandas DataFrame
+    """
+    if dtype is None:
+        dtype = {}
+    for idx, field in enumerate(table.schema):
+        col_type = dtype.get(field.name.strip())
+        if col_type is None or pa.types.is_temporal(field.type):
+            continue    # dates & timestamps are already typed, so no need to load as text for parsing later
+        a_type = arrow_type(col_type)
+        if field.type != a_type:
+            column = table.column(idx)
+            if pa.types.is_dictionary(a_type) and not pa.types.is_dictionary(field.type):
+                column = column.cast(pa.string()).dictionary_encode()
+            else:
+                column = column.cast(a_type)
+            table = table.set_column(idx, field.name, column)
+
+    df = table.to_pandas()
+    nulls_to_nan(df)
+    return df
+
+
+def nulls_to_nan(df: DataFrame):
+    """
+    Replace the None values, which Arrow nulls in text columns become, with NaN as used by pandas
+    :param df: pandas DataFrame to update
+    """
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+
+
+def read_csv_file_parallel(filepath: str, workers: int, dtype: dict = None, usecols: list = None,
+                           engine: str = ENGINE_C, min_size: int = PARALLEL_READ_MIN_SIZE) -> DataFrame:
+    """
+    Read an uncompressed csv file into a pandas DataFrame, parsing byte ranges of the file in parallel processes.
+    Falls back to a serial read for compressed or archived files, files smaller than min_size or files containing
+    quoted fields, which may contain line breaks. Quoted fields are checked for in the start of the file before any
+    ranges are read, so quoted files only take the serial path; a quoted field later in the file is found when its
+    range is read
+    :param filepath: path to file to read
+    :param workers: max number of processes to use
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: parse engine to use
+    :param min_size: minimum file size in bytes to read in parallel
+    :return: pandas DataFrame, with rows in file order
+    """
+    engine = check_csv_engine(engine)
+    if workers is None:
+        workers = 1
+    workers = min(workers, os.cpu_count() or 1)
+    if min_size is None:
+        min_size = PARALLEL_READ_MIN_SIZE
+
+    df = None
+    if workers > 1 and isinstance(filepath, str) and not is_compressed_source(filepath) and \
+            os.path.getsize(filepath) >= min_size:
+        header, ranges = csv_byte_ranges(filepath, workers)
+        if len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                frames = list(executor.map(read_csv_range,
+                                           [filepath] * len(ranges), [header] * len(ranges), ranges,
+                                           [dtype] * len(ranges), [usecols] * len(ranges), [engine] * len(ranges)))
+            if all(frame is not None for frame in frames):
+                df = concat_csv_frames(frames)
+            # else quoted fields found after the sample, a line break in a field may have been used as a range
+            # boundary
+
+    if df is None:
+        df = read_csv_file(filepath, dtype=dtype, usecols=usecols, engine=engine)
+    return df
+
+
+def csv_byte_ranges(filepath: str, count: int):
+    """
+    Split a csv file into byte ranges which start and end on line boundaries. A file with quoted fields in the first
+    QUOTE_SAMPLE_SIZE bytes is not split, as a line break in a field may be used as a range boundary
+    :param filepath: path to file to split
+    :param count: number of ranges to split the file into
+    :return: tuple of header line and list of (start, end) byte offsets of the ranges following the header
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as fhandle:
+        header = fhandle.readline()
+        start = fhandle.tell()
+        if b'"' in header or b'"' in fhandle.read(QUOTE_SAMPLE_SIZE):
+            return header, [(start, size)]
+        step = max((size - start) // count, 1)
+        ranges = []
+        while start < size:
+            fhandle.seek(min(start + step, size))
+            fhandle.readline()  # move to the start of the next line
+            end = min(fhandle.tell(), size)
+            if size - end < step // 2:
+                end = size  # avoid a small final range
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def read_csv_range(filepath: str, header: bytes, byte_range: tuple, dtype: dict = None, usecols: list = None,
+                   engine: str = ENGINE_C):
+    """
+    Read a byte range of a csv file into a pandas DataFrame
+    :param filepath: path to file to read
+    :param header: header line of the file
+    :param byte_range: tuple of (start, end) byte offsets of the range to read
+    :param dtype: dict of dtypes with column name as the key
+    :param usecols: list of names of columns to read, ignoring whitespace around names in the file, or None for all
+    :param engine: parse engine to use
+    :return: pandas DataFrame, or None if the range contains quoted fields
+    """
+    start, end = byte_range
+    with open(filepath, 'rb') as fhandle:
+        fhandle.seek(start)
+        data = fhandle.read(end - start)
+    if b'"' in data:
+        return None
+    return read_csv_file(io.BytesIO(header + data), dtype=dtype, usecols=usecols, engine=engine)
+
+
+def concat_csv_frames(frames: list) -> DataFrame:
+    """
+    Concatenate DataFrames read from parts of the same csv file
+    :param frames: list of pandas DataFrames
+    :return: pandas DataFrame
+    """
+    df = pd.concat(frames, ignore_index=True)
+    # categoricals with different categories in each part are concatenated as objects, so combine them
+    for column in frames[0].columns:
+        if is_categorical_dtype(frames[0][column].dtype):
+            df[column] = union_categoricals([frame[column] for frame in frames])
+    return df
+
+
+def usecols_filter(usecols: list):
+    """
+    Generate a pandas usecols callable which ignores whitespace around column names in the file
+    :param usecols: list of names of columns to read, or None for all
+    :return: callable or None
+    """
+    if usecols is None:
+        return None
+    names = set(usecols)
+    return lambda column: column.strip() in names
+
+
+def read_csv_header(filepath_or_buffer, sep: str = ',', skiprows: int = 0, encoding: str = None) -> list:
+    """
+    Read the column names from the header of a csv file, without consuming a file-like object
+    :param filepath_or_buffer: path to file or seekable file-like object to read
+    :param sep: field delimiter
+    :param skiprows: number of lines to skip at the start of the file
+    :param encoding: file encoding
+    :return: list of column names
+    """
+    if encoding is None:
+        encoding = 'utf-8'
+    if isinstance(filepath_or_buffer, str):
+        with open_decompressed(filepath_or_buffer, background=False) as fhandle:
+            for _ in range(skiprows + 1):
+                line = fhandle.readline()
+    else:
+        position = filepath_or_buffer.tell()
+        for _ in range(skiprows + 1):
+            line = filepath_or_buffer.readline()
+        filepath_or_buffer.seek(position)
+    return next(csv.reader([line.decode(encoding).rstrip('\r\n')], delimiter=sep))
+
+
+def arrow_include_columns(filepath_or_buffer, usecols: list, sep: str = ',', skiprows: int = 0,
+                          encoding: str = None) -> list:
+    """
+    Get the names, as they appear in the file header, of the columns to read with the Arrow csv reader
+    :param filepath_or_buffer: path to file or seekable file-like object to read
+    :param usecols: list of names of columns to read, or None for all
+    :param sep: field delimiter
+    :param skiprows: number of lines to skip at the start of the file
+    :param encoding: file encoding
+    :return: list of column names or None for all
+    """
+    if usecols is None:
+        return None
+    names = set(usecols)
+    return [column for column in read_csv_header(filepath_or_buffer, sep, skiprows, encoding)
+            if column.strip() in names]
+
+
+def arrow_type(dtype):
+    """
+    Convert a pandas dtype to an Arrow data type
+    :param dtype: pandas dtype
+    :return: Arrow data type
+    """
+    if is_categorical_dtype(dtype):
+        # dictionary encoded columns are converted to pandas categoricals
+        a_type = pa.dictionary(pa.int32(), pa.string())
+    else:
+        np_dtype = np.dtype(dtype)
+        if np_dtype.kind in ['O', 'U', 'S']:
+            a_type = pa.string()
+        else:
+            a_type = pa.from_numpy_dtype(np_dtype)
+    return a_type
+
+
+def arrow_read_options(skiprows: int = 0, encoding: str = None):
+    """
+    Generate the Arrow csv read options
+    :param skiprows: number of lines to skip at the start of the file
+    :param encoding: file encoding
+    :return: Arrow ReadOptions
+    """
+    # https://arrow.apache.org/docs/python/generated/pyarrow.csv.ReadOptions.html
+    return pa_csv.ReadOptions(use_threads=True, skip_rows=skiprows if skiprows is not None else 0,
+                              encoding=encoding if encoding is not None else 'utf8')
+
+
+def arrow_convert_options(dtype: dict = None, include_columns: list = None):
+    """
+    Generate the Arrow csv convert options
+    :param dtype: dict of dtypes with column name as the key
+    :param include_columns: list of names of columns to read, or None for all
+    :return: Arrow ConvertOptions
+    """
+    column_types = {}
+    if dtype is not None:
+        for column, col_type in dtype.items():
+            column_types[column] = arrow_type(col_type)
+    # https://arrow.apache.org/docs/python/generated/pyarrow.csv.ConvertOptions.html
+    # pandas treats empty strings as NaN, so match that behaviour
+    return pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True,
+                                 include_columns=include_columns if include_columns is not None else [])
+
+
+def arrow_to_pandas(table, dtype: dict = None) -> DataFrame:
+    """
+    Convert an Arrow table read from a csv file to a pandas DataFrame matching the pandas csv parser output
+    :param table: Arrow Table
+    :param dtype: dict of dtypes with column name as the key
+    :return: pandas DataFrame
+    """
+    if dtype is None:
+        dtype = {}
+    # Arrow infers dates & timestamps for untyped columns whereas pandas leaves them as text
+    for idx, field in enumerate(table.schema):
+        if field.name not in dtype and (pa.types.is_date(field.type) or pa.types.is_timestamp(field.type)):
+            table = table.set_column(idx, field.name, table.column(idx).cast(pa.string()))
+
+    df = table.to_pandas()
+
+    # pandas names empty column headers 'Unnamed: <idx>'
+    df.columns = [name if name != '' else f'Unnamed: {idx}' for idx, name in enumerate(df.columns)]
+
+    # Arrow nulls in text columns become None, pandas uses NaN
+    nulls_to_nan(df)
+
+    return df
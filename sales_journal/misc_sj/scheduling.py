@@ -0,0 +1,174 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+
+from .archives import split_archive_path
+from .compression import get_compression
+from .memory import DEFAULT_COMPRESSION_RATIO, file_size, sample_row_bytes
+from .readers import is_columnar_file, columnar_row_count
+
+# orders in which file sets may be scheduled
+ORDER_LISTING = 'listing'     # order of the directory listing
+ORDER_OLDEST = 'oldest'       # oldest start date first
+ORDER_NEWEST = 'newest'       # newest start date first
+ORDER_SMALLEST = 'smallest'   # smallest total file size first
+ORDER_LARGEST = 'largest'     # largest total file size first
+SCHEDULE_ORDERS = [ORDER_LISTING, ORDER_OLDEST, ORDER_NEWEST, ORDER_SMALLEST, ORDER_LARGEST]
+
+# bytes per row assumed when the row size of a file can't be determined
+DEFAULT_ROW_BYTES = 200
+
+
+def set_start_date(entries: list):
+    """
+    Get the start date of a file set
+    :param entries: list of dictionaries of the files in the set
+    :return: earliest start date of the files in the set
+    """
+    return min([entry['start_date'] for entry in entries])
+
+
+def set_size(entries: list) -> int:
+    """
+    Get the total size on disk of the files in a file set, counting an archive once however many set files it holds
+    :param entries: list of dictionaries of the files in the set
+    :return: size in bytes
+    """
+    paths = set()
+    for entry in entries:
+        split = split_archive_path(entry['path'])
+        paths.add(split[0] if split is not None else entry['path'])
+    size = 0
+    for filepath in paths:
+        try:
+            size += os.path.getsize(filepath)
+        except OSError:
+            pass
+    return size
+
+
+def estimate_rows(filepath: str) -> int:
+    """
+    Estimate the number of rows in a data file. Columnar files are counted from their metadata, csv files are
+    estimated from their size and the average row size in a sample from the start of the file
+    :param filepath: path to file
+    :return: estimated number of rows
+    """
+    try:
+        if is_columnar_file(filepath):
+            rows = columnar_row_count(filepath)
+            if rows is not None:
+                return rows
+            row_bytes = DEFAULT_ROW_BYTES
+        else:
+            row_bytes = sample_row_bytes(filepath) or DEFAULT_ROW_BYTES
+        size = file_size(filepath)
+    except OSError:
+        return 0
+    if get_compression(filepath) is not None or split_archive_path(filepath) is not None:
+        size *= DEFAULT_COMPRESSION_RATIO   # the row size is measured on the decompressed text
+    return int(size / row_bytes)
+
+
+class FileSetScheduler:
+    """
+    Orders file sets by priority and packs them into runs by total size or row count
+    """
+
+    def __init__(self, order: str = ORDER_LISTING, max_bytes: int = None, max_rows: int = None):
+        """
+        Initialise object
+        :param order: order to schedule sets in; one of SCHEDULE_ORDERS
+        :param max_bytes: max total size on disk of the sets in a run, or None for no limit
+        :param max_rows: max estimated number of rows in the sets in a run, or None for no limit
+        """
+        if order not in SCHEDULE_ORDERS:
+            raise ValueError(f"Unknown file set schedule order '{order}', expected one of {SCHEDULE_ORDERS}")
+        self.order = order
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+
+    def sort(self, sets_list: list) -> list:
+        """
+        Sort file sets into priority order
+        :param sets_list: list of, dictionaries of dictionaries of all the files in an import set
+        :return: sorted list
+        """
+        if self.order == ORDER_LISTING:
+            return list(sets_list)
+
+        def priority(set_entry):
+            entries = list(set_entry.values())[0]   # there's only one key
+            if self.order in [ORDER_OLDEST, ORDER_NEWEST]:
+                return set_start_date(entries)
+            return set_size(entries)
+
+        # sorted is stable, so ties keep listing order
+        return sorted(sets_list, key=priority, reverse=self.order in [ORDER_NEWEST, ORDER_LARGEST])
+
+    def pack(self, sets_list: list, max_sets: int) -> tuple:
+        """
+        Get the number of sets, in order, that fit in a run. At least one set is always packed, even if it exceeds the
+        limits on its own
+        :param sets_list: list of, dictionaries of dictionaries of all the files in an import set, in priority order
+        :param max_sets: max number of sets
+        :return: tuple of number of sets, total bytes and total estimated rows of those sets; totals are None if not
+                 limited
+        """
+        count = 0
+        total_bytes = 0 if self.max_bytes is not None else None
+        total_rows = 0 if self.max_rows is not None else None
+        for set_entry in sets_list[:max_sets]:
+            entries = list(set_entry.values())[0]
+            set_bytes = set_size(entries) if self.max_bytes is not None else 0
+            set_rows = sum([estimate_rows(entry['path']) for entry in entries]) if self.max_rows is not None else 0
+            if count > 0 and ((self.max_bytes is not None and total_bytes + set_bytes > self.max_bytes) or
+                              (self.max_rows is not None and total_rows + set_rows > self.max_rows)):
+                break   # keep to priority order rather than skipping ahead to a smaller set
+            count += 1
+            if total_bytes is not None:
+                total_bytes += set_bytes
+            if total_rows is not None:
+                total_rows += set_rows
+        return count, total_bytes, total_rows
+
+
+def get_file_set_scheduler(schedule_cfg: dict):
+    """
+    Get the file set scheduler
+    :param schedule_cfg: file set schedule configuration;
+                 {'order': one of SCHEDULE_ORDERS, 'max_mb_per_run': max total size of sets in MB,
+                  'max_rows_per_run': max estimated rows in sets}
+    :return: FileSetScheduler or None if not configured
+    """
+    scheduler = None
+    if schedule_cfg is not None:
+        order = schedule_cfg.get('order') or ORDER_LISTING
+        max_bytes = None
+        if schedule_cfg.get('max_mb_per_run'):
+            max_bytes = int(float(schedule_cfg['max_mb_per_run']) * 1024 * 1024)
+        max_rows = None
+        if schedule_cfg.get('max_rows_per_run'):
+            max_rows = int(schedule_cfg['max_rows_per_run'])
+        scheduler = FileSetScheduler(order=order.lower(), max_bytes=max_bytes, max_rows=max_rows)
+    return scheduler
@@ -0,0 +1,166 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import os
+import pandas as pd
+from pandas import DataFrame
+
+from sales_journal.version import __version__
+from .archives import split_archive_path
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# extension of staged file set files
+STAGED_EXTENSION = '.parquet'
+# version of the staged file set contents; increment when the reading or transforming of file sets changes the
+# DataFrames produced, so sets staged by earlier code aren't loaded
+STAGING_FORMAT_VERSION = 1
+
+
+class StagingCache:
+    """
+    Local cache of transformed file set DataFrames, keyed by a fingerprint of the files in the set
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 0):
+        """
+        Initialise object
+        :param cache_dir: directory to store staged file sets in
+        :param max_size: max total size in bytes of the staged file sets, or 0 for no limit
+        """
+        if pyarrow is None:
+            raise ImportError('The staging cache requires the pyarrow package')
+        self._cache_dir = cache_dir
+        self._max_size = max_size if max_size is not None else 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @staticmethod
+    def fingerprint(set_files: list, desc_path: str) -> str:
+        """
+        Generate the cache key for a file set
+        :param set_files: list of dicts of the files in the set; [{'name': filename, 'path': path, ...}, ...]
+        :param desc_path: path to the sales_data_desc file used to transform the set
+        :return: key
+        """
+        key = hashlib.sha256()
+        for file in sorted(set_files, key=lambda entry: entry['path']):
+            split = split_archive_path(file['path'])
+            stat = os.stat(file['path'] if split is None else split[0])     # the archive for archive members
+            key.update(f"{file['path']}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+        with open(desc_path, 'rb') as fhandle:
+            key.update(hashlib.sha256(fhandle.read()).digest())
+        key.update(f'{STAGING_FORMAT_VERSION}|{__version__}'.encode('utf-8'))
+        return key.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + STAGED_EXTENSION)
+
+    def load(self, key: str):
+        """
+        Load a staged file set
+        :param key: cache key
+        :return: DataFrame or None if not in the cache
+        """
+        df = None
+        path = self._path(key)
+        if os.path.isfile(path):
+            df = pd.read_parquet(path)
+            os.utime(path)  # mark as recently used
+        return df
+
+    def save(self, key: str, df: DataFrame):
+        """
+        Save a file set to the cache, evicting the least recently used file sets if the cache is over size
+        :param key: cache key
+        :param df: DataFrame to save
+        """
+        path = self._path(key)
+        temp_path = path + '.tmp'
+        df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)    # so a partially written file is never loaded
+        self.evict()
+
+    def entries(self) -> list:
+        """
+        List the staged file sets
+        :return: list of tuples of path, size & last used time, least recently used first
+        """
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            if name.endswith(STAGED_EXTENSION):
+                path = os.path.join(self._cache_dir, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used file sets until the cache is within its max size
+        :return: number of file sets removed
+        """
+        removed = 0
+        if self._max_size > 0:
+            entries = self.entries()
+            total = sum([entry[1] for entry in entries])
+            for path, size, _ in entries:
+                if total <= self._max_size:
+                    break
+                os.remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def purge(self) -> int:
+        """
+        Remove all file sets from the cache
+        :return: number of file sets removed
+        """
+        entries = self.entries()
+        for path, _, _ in entries:
+            os.remove(path)
+        return len(entries)
+
+
+def get_staging_cache(cache_cfg: dict):
+    """
+    Get the staging cache specified by a configuration
+    :param cache_cfg: staging cache configuration; {'cache_dir': directory, 'max_size_mb': max size in MB}
+    :return: StagingCache or None if the cache is disabled
+    """
+    cache = None
+    if cache_cfg is not None and cache_cfg.get('cache_dir'):
+        max_size = cache_cfg.get('max_size_mb')
+        cache = StagingCache(cache_cfg['cache_dir'], int(max_size) * 1024 * 1024 if max_size else 0)
+    return cache
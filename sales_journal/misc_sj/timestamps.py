@@ -0,0 +1,160 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+import pandas as pd
+from pandas import Series
+
+# fixed-width strptime directives; directive: (width, field)
+FIXED_WIDTH_DIRECTIVES = {
+    'd': (2, 'day'),
+    'm': (2, 'month'),
+    'Y': (4, 'year'),
+    'H': (2, 'hour'),
+    'M': (2, 'minute'),
+    'S': (2, 'second'),
+}
+
+
+def fixed_width_layout(fmt: str):
+    """
+    Get the layout of the strings matching a fixed-width datetime format
+    :param fmt: strptime format, e.g. '%d-%m-%Y %H:%M:%S'
+    :return: tuple of string width, dict of (offset, width) with field as the key & list of (offset, literal byte),
+             or None if the format is not fixed-width
+    """
+    fields = {}
+    literals = []
+    offset = 0
+    idx = 0
+    while idx < len(fmt):
+        char = fmt[idx]
+        if char == '%':
+            if idx + 1 >= len(fmt):
+                return None
+            directive = fmt[idx + 1]
+            if directive == '%':
+                literals.append((offset, ord('%')))
+                offset += 1
+            elif directive in FIXED_WIDTH_DIRECTIVES and FIXED_WIDTH_DIRECTIVES[directive][1] not in fields:
+                width, field = FIXED_WIDTH_DIRECTIVES[directive]
+                fields[field] = (offset, width)
+                offset += width
+            else:
+                return None     # variable width or unsupported directive
+            idx += 2
+        else:
+            if ord(char) > 127:
+                return None
+            literals.append((offset, ord(char)))
+            offset += 1
+            idx += 1
+    if 'year' not in fields or 'month' not in fields or 'day' not in fields:
+        return None
+    return offset, fields, literals
+
+
+def is_fixed_width_format(fmt: str) -> bool:
+    """
+    Check if a datetime format is fixed-width, i.e. only zero-padded numeric fields & literals
+    :param fmt: strptime format
+    :return: True if fixed-width
+    """
+    return fmt is not None and fixed_width_layout(fmt) is not None
+
+
+def parse_timestamps(series: Series, fmt: str) -> Series:
+    """
+    Convert strings to datetimes. Strings in a fixed-width format are parsed by slicing the fields, after removing
+    duplicate strings, otherwise pandas.to_datetime() is used
+    :param series: Series of strings
+    :param fmt: strptime format
+    :return: Series of datetime64
+    """
+    layout = fixed_width_layout(fmt) if fmt is not None else None
+    if layout is None or not (series.dtype == object or pd.api.types.is_categorical_dtype(series.dtype)):
+        return pd.to_datetime(series, format=fmt)
+
+    # parse each distinct string once; timestamps repeat within a reservation
+    codes, uniques = pd.factorize(series)
+    parsed = parse_fixed_width(np.asarray(uniques, dtype=object), layout)
+    if parsed is None:
+        # not all strings match the layout, so let pandas parse or report the error
+        parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=fmt).values
+
+    values = np.empty(len(codes), dtype='datetime64[ns]')
+    valid = codes >= 0
+    values[valid] = parsed[codes[valid]]
+    values[~valid] = np.datetime64('NaT')
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def parse_fixed_width(strings: np.ndarray, layout: tuple):
+    """
+    Parse fixed-width datetime strings by slicing the fields
+    :param strings: array of strings
+    :param layout: layout from fixed_width_layout()
+    :return: array of datetime64[ns], or None if any string doesn't match the layout
+    """
+    width, fields, literals = layout
+    if len(strings) == 0:
+        return np.empty(0, dtype='datetime64[ns]')
+    if not all(isinstance(string, str) and len(string) == width for string in strings):
+        return None
+    try:
+        chars = strings.astype(f'S{width}').view(np.uint8).reshape(len(strings), width)
+    except UnicodeEncodeError:
+        return None
+
+    for offset, literal in literals:
+        if not (chars[:, offset] == literal).all():
+            return None
+
+    def field_value(field, default):
+        if field not in fields:
+            return np.full(len(strings), default, dtype=np.int64)
+        offset, field_width = fields[field]
+        digits = chars[:, offset:offset + field_width].astype(np.int64) - ord('0')
+        if ((digits < 0) | (digits > 9)).any():
+            raise ValueError(field)
+        return digits @ (10 ** np.arange(field_width - 1, -1, -1, dtype=np.int64))
+
+    try:
+        year = field_value('year', 1970)
+        month = field_value('month', 1)
+        day = field_value('day', 1)
+        hour = field_value('hour', 0)
+        minute = field_value('minute', 0)
+        second = field_value('second', 0)
+    except ValueError:
+        return None
+
+    if ((month < 1) | (month > 12) | (day < 1) | (hour > 23) | (minute > 59) | (second > 59)).any():
+        return None
+    months = (year - 1970) * 12 + (month - 1)
+    month_start = months.astype('datetime64[M]').astype('datetime64[D]')
+    days_in_month = ((months + 1).astype('datetime64[M]').astype('datetime64[D]') - month_start).astype(np.int64)
+    if (day > days_in_month).any():
+        return None
+
+    return (month_start + (day - 1)).astype('datetime64[ns]') + \
+        ((hour * 3600 + minute * 60 + second) * 1000000000).astype('timedelta64[ns]')
@@ -0,0 +1,145 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import time
+
+from .archives import split_archive_path
+
+try:
+    import inotify_simple
+except ImportError:     # optional, the directory is polled instead
+    inotify_simple = None
+
+
+class DirectoryWatcher:
+    """
+    Wait for files to be added to, or written in, a directory and track when files have stopped changing. Uses inotify
+    if the inotify_simple package is installed and the platform supports it, otherwise the directory is polled
+    """
+
+    def __init__(self, path, poll_interval: float = 10.0, use_inotify: bool = True):
+        """
+        Initialise object
+        :param path: directory to watch, or list of directories; changes in their subdirectories are picked up when
+                     the directories are polled
+        :param poll_interval: max seconds to wait for a change
+        :param use_inotify: use inotify if available
+        """
+        self._path = path
+        self._poll_interval = poll_interval
+        self._inotify = None
+        self._observed = {}     # observed size & modification time and the time it was first observed, by path
+
+        if use_inotify and inotify_simple is not None:
+            try:
+                inotify = inotify_simple.INotify()
+                flags = inotify_simple.flags
+                for dirpath in ([path] if isinstance(path, str) else path):
+                    inotify.add_watch(dirpath, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO |
+                                      flags.MOVED_FROM | flags.DELETE)
+                self._inotify = inotify
+            except OSError:
+                pass    # e.g. not linux or watch limit reached, so poll
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def using_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for a change in the directory
+        :param timeout: max seconds to wait, defaults to the poll interval
+        :return: True if a change was notified, or if the directory is polled
+        """
+        if timeout is None or timeout > self._poll_interval:
+            timeout = self._poll_interval
+        if self._inotify is not None:
+            changed = len(self._inotify.read(timeout=int(timeout * 1000))) > 0
+        else:
+            time.sleep(timeout)
+            changed = True
+        return changed
+
+    def settled(self, paths: list, settle_time: float) -> bool:
+        """
+        Check if files have stopped changing, i.e. their size and modification time have been unchanged for a period
+        :param paths: paths of files to check, files in archives are checked via their archive
+        :param settle_time: seconds the files must be unchanged for
+        :return: True if all files have been unchanged for at least the settle time
+        """
+        now = time.monotonic()
+        settled = True
+        for path in paths:
+            split = split_archive_path(path)
+            if split is not None:
+                path = split[0]
+            try:
+                stat = os.stat(path)
+                state = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                state = None
+            observed = self._observed.get(path)
+            if state is None or observed is None or observed[0] != state:
+                self._observed[path] = (state, now)
+                settled = False
+            elif now - observed[1] < settle_time:
+                settled = False
+        return settled
+
+    def state(self, paths: list) -> tuple:
+        """
+        Get the last observed state of files
+        :param paths: paths of files, files in archives are represented by their archive
+        :return: tuple of the size and modification time of each file, or None if not observed
+        """
+        states = []
+        for path in paths:
+            split = split_archive_path(path)
+            if split is not None:
+                path = split[0]
+            observed = self._observed.get(path)
+            states.append(observed[0] if observed is not None else None)
+        return tuple(states)
+
+    def forget(self, paths: list):
+        """
+        Stop tracking changes to files
+        :param paths: paths of files
+        """
+        for path in paths:
+            split = split_archive_path(path)
+            if split is not None:
+                path = split[0]
+            self._observed.pop(path, None)
+
+    def close(self):
+        """
+        Release the inotify instance
+        """
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
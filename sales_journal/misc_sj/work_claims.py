@@ -0,0 +1,248 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import socket
+import threading
+
+# default seconds a claim on a file set lasts without a heartbeat
+WORK_LEASE_SECONDS = 300
+
+
+class WorkClaims:
+    """
+    Claims on file sets in a postgres work table, so that concurrent workers, on one host or several, ingest each file
+    set once. Workers register the sets they discover and claim them with SELECT ... FOR UPDATE SKIP LOCKED, so
+    claiming never blocks on another worker. A claim is a lease which the claiming worker must renew; if the worker
+    dies the lease expires and the set can be claimed again
+    """
+
+    def __init__(self, table_name: str, tracking_table: str, worker_id: str = None,
+                 lease_seconds: int = WORK_LEASE_SECONDS):
+        """
+        Initialise object
+        :param table_name: name of work table
+        :param tracking_table: name of tracking table, sets recorded in it are never claimed
+        :param worker_id: id of this worker, defaults to <hostname>:<process id>
+        :param lease_seconds: seconds a claim lasts without being renewed
+        """
+        self.table_name = table_name
+        self.tracking_table = tracking_table
+        self.worker_id = worker_id if worker_id else f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+
+    def create_table(self, cursor):
+        """
+        Create the work table if it doesn't exist
+        :param cursor: database cursor
+        """
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {self.table_name} ('
+                       f'fileset TEXT PRIMARY KEY, '
+                       f'worker TEXT, '
+                       f'lease_expires TIMESTAMPTZ, '
+                       f'heartbeat TIMESTAMPTZ, '
+                       f'attempts INTEGER NOT NULL DEFAULT 0, '
+                       f'registered TIMESTAMPTZ NOT NULL DEFAULT now());')
+
+    def register(self, cursor, set_ids: list):
+        """
+        Register discovered file sets, ignoring sets already registered or recorded as uploaded
+        :param cursor: database cursor
+        :param set_ids: ids of sets
+        """
+        cursor.execute(f'INSERT INTO {self.table_name} (fileset) '
+                       f'SELECT s.fileset FROM unnest(%s::text[]) AS s(fileset) '
+                       f'WHERE NOT EXISTS (SELECT 1 FROM {self.tracking_table} k WHERE k.fileset = s.fileset) '
+                       f'ON CONFLICT (fileset) DO NOTHING;', (list(set_ids),))
+
+    def claim(self, cursor, set_ids: list, limit: int) -> list:
+        """
+        Claim file sets which are unclaimed, or whose claim has expired, and which haven't been uploaded
+        :param cursor: database cursor
+        :param set_ids: ids of sets to claim from, in order of preference
+        :param limit: max number of sets to claim
+        :return: ids of claimed sets
+        """
+        set_ids = list(set_ids)
+        cursor.execute(f'UPDATE {self.table_name} SET worker = %s, lease_expires = now() + %s * interval \'1 second\', '
+                       f'heartbeat = now(), attempts = attempts + 1 '
+                       f'WHERE fileset IN ('
+                       f'SELECT w.fileset FROM {self.table_name} w '
+                       f'WHERE w.fileset = ANY(%s::text[]) AND (w.worker IS NULL OR w.lease_expires < now()) '
+                       f'AND NOT EXISTS (SELECT 1 FROM {self.tracking_table} k WHERE k.fileset = w.fileset) '
+                       f'ORDER BY array_position(%s::text[], w.fileset) '
+                       f'LIMIT %s FOR UPDATE SKIP LOCKED) '
+                       f'RETURNING fileset;', (self.worker_id, self.lease_seconds, set_ids, set_ids, limit))
+        claimed = [row[0] for row in cursor.fetchall()]
+        return sorted(claimed, key=set_ids.index)
+
+    def renew(self, cursor, set_ids: list):
+        """
+        Renew the claims on file sets
+        :param cursor: database cursor
+        :param set_ids: ids of sets
+        """
+        cursor.execute(f'UPDATE {self.table_name} SET lease_expires = now() + %s * interval \'1 second\', '
+                       f'heartbeat = now() WHERE worker = %s AND fileset = ANY(%s::text[]);',
+                       (self.lease_seconds, self.worker_id, list(set_ids)))
+
+    def release(self, cursor, set_ids: list):
+        """
+        Return claimed file sets to the pool
+        :param cursor: database cursor
+        :param set_ids: ids of sets
+        """
+        cursor.execute(f'UPDATE {self.table_name} SET worker = NULL, lease_expires = NULL '
+                       f'WHERE worker = %s AND fileset = ANY(%s::text[]);', (self.worker_id, list(set_ids)))
+
+    def complete(self, cursor, set_ids: list):
+        """
+        Remove claimed file sets from the work table, once they are recorded in the tracking table. Should be executed
+        in the same transaction as the tracking table insert
+        :param cursor: database cursor
+        :param set_ids: ids of sets
+        """
+        cursor.execute(f'DELETE FROM {self.table_name} WHERE worker = %s AND fileset = ANY(%s::text[]);',
+                       (self.worker_id, list(set_ids)))
+
+
+class ClaimHeartbeat(threading.Thread):
+    """
+    Thread which renews the claims on file sets until stopped, using its own database connection
+    """
+
+    def __init__(self, claims: WorkClaims, client, set_ids: list):
+        """
+        Initialise object
+        :param claims: work claims
+        :param client: database connection, closed when the heartbeat is stopped
+        :param set_ids: ids of claimed sets
+        """
+        super().__init__(name='ClaimHeartbeat', daemon=True)
+        self.claims = claims
+        self._client = client
+        self._set_ids = list(set_ids)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self):
+        interval = max(1, self.claims.lease_seconds // 3)
+        while not self._stopped.wait(interval):
+            with self._lock:
+                if len(self._set_ids) > 0:
+                    cursor = self._client.cursor()
+                    try:
+                        self.claims.renew(cursor, self._set_ids)
+                        self._client.commit()
+                    except Exception:
+                        # the lease may lapse, in which case another worker may claim the set
+                        rollback = getattr(self._client, 'rollback', None)
+                        if rollback is not None:
+                            rollback()
+                    finally:
+                        cursor.close()
+
+    def discard(self, set_ids: list):
+        """
+        Stop renewing the claims on file sets
+        :param set_ids: ids of sets
+        """
+        with self._lock:
+            self._set_ids = [set_id for set_id in self._set_ids if set_id not in set_ids]
+
+    def stop(self):
+        """
+        Stop the heartbeat, returning any remaining claimed sets to the pool
+        """
+        self._stopped.set()
+        with self._lock:
+            try:
+                if len(self._set_ids) > 0:
+                    cursor = self._client.cursor()
+                    try:
+                        self.claims.release(cursor, self._set_ids)
+                        self._client.commit()
+                    finally:
+                        cursor.close()
+                self._set_ids = []
+            finally:
+                self._client.close_connection()
+
+
+# heartbeats for the claims held by this process
+_heartbeats = []
+_heartbeats_lock = threading.Lock()
+
+
+def get_work_claims(claims_cfg: dict):
+    """
+    Get the work claims
+    :param claims_cfg: work claims configuration;
+                 {'table': work table name, 'tracking_table': tracking table name, 'worker_id': worker id,
+                  'lease_seconds': seconds a claim lasts without a heartbeat}
+    :return: WorkClaims or None if not configured
+    """
+    claims = None
+    if claims_cfg is not None and claims_cfg.get('table'):
+        lease_seconds = WORK_LEASE_SECONDS
+        if claims_cfg.get('lease_seconds') is not None:
+            lease_seconds = int(claims_cfg['lease_seconds'])
+        claims = WorkClaims(claims_cfg['table'], claims_cfg['tracking_table'], worker_id=claims_cfg.get('worker_id'),
+                            lease_seconds=lease_seconds)
+    return claims
+
+
+def start_claim_heartbeat(claims: WorkClaims, client, set_ids: list):
+    """
+    Start renewing the claims on file sets
+    :param claims: work claims
+    :param client: database connection for the heartbeat to use
+    :param set_ids: ids of claimed sets
+    """
+    heartbeat = ClaimHeartbeat(claims, client, set_ids)
+    with _heartbeats_lock:
+        _heartbeats.append(heartbeat)
+    heartbeat.start()
+
+
+def complete_claims(cursor, set_ids: list):
+    """
+    Remove file sets claimed by this process from the work table, and stop renewing their claims
+    :param cursor: database cursor, of the transaction recording the sets in the tracking table
+    :param set_ids: ids of sets
+    """
+    with _heartbeats_lock:
+        heartbeats = list(_heartbeats)
+    for heartbeat in heartbeats:
+        heartbeat.claims.complete(cursor, set_ids)
+        heartbeat.discard(set_ids)
+
+
+def stop_claim_heartbeats():
+    """
+    Stop renewing all the claims held by this process, returning any sets not completed to the pool
+    """
+    with _heartbeats_lock:
+        heartbeats = list(_heartbeats)
+        _heartbeats.clear()
+    for heartbeat in heartbeats:
+        heartbeat.stop()
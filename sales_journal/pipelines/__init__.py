@@ -37,6 +37,7 @@ from .clean_pipelines import (
     execute_clean_currency_data_postgres_pipeline
 )
 from .currency_pipelines import execute_currency_to_postgres_pipeline
+from .watch_pipelines import execute_watch_pipeline
 
 # if somebody does "from sales_journal.pipelines import *", this is what they will
 # be able to access:
@@ -55,4 +56,6 @@ __all__ = [
     'execute_clean_currency_data_postgres_pipeline',
 
     'execute_currency_to_postgres_pipeline',
+
+    'execute_watch_pipeline',
 ]
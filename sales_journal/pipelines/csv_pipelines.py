@@ -31,6 +31,7 @@ from dagster_toolkit.environ import (
     EnvironmentDict,
 )
 from .currency_pipelines import currency_pipeline_environmental_dict
+from sales_journal.misc_sj import ENGINE_C, PARALLEL_READ_MIN_SIZE, HASH_WORKERS, LIST_WORKERS, stop_claim_heartbeats
 from sales_journal.solids import (
     generate_table_fields_str,
     upload_sales_table,
@@ -41,7 +42,9 @@ from sales_journal.solids import (
     load_list_of_csv_files,
     create_csv_file_sets,
     filter_load_file_sets,
+    validate_file_sets,
     read_sj_csv_file_sets,
+    read_join_csv_file_sets,
     merge_promo_csv_file_sets,
     merge_segs_csv_file_sets,
     generate_tracking_table_fields_str,
@@ -49,7 +52,12 @@ from sales_journal.solids import (
     transform_loaded_records,
     currency_transform_sets_df,
     generate_dtypes,
+    generate_read_plan,
     query_sales_data,
+    stream_csv_file_sets,
+    process_file_sets_parallel,
+    load_staged_file_sets,
+    stage_file_sets,
 
     generate_currency_table_fields_str,
     read_currency_codes,
@@ -63,6 +71,7 @@ from sales_journal.solids import (
     transform_ex_rates_per_usd,
 
 )
+from sales_journal.solids.validate_node import PREFLIGHT_SAMPLE_ROWS
 import pprint
 
 
@@ -86,6 +95,7 @@ def csv_to_postgres_pipeline():
     )
     table_desc_by_type = get_table_desc_by_type(table_desc)
     dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
 
     table_type_limits = get_table_desc_type_limits(table_desc)
 
@@ -104,38 +114,267 @@ def csv_to_postgres_pipeline():
         load_list_of_csv_files(), prev_uploaded
     )
 
+    # load any previously transformed sets from the staging cache, leaving the remaining sets to be read
+    sets_list, staged_sets = load_staged_file_sets(filter_load_file_sets(sets), prev_uploaded, uploaded_ids)
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(sets_list, dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
+    # read the sales journal and join the promo, segs & ref info to it
+    sets_list, sets_df = read_join_csv_file_sets(
+        sets_list, dtypes_by_root, read_plan, prev_uploaded, uploaded_ids
+    )
+
+    sets_df = transform_sets_df(sets_df, table_desc, table_desc_by_type, table_type_limits)
+
+    # save the newly transformed sets to the staging cache
+    sets_df = stage_file_sets(sets_list, sets_df, staged_sets, prev_uploaded, uploaded_ids)
+
+    upload_results = upload_sales_table(sets_df, insert_data_columns)
+
+    upload_tracking_table(upload_results, insert_tracking_columns)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+            }
+        )
+    ]
+)
+def csv_to_postgres_merge_pipeline():
+    """
+    Definition of the pipeline to upload the sales journal data to Postgres, reading the sales journal and merging the
+    promo & segs info into it in separate solids
+    """
+    # load and process the postgres table information
+    table_desc = transform_table_desc_df(
+        load_csv()  # TODO should supply dtypes
+    )
+    table_desc_by_type = get_table_desc_by_type(table_desc)
+    dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
+
+    table_type_limits = get_table_desc_type_limits(table_desc)
+
+    # generate column string for creation and insert queries, for the sales_data and tracking_data tables
+    create_data_columns, insert_data_columns = generate_table_fields_str(table_desc)
+    create_tracking_columns, insert_tracking_columns = generate_tracking_table_fields_str()
+
+    # get previously uploaded file sets info
+    prev_uploaded, uploaded_ids = transform_loaded_records(
+        query_table(),
+        query_sales_data()
+    )
+
+    # load the csv files in to sets, so that the csv files that relate to a common export are all together and load them
+    sets = create_csv_file_sets(
+        load_list_of_csv_files(), prev_uploaded
+    )
+
+    # load any previously transformed sets from the staging cache, leaving the remaining sets to be read
+    sets_list, staged_sets = load_staged_file_sets(filter_load_file_sets(sets), prev_uploaded, uploaded_ids)
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(sets_list, dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
     # read the sales journal
     sets_list, sets_df = read_sj_csv_file_sets(
-        filter_load_file_sets(sets), dtypes_by_root, prev_uploaded, uploaded_ids
+        sets_list, dtypes_by_root, read_plan, prev_uploaded, uploaded_ids
     )
 
     # merge the promo info into the sales journal
-    sets_list, sets_df = merge_promo_csv_file_sets(sets_list, sets_df, dtypes_by_root)
+    sets_list, sets_df = merge_promo_csv_file_sets(sets_list, sets_df, dtypes_by_root, read_plan)
 
     # merge the segs info into the sales journal
-    sets_list, sets_df = merge_segs_csv_file_sets(sets_list, sets_df, dtypes_by_root)
+    sets_list, sets_df = merge_segs_csv_file_sets(sets_list, sets_df, dtypes_by_root, read_plan)
 
     sets_df = transform_sets_df(sets_df, table_desc, table_desc_by_type, table_type_limits)
 
+    # save the newly transformed sets to the staging cache
+    sets_df = stage_file_sets(sets_list, sets_df, staged_sets, prev_uploaded, uploaded_ids)
+
     upload_results = upload_sales_table(sets_df, insert_data_columns)
 
     upload_tracking_table(upload_results, insert_tracking_columns)
 
 
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+            }
+        )
+    ]
+)
+def csv_to_postgres_stream_pipeline():
+    """
+    Definition of the pipeline to upload the sales journal data to Postgres, streaming the sales journal in chunks
+    """
+    # load and process the postgres table information
+    table_desc = transform_table_desc_df(
+        load_csv()  # TODO should supply dtypes
+    )
+    table_desc_by_type = get_table_desc_by_type(table_desc)
+    dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
+
+    table_type_limits = get_table_desc_type_limits(table_desc)
+
+    # generate column string for creation and insert queries, for the sales_data and tracking_data tables
+    create_data_columns, insert_data_columns = generate_table_fields_str(table_desc)
+    create_tracking_columns, insert_tracking_columns = generate_tracking_table_fields_str()
+
+    # get previously uploaded file sets info
+    prev_uploaded, uploaded_ids = transform_loaded_records(
+        query_table(),
+        query_sales_data()
+    )
+
+    # load the csv files in to sets, so that the csv files that relate to a common export are all together and load them
+    sets = create_csv_file_sets(
+        load_list_of_csv_files(), prev_uploaded
+    )
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(filter_load_file_sets(sets), dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
+    # read, merge, transform & upload the sales journal a chunk at a time
+    upload_results = stream_csv_file_sets(sets_list, dtypes_by_root, read_plan, prev_uploaded,
+                                          uploaded_ids, table_desc, table_desc_by_type, table_type_limits,
+                                          insert_data_columns)
+
+    upload_tracking_table(upload_results, insert_tracking_columns)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+            }
+        )
+    ]
+)
+def csv_to_postgres_parallel_pipeline():
+    """
+    Definition of the pipeline to upload the sales journal data to Postgres, processing each file set in its own worker
+    process
+    """
+    # load and process the postgres table information
+    table_desc = transform_table_desc_df(
+        load_csv()  # TODO should supply dtypes
+    )
+    table_desc_by_type = get_table_desc_by_type(table_desc)
+    dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
+
+    table_type_limits = get_table_desc_type_limits(table_desc)
+
+    # generate column string for creation and insert queries, for the sales_data and tracking_data tables
+    create_data_columns, insert_data_columns = generate_table_fields_str(table_desc)
+    create_tracking_columns, insert_tracking_columns = generate_tracking_table_fields_str()
+
+    # get previously uploaded file sets info
+    prev_uploaded, uploaded_ids = transform_loaded_records(
+        query_table(),
+        query_sales_data()
+    )
+
+    # load the csv files in to sets, so that the csv files that relate to a common export are all together and load them
+    sets = create_csv_file_sets(
+        load_list_of_csv_files(), prev_uploaded
+    )
+
+    # load any previously transformed sets from the staging cache, leaving the remaining sets to be read
+    sets_list, staged_sets = load_staged_file_sets(filter_load_file_sets(sets), prev_uploaded, uploaded_ids)
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(sets_list, dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
+    # read, merge & transform the sets, a set per worker process
+    sets_list, sets_df = process_file_sets_parallel(sets_list, dtypes_by_root, read_plan, prev_uploaded, uploaded_ids,
+                                                    table_desc, table_desc_by_type, table_type_limits)
+
+    # save the newly transformed sets to the staging cache
+    sets_df = stage_file_sets(sets_list, sets_df, staged_sets, prev_uploaded, uploaded_ids)
+
+    upload_results = upload_sales_table(sets_df, insert_data_columns)
+
+    upload_tracking_table(upload_results, insert_tracking_columns)
+
+
+def get_sj_chunk_size(sj_config: dict) -> int:
+    """
+    Get the number of sales journal rows to stream at a time
+    :param sj_config: app configuration
+    :return: chunk size, or 0 if streaming is disabled
+    """
+    chunk_size = 0
+    if 'sj_chunk_size' in sj_config and sj_config['sj_chunk_size'] is not None:
+        chunk_size = int(sj_config['sj_chunk_size'])
+    return chunk_size
+
+
+def get_sj_set_workers(sj_config: dict) -> int:
+    """
+    Get the number of worker processes to process file sets in
+    :param sj_config: app configuration
+    :return: number of workers, or 1 if file sets are processed one after another
+    """
+    set_workers = 1
+    if 'sj_set_workers' in sj_config and sj_config['sj_set_workers'] is not None:
+        set_workers = max(1, int(sj_config['sj_set_workers']))
+    return set_workers
+
+
+def get_sj_fused_join(sj_config: dict) -> bool:
+    """
+    Get whether each file set is read & joined in a single solid
+    :param sj_config: app configuration
+    :return: True if the sales journal is read & joined in a single solid, or False if it's read and the promo & segs
+             info merged into it in separate solids
+    """
+    fused_join = True
+    if 'sj_fused_join' in sj_config and sj_config['sj_fused_join'] is not None:
+        fused_join = bool(sj_config['sj_fused_join'])
+    return fused_join
+
+
 def execute_csv_to_postgres_pipeline(sj_config: dict, postgres_warehouse: dict):
     """
     Execute the pipeline to upload the sales journal data to Postgres
     :param sj_config: app configuration
     :param postgres_warehouse: postgres server resource
     """
+    parallel = False
+    fused_join = get_sj_fused_join(sj_config)
+    if get_sj_chunk_size(sj_config) > 0:
+        csv_pipeline = csv_to_postgres_stream_pipeline
+        results_solid = 'stream_csv_file_sets'
+    elif get_sj_set_workers(sj_config) > 1:
+        csv_pipeline = csv_to_postgres_parallel_pipeline
+        results_solid = 'upload_sales_table'
+        parallel = True
+    elif fused_join:
+        csv_pipeline = csv_to_postgres_pipeline
+        results_solid = 'upload_sales_table'
+    else:
+        csv_pipeline = csv_to_postgres_merge_pipeline
+        results_solid = 'upload_sales_table'
 
-    # environment dictionary
-    regex_patterns = sj_config['regex_patterns']
-    load_file_sets = None
-    if 'load_file_sets' in sj_config:
-        load_file_sets = sj_config['load_file_sets']
-
-    env_dict = cvs_pipeline_environmental_dict(EnvironmentDict(), sj_config, postgres_warehouse) \
+    env_dict = cvs_pipeline_environmental_dict(EnvironmentDict(), sj_config, postgres_warehouse, parallel=parallel,
+                                               fused_join=fused_join) \
         .build()
 
     pp = pprint.PrettyPrinter(indent=2)
@@ -144,29 +383,42 @@ def execute_csv_to_postgres_pipeline(sj_config: dict, postgres_warehouse: dict):
     run_mode = 'normal'
     if 'csv_pipeline_run_mode' in sj_config.keys():
         run_mode = sj_config['csv_pipeline_run_mode'].lower()
-    if run_mode:
-        loop = True
-        while loop:
-            result = execute_pipeline(csv_to_postgres_pipeline, environment_dict=env_dict)
+    try:
+        if run_mode:
+            loop = True
+            while loop:
+                result = execute_pipeline(csv_pipeline, environment_dict=env_dict)
+                assert result.success
+
+                upload_results = result.result_for_solid(results_solid).output_value()
+                loop = len(upload_results.keys()) > 0
+                result = None
+
+        else:
+            # normal mode
+            result = execute_pipeline(csv_pipeline, environment_dict=env_dict)
             assert result.success
-
-            upload_results = result.result_for_solid('upload_sales_table').output_value()
-            loop = len(upload_results.keys()) > 0
-            result = None
-
-    else:
-        # normal mode
-        result = execute_pipeline(csv_to_postgres_pipeline, environment_dict=env_dict)
-        assert result.success
+    finally:
+        # return any sets claimed by a failed run to the pool
+        stop_claim_heartbeats()
 
 
 def cvs_pipeline_environmental_dict(env_dict: EnvironmentDict, sj_config: dict,
-                                    postgres_warehouse: dict) -> EnvironmentDict:
+                                    postgres_warehouse: dict, staged: bool = False,
+                                    staging: bool = True, warm: bool = False,
+                                    parallel: bool = False, fused_join: bool = True) -> EnvironmentDict:
     """
     Execute the pipeline to upload the sales journal data to Postgres
     :param env_dict:
     :param sj_config: app configuration
     :param postgres_warehouse: postgres server resource
+    :param staged: force the environment for the staged read, merge, transform & upload solids
+    :param staging: include the environment for the staging cache solids, if using the staged solids
+    :param warm: use the environment for the solid which keeps the uploaded primary keys between runs
+    :param parallel: use the environment for the solid which processes each file set in a worker process, instead of
+                     the staged read, merge & transform solids
+    :param fused_join: use the environment for the solid which reads & joins each file set in a single pass, instead
+                       of the separate read & merge solids
     """
 
     # environment dictionary
@@ -176,6 +428,32 @@ def cvs_pipeline_environmental_dict(env_dict: EnvironmentDict, sj_config: dict,
         load_file_sets = sj_config['load_file_sets']
     if 'exclude_file_sets' in sj_config:
         exclude_file_sets = sj_config['exclude_file_sets']
+    file_manifest = ''
+    if 'file_manifest' in sj_config and sj_config['file_manifest'] is not None:
+        file_manifest = sj_config['file_manifest']
+    staging_cache = None
+    if 'staging_cache' in sj_config:
+        staging_cache = sj_config['staging_cache']
+    # previously uploaded entries are removed by stage_file_sets if there is a staging cache, so it holds complete sets
+    filter_uploaded = not (staging and staging_cache is not None and bool(staging_cache.get('cache_dir')))
+    work_claims = None
+    if 'work_claims' in sj_config and sj_config['work_claims'] is not None and sj_config['work_claims'].get('table'):
+        work_claims = dict(sj_config['work_claims'], tracking_table=sj_config['tracking_data_table'])
+    date_window = None
+    if 'data_date_window' in sj_config and sj_config['data_date_window'] is not None:
+        date_window = sj_config['data_date_window']
+    list_workers = LIST_WORKERS
+    if 'data_list_workers' in sj_config and sj_config['data_list_workers'] is not None:
+        list_workers = int(sj_config['data_list_workers'])
+    schedule = None
+    if 'file_set_schedule' in sj_config and sj_config['file_set_schedule'] is not None:
+        schedule = sj_config['file_set_schedule']
+    memory_governor = None
+    if 'memory_governor' in sj_config and sj_config['memory_governor'] is not None:
+        memory_governor = sj_config['memory_governor']
+    hash_workers = HASH_WORKERS
+    if 'sj_hash_workers' in sj_config and sj_config['sj_hash_workers'] is not None:
+        hash_workers = int(sj_config['sj_hash_workers'])
 
     env_dict.add_solid_input('load_csv', 'csv_path', sj_config['sales_data_desc']) \
         .add_solid_input('load_csv', 'kwargs', {}, is_kwargs=True) \
@@ -183,24 +461,104 @@ def cvs_pipeline_environmental_dict(env_dict: EnvironmentDict, sj_config: dict,
         .add_solid('generate_table_fields_str') \
         .add_solid_input('generate_tracking_table_fields_str',
                          'tracking_data_columns', sj_config['tracking_data_columns']) \
-        .add_solid_input('transform_loaded_records', 'tracking_data_columns', sj_config['tracking_data_columns']) \
-        .add_solid_input('transform_loaded_records', 'sj_pk_range', sj_config['sj_pk_range']) \
         .add_solid_input('query_table', 'sql', sj_config['tracking_table_query']) \
-        .add_solid_input('query_sales_data', 'sql', sj_config['sales_id_query']) \
         .add_solid_input('load_list_of_csv_files', 'db_data_path', sj_config['db_data_path']) \
         .add_solid_input('load_list_of_csv_files', 'date_in_name_pattern', sj_config['date_in_name_pattern']) \
         .add_solid_input('load_list_of_csv_files', 'date_in_name_format', sj_config['date_in_name_format']) \
+        .add_solid_input('load_list_of_csv_files', 'file_manifest', file_manifest) \
+        .add_solid_input('load_list_of_csv_files', 'date_window', date_window) \
+        .add_solid_input('load_list_of_csv_files', 'list_workers', list_workers) \
         .add_solid_input('create_csv_file_sets', 'regex_patterns', regex_patterns) \
+        .add_solid_input('create_csv_file_sets', 'hash_workers', hash_workers) \
         .add_solid_input('filter_load_file_sets', 'load_file_sets', load_file_sets) \
         .add_solid_input('filter_load_file_sets', 'max_file_sets_per_run', sj_config['max_file_sets_per_run']) \
-        .add_solid_input('read_sj_csv_file_sets', 'regex_patterns', regex_patterns) \
-        .add_solid_input('merge_promo_csv_file_sets', 'regex_patterns', regex_patterns) \
-        .add_solid_input('merge_segs_csv_file_sets', 'regex_patterns', regex_patterns) \
-        .add_solid('transform_sets_df') \
-        .add_solid_input('upload_sales_table', 'table_name', sj_config['sales_data_table']) \
+        .add_solid_input('filter_load_file_sets', 'work_claims', work_claims) \
+        .add_solid_input('filter_load_file_sets', 'memory_governor', memory_governor) \
+        .add_solid_input('filter_load_file_sets', 'schedule', schedule) \
         .add_solid_input('upload_tracking_table', 'table_name', sj_config['tracking_data_table']) \
+        .add_solid_input('upload_tracking_table', 'work_claims', work_claims) \
         .add_resource('postgres_warehouse', postgres_warehouse)
 
+    if warm:
+        env_dict.add_solid_input('transform_warm_loaded_records', 'tracking_data_columns',
+                                 sj_config['tracking_data_columns']) \
+            .add_solid_input('transform_warm_loaded_records', 'sj_pk_range', sj_config['sj_pk_range']) \
+            .add_solid_input('transform_warm_loaded_records', 'sql', sj_config['sales_id_query'])
+    else:
+        env_dict.add_solid_input('transform_loaded_records', 'tracking_data_columns',
+                                 sj_config['tracking_data_columns']) \
+            .add_solid_input('transform_loaded_records', 'sj_pk_range', sj_config['sj_pk_range']) \
+            .add_solid_input('query_sales_data', 'sql', sj_config['sales_id_query'])
+
+    csv_engine = ENGINE_C
+    if 'csv_engine' in sj_config and sj_config['csv_engine'] is not None:
+        csv_engine = sj_config['csv_engine']
+
+    preflight_rows = PREFLIGHT_SAMPLE_ROWS
+    if 'sj_preflight_rows' in sj_config and sj_config['sj_preflight_rows'] is not None:
+        preflight_rows = int(sj_config['sj_preflight_rows'])
+    env_dict.add_solid_input('validate_file_sets', 'regex_patterns', regex_patterns) \
+        .add_solid_input('validate_file_sets', 'csv_engine', csv_engine) \
+        .add_solid_input('validate_file_sets', 'sample_rows', preflight_rows)
+
+    chunk_size = get_sj_chunk_size(sj_config)
+    if chunk_size > 0 and not staged:
+        stream_child_files = False
+        if 'sj_stream_child_files' in sj_config and sj_config['sj_stream_child_files'] is not None:
+            stream_child_files = bool(sj_config['sj_stream_child_files'])
+        external_sort = None
+        if 'external_sort' in sj_config and sj_config['external_sort'] is not None:
+            external_sort = sj_config['external_sort']
+        env_dict.add_solid_input('stream_csv_file_sets', 'regex_patterns', regex_patterns) \
+            .add_solid_input('stream_csv_file_sets', 'chunk_size', chunk_size) \
+            .add_solid_input('stream_csv_file_sets', 'csv_engine', csv_engine) \
+            .add_solid_input('stream_csv_file_sets', 'table_name', sj_config['sales_data_table']) \
+            .add_solid_input('stream_csv_file_sets', 'memory_governor', memory_governor) \
+            .add_solid_input('stream_csv_file_sets', 'stream_child_files', stream_child_files) \
+            .add_solid_input('stream_csv_file_sets', 'external_sort', external_sort)
+    else:
+        read_workers = 1
+        if 'sj_read_workers' in sj_config and sj_config['sj_read_workers'] is not None:
+            read_workers = int(sj_config['sj_read_workers'])
+        parallel_read_min_size = PARALLEL_READ_MIN_SIZE
+        if 'sj_parallel_read_min_size' in sj_config and sj_config['sj_parallel_read_min_size'] is not None:
+            parallel_read_min_size = int(sj_config['sj_parallel_read_min_size'])
+
+        if parallel:
+            env_dict.add_solid_input('process_file_sets_parallel', 'regex_patterns', regex_patterns) \
+                .add_solid_input('process_file_sets_parallel', 'csv_engine', csv_engine) \
+                .add_solid_input('process_file_sets_parallel', 'set_workers', get_sj_set_workers(sj_config)) \
+                .add_solid_input('process_file_sets_parallel', 'read_workers', read_workers) \
+                .add_solid_input('process_file_sets_parallel', 'parallel_read_min_size', parallel_read_min_size) \
+                .add_solid_input('process_file_sets_parallel', 'filter_uploaded', filter_uploaded)
+        elif fused_join:
+            env_dict.add_solid_input('read_join_csv_file_sets', 'regex_patterns', regex_patterns) \
+                .add_solid_input('read_join_csv_file_sets', 'csv_engine', csv_engine) \
+                .add_solid_input('read_join_csv_file_sets', 'read_workers', read_workers) \
+                .add_solid_input('read_join_csv_file_sets', 'parallel_read_min_size', parallel_read_min_size) \
+                .add_solid_input('read_join_csv_file_sets', 'memory_governor', memory_governor) \
+                .add_solid_input('read_join_csv_file_sets', 'filter_uploaded', filter_uploaded) \
+                .add_solid('transform_sets_df')
+        else:
+            env_dict.add_solid_input('read_sj_csv_file_sets', 'regex_patterns', regex_patterns) \
+                .add_solid_input('read_sj_csv_file_sets', 'csv_engine', csv_engine) \
+                .add_solid_input('read_sj_csv_file_sets', 'read_workers', read_workers) \
+                .add_solid_input('read_sj_csv_file_sets', 'parallel_read_min_size', parallel_read_min_size) \
+                .add_solid_input('read_sj_csv_file_sets', 'memory_governor', memory_governor) \
+                .add_solid_input('read_sj_csv_file_sets', 'filter_uploaded', filter_uploaded) \
+                .add_solid_input('merge_promo_csv_file_sets', 'regex_patterns', regex_patterns) \
+                .add_solid_input('merge_promo_csv_file_sets', 'csv_engine', csv_engine) \
+                .add_solid_input('merge_segs_csv_file_sets', 'regex_patterns', regex_patterns) \
+                .add_solid_input('merge_segs_csv_file_sets', 'csv_engine', csv_engine) \
+                .add_solid('transform_sets_df')
+        env_dict.add_solid_input('upload_sales_table', 'table_name', sj_config['sales_data_table'])
+        if staging:
+            env_dict.add_solid_input('load_staged_file_sets', 'staging_cache', staging_cache) \
+                .add_solid_input('load_staged_file_sets', 'sales_data_desc', sj_config['sales_data_desc']) \
+                .add_solid_input('load_staged_file_sets', 'regex_patterns', regex_patterns) \
+                .add_solid_input('stage_file_sets', 'staging_cache', staging_cache) \
+                .add_solid_input('stage_file_sets', 'sales_data_desc', sj_config['sales_data_desc'])
+
     return env_dict
 
 
@@ -224,6 +582,7 @@ def csv_currency_to_postgres_pipeline():
     )
     table_desc_by_type = get_table_desc_by_type(table_desc)
     dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
 
     table_type_limits = get_table_desc_type_limits(table_desc)
 
@@ -264,16 +623,14 @@ def csv_currency_to_postgres_pipeline():
         load_list_of_csv_files(), prev_uploaded
     )
 
-    # read the sales journal
-    sets_list, sets_df = read_sj_csv_file_sets(
-        filter_load_file_sets(sets), dtypes_by_root, prev_uploaded, uploaded_ids
-    )
-
-    # merge the promo info into the sales journal
-    sets_list, sets_df = merge_promo_csv_file_sets(sets_list, sets_df, dtypes_by_root)
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(filter_load_file_sets(sets), dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
 
-    # merge the segs info into the sales journal
-    sets_list, sets_df = merge_segs_csv_file_sets(sets_list, sets_df, dtypes_by_root)
+    # read the sales journal and join the promo, segs & ref info to it
+    sets_list, sets_df = read_join_csv_file_sets(
+        sets_list, dtypes_by_root, read_plan, prev_uploaded, uploaded_ids
+    )
 
     sets_df = transform_sets_df(sets_df, table_desc, table_desc_by_type, table_type_limits)
 
@@ -301,7 +658,8 @@ def execute_csv_currency_to_postgres_pipeline(sj_config: dict, postgres_warehous
     if 'load_file_sets' in sj_config:
         load_file_sets = sj_config['load_file_sets']
 
-    env_dict = cvs_pipeline_environmental_dict(EnvironmentDict(), sj_config, postgres_warehouse)
+    env_dict = cvs_pipeline_environmental_dict(EnvironmentDict(), sj_config, postgres_warehouse, staged=True,
+                                               staging=False)
     env_dict = currency_pipeline_environmental_dict(env_dict, sj_config) \
         .add_solid_input('currency_transform_sets_df', 'regex_patterns', regex_patterns) \
         .add_solid_input('currency_transform_sets_df', 'currency_cfg', currency_cfg) \
@@ -313,17 +671,21 @@ def execute_csv_currency_to_postgres_pipeline(sj_config: dict, postgres_warehous
     run_mode = 'normal'
     if 'csv_pipeline_run_mode' in sj_config.keys():
         run_mode = sj_config['csv_pipeline_run_mode'].lower()
-    if run_mode:
-        loop = True
-        while loop:
+    try:
+        if run_mode:
+            loop = True
+            while loop:
+                result = execute_pipeline(csv_currency_to_postgres_pipeline, environment_dict=env_dict)
+                assert result.success
+
+                upload_results = result.result_for_solid('upload_sales_table').output_value()
+                loop = len(upload_results.keys()) > 0
+                result = None
+
+        else:
+            # normal mode
             result = execute_pipeline(csv_currency_to_postgres_pipeline, environment_dict=env_dict)
             assert result.success
-
-            upload_results = result.result_for_solid('upload_sales_table').output_value()
-            loop = len(upload_results.keys()) > 0
-            result = None
-
-    else:
-        # normal mode
-        result = execute_pipeline(csv_currency_to_postgres_pipeline, environment_dict=env_dict)
-        assert result.success
+    finally:
+        # return any sets claimed by a failed run to the pool
+        stop_claim_heartbeats()
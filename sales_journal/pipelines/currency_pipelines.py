@@ -115,6 +115,9 @@ def execute_currency_to_postgres_pipeline(sj_config: Dict, postgres_warehouse: D
 
 def currency_pipeline_environmental_dict(env_dict: EnvironmentDict, sj_config: Dict) -> EnvironmentDict:
     currency_config = sj_config['currency']
+    if 'csv_engine' in sj_config and 'csv_engine' not in currency_config:
+        # currency files are parsed with the same engine as the sales journal files
+        currency_config = dict(currency_config, csv_engine=sj_config['csv_engine'])
 
     # environment dictionary
     env_dict.add_solid_input('read_currency_codes', 'cur_config', currency_config) \
@@ -0,0 +1,322 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import pprint
+
+from dagster import execute_pipeline, pipeline, ModeDefinition
+from dagster_toolkit.postgres import (
+    postgres_warehouse_resource,
+    query_table,
+)
+from dagster_toolkit.files import (
+    load_csv,
+)
+from dagster_toolkit.environ import (
+    EnvironmentDict,
+)
+from .csv_pipelines import cvs_pipeline_environmental_dict, get_sj_chunk_size
+from sales_journal.misc_sj import (
+    DirectoryWatcher,
+    FileManifest,
+    LIST_WORKERS,
+    get_data_roots,
+    parse_date_window,
+    stop_claim_heartbeats,
+)
+from sales_journal.solids import (
+    generate_table_fields_str,
+    upload_sales_table,
+    get_table_desc_by_type,
+    get_table_desc_type_limits,
+    transform_sets_df,
+    transform_table_desc_df,
+    load_list_of_csv_files,
+    create_csv_file_sets,
+    filter_load_file_sets,
+    validate_file_sets,
+    read_join_csv_file_sets,
+    generate_tracking_table_fields_str,
+    upload_tracking_table,
+    transform_warm_loaded_records,
+    clear_warm_uploaded_ids,
+    generate_dtypes,
+    generate_read_plan,
+    stream_csv_file_sets,
+    load_staged_file_sets,
+    stage_file_sets,
+)
+from sales_journal.solids.read_cvs_node import tally_file_sets
+
+
+# default seconds to wait between checks of the data directory
+WATCH_POLL_INTERVAL = 10
+# default seconds the files in a set must be unchanged for before the set is ingested
+WATCH_SETTLE_TIME = 30
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+            }
+        )
+    ]
+)
+def csv_to_postgres_watch_pipeline():
+    """
+    Definition of the pipeline to upload the sales journal data to Postgres, reusing the sales_data primary keys from
+    previous runs in the same process
+    """
+    # load and process the postgres table information
+    table_desc = transform_table_desc_df(
+        load_csv()  # TODO should supply dtypes
+    )
+    table_desc_by_type = get_table_desc_by_type(table_desc)
+    dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
+
+    table_type_limits = get_table_desc_type_limits(table_desc)
+
+    # generate column string for creation and insert queries, for the sales_data and tracking_data tables
+    create_data_columns, insert_data_columns = generate_table_fields_str(table_desc)
+    create_tracking_columns, insert_tracking_columns = generate_tracking_table_fields_str()
+
+    # get previously uploaded file sets info
+    prev_uploaded, uploaded_ids = transform_warm_loaded_records(
+        query_table()
+    )
+
+    # load the csv files in to sets, so that the csv files that relate to a common export are all together and load them
+    sets = create_csv_file_sets(
+        load_list_of_csv_files(), prev_uploaded
+    )
+
+    # load any previously transformed sets from the staging cache, leaving the remaining sets to be read
+    sets_list, staged_sets = load_staged_file_sets(filter_load_file_sets(sets), prev_uploaded, uploaded_ids)
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(sets_list, dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
+    # read the sales journal and join the promo, segs & ref info to it
+    sets_list, sets_df = read_join_csv_file_sets(
+        sets_list, dtypes_by_root, read_plan, prev_uploaded, uploaded_ids
+    )
+
+    sets_df = transform_sets_df(sets_df, table_desc, table_desc_by_type, table_type_limits)
+
+    # save the newly transformed sets to the staging cache
+    sets_df = stage_file_sets(sets_list, sets_df, staged_sets, prev_uploaded, uploaded_ids)
+
+    upload_results = upload_sales_table(sets_df, insert_data_columns)
+
+    upload_tracking_table(upload_results, insert_tracking_columns)
+
+
+@pipeline(
+    mode_defs=[
+        ModeDefinition(
+            # attach resources to pipeline
+            resource_defs={
+                'postgres_warehouse': postgres_warehouse_resource,
+            }
+        )
+    ]
+)
+def csv_to_postgres_stream_watch_pipeline():
+    """
+    Definition of the pipeline to upload the sales journal data to Postgres, streaming the sales journal in chunks and
+    reusing the sales_data primary keys from previous runs in the same process
+    """
+    # load and process the postgres table information
+    table_desc = transform_table_desc_df(
+        load_csv()  # TODO should supply dtypes
+    )
+    table_desc_by_type = get_table_desc_by_type(table_desc)
+    dtypes_by_root = generate_dtypes(table_desc, table_desc_by_type)
+    read_plan = generate_read_plan(table_desc)
+
+    table_type_limits = get_table_desc_type_limits(table_desc)
+
+    # generate column string for creation and insert queries, for the sales_data and tracking_data tables
+    create_data_columns, insert_data_columns = generate_table_fields_str(table_desc)
+    create_tracking_columns, insert_tracking_columns = generate_tracking_table_fields_str()
+
+    # get previously uploaded file sets info
+    prev_uploaded, uploaded_ids = transform_warm_loaded_records(
+        query_table()
+    )
+
+    # load the csv files in to sets, so that the csv files that relate to a common export are all together and load them
+    sets = create_csv_file_sets(
+        load_list_of_csv_files(), prev_uploaded
+    )
+
+    # reject sets whose files don't match the table description, before reading them
+    sets_list = validate_file_sets(filter_load_file_sets(sets), dtypes_by_root, read_plan, table_desc_by_type,
+                                   table_type_limits)
+
+    # read, merge, transform & upload the sales journal a chunk at a time
+    upload_results = stream_csv_file_sets(sets_list, dtypes_by_root, read_plan, prev_uploaded,
+                                          uploaded_ids, table_desc, table_desc_by_type, table_type_limits,
+                                          insert_data_columns)
+
+    upload_tracking_table(upload_results, insert_tracking_columns)
+
+
+def get_ready_file_sets(manifest: FileManifest, watcher: DirectoryWatcher, regex_patterns_dict: dict,
+                        settle_time: float, ignore: set) -> tuple:
+    """
+    Get the complete file sets in the data directory whose files have stopped changing
+    :param manifest: manifest of the data directory
+    :param watcher: data directory watcher
+    :param regex_patterns_dict: dict of regex pattern representing filenames and file sets
+    :param settle_time: seconds the files in a set must be unchanged for
+    :param ignore: set ids to ignore
+    :return: tuple of dict of the paths of the files in sets ready to be ingested with set id as the key, and number
+             of sets waiting for their files to settle
+    """
+    required_elements = regex_patterns_dict['set_required_elements']
+
+    manifest.refresh(on_error=print, force=True)
+    df, counts = tally_file_sets(manifest.files(), regex_patterns_dict)
+    if df is None:
+        return {}, 0
+
+    # sets with duplicate copies of files are included, the copy to use is picked when the set is uploaded
+    complete = (counts[required_elements] >= 1).all(axis=1)
+    candidates = [set_id for set_id in counts.index[complete] if set_id not in ignore]
+
+    ready = {}
+    settling = 0
+    paths_by_set = df.groupby('set', sort=False)['path']
+    for set_id in candidates:
+        paths = paths_by_set.get_group(set_id).tolist()
+        if watcher.settled(paths, settle_time):
+            ready[set_id] = paths
+        else:
+            settling += 1
+    return ready, settling
+
+
+def execute_watch_pipeline(sj_config: dict, postgres_warehouse: dict):
+    """
+    Watch the data directory and upload each file set to Postgres as soon as all its files have landed and stopped
+    changing. Runs until interrupted
+    :param sj_config: app configuration
+    :param postgres_warehouse: postgres server resource
+    """
+    regex_patterns_dict = sj_config['regex_patterns']
+    db_data_path = sj_config['db_data_path']
+
+    poll_interval = WATCH_POLL_INTERVAL
+    if 'watch_poll_interval' in sj_config and sj_config['watch_poll_interval'] is not None:
+        poll_interval = float(sj_config['watch_poll_interval'])
+    settle_time = WATCH_SETTLE_TIME
+    if 'watch_settle_time' in sj_config and sj_config['watch_settle_time'] is not None:
+        settle_time = float(sj_config['watch_settle_time'])
+    if get_sj_chunk_size(sj_config) > 0:
+        watch_pipeline = csv_to_postgres_stream_watch_pipeline
+        results_solid = 'stream_csv_file_sets'
+    else:
+        watch_pipeline = csv_to_postgres_watch_pipeline
+        results_solid = 'upload_sales_table'
+
+    date_window = None
+    if 'data_date_window' in sj_config and sj_config['data_date_window'] is not None:
+        date_window = parse_date_window(sj_config['data_date_window'], sj_config['date_in_name_format'])
+    list_workers = LIST_WORKERS
+    if 'data_list_workers' in sj_config and sj_config['data_list_workers'] is not None:
+        list_workers = int(sj_config['data_list_workers'])
+
+    # in memory manifest, so only new or changed files are examined each time the directories are checked
+    manifest = FileManifest(None, db_data_path, sj_config['date_in_name_pattern'],
+                            sj_config['date_in_name_format'], date_window=date_window, list_workers=list_workers)
+    watch_dirs = [base for base, _ in get_data_roots(db_data_path)]
+    watcher = DirectoryWatcher(watch_dirs, poll_interval=poll_interval)
+    print(f"Watching {', '.join([repr(os.path.abspath(base)) for base in watch_dirs])} for file sets "
+          f"({'inotify' if watcher.using_inotify else f'polling every {poll_interval}s'}), Ctrl+C to stop")
+
+    uploaded_sets = set()   # sets uploaded previously or by this process
+    failed_sets = {}        # observed file states of sets which failed to upload, by set id
+    pp = pprint.PrettyPrinter(indent=2)
+    try:
+        while True:
+            ready, settling = get_ready_file_sets(manifest, watcher, regex_patterns_dict, settle_time,
+                                                  uploaded_sets)
+            for set_id, paths in ready.items():
+                if set_id in uploaded_sets:
+                    # the previously uploaded sets are only known after the first run, which may be in this batch
+                    watcher.forget(paths)
+                    continue
+                set_state = watcher.state(paths)
+                if failed_sets.get(set_id) == set_state:
+                    continue    # already failed, so wait for its files to change before retrying
+
+                print(f"Uploading data set '{set_id}'")
+                env_dict = cvs_pipeline_environmental_dict(
+                    EnvironmentDict(), dict(sj_config, load_file_sets=[set_id], max_file_sets_per_run=1),
+                    postgres_warehouse, warm=True).build()
+                if len(uploaded_sets) == 0:
+                    pp.pprint(env_dict)
+
+                succeeded = False
+                try:
+                    result = execute_pipeline(watch_pipeline, environment_dict=env_dict)
+                    if result.success:
+                        prev_uploaded = result.result_for_solid('transform_warm_loaded_records')\
+                            .output_value('prev_uploaded')
+                        if prev_uploaded is not None and len(prev_uploaded) > 0:
+                            uploaded_sets.update(prev_uploaded['fileset'])
+
+                        upload_results = result.result_for_solid(results_solid).output_value()
+                        if set_id in upload_results.keys():
+                            succeeded = upload_results[set_id]['uploaded']
+                        else:
+                            # not uploaded if previously loaded, otherwise discarded, e.g. copies of a file differ
+                            succeeded = set_id in uploaded_sets
+                except Exception as e:
+                    print(f"Error uploading data set '{set_id}': {e}")
+                finally:
+                    # return the set to the pool if claimed by a failed run
+                    stop_claim_heartbeats()
+
+                if succeeded:
+                    uploaded_sets.add(set_id)
+                    failed_sets.pop(set_id, None)
+                    watcher.forget(paths)
+                else:
+                    # primary keys may have been recorded as uploaded, so requery them on the next run
+                    clear_warm_uploaded_ids()
+                    failed_sets[set_id] = set_state
+                    print(f"Failed to upload data set '{set_id}', will retry when its files change")
+
+            # wait for a change, or for the files in pending sets to settle
+            watcher.wait(settle_time if settling > 0 else None)
+
+    except KeyboardInterrupt:
+        print('Stopped watching')
+    finally:
+        watcher.close()
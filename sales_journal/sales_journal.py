@@ -40,7 +40,9 @@ from sales_journal.pipelines import (
     execute_clean_sales_data_postgres_pipeline,
     execute_clean_currency_data_postgres_pipeline,
     execute_currency_to_postgres_pipeline,
+    execute_watch_pipeline,
 )
+from sales_journal.misc_sj import get_staging_cache
 
 """
 """
@@ -164,6 +166,7 @@ def get_config_options():
         'w': ConfigOpt('w:', 'whse_cfg=', 'Specify path to postgres data warehouse table'),
         'm': ConfigOpt('m:', 'mode=', 'File set processing mode; normal (run once) or loop (run until all file sets '
                                       'processed'),
+        'x': ConfigOpt('x', 'purge_cache', 'Purge the file set staging cache'),
     }
     return __OPTS;
 
@@ -239,6 +242,7 @@ def get_app_config(name, args):
         'd': None,
         'm': None,
         'w': None,
+        'x': None,
     }
     for opt, arg in opts:
         if opt == get_short_opt('h') or opt == get_long_opt('h'):
@@ -246,6 +250,8 @@ def get_app_config(name, args):
             sys.exit()
         elif opt == get_short_opt('c') or opt == get_long_opt('c'):
             app_cfg_path = arg
+        elif opt == get_short_opt('x') or opt == get_long_opt('x'):
+            cmd_line_args['x'] = True
         else:
             for key in ['o', 'p', 'n', 's', 'd', 'm']:
                 if opt == get_short_opt(key) or opt == get_long_opt(key):
@@ -300,6 +306,8 @@ def get_app_config(name, args):
     #     sj_config['csv_pipeline_run_mode'] = cmd_line_args['m']
     if cmd_line_args['w'] is not None:
         sj_config['sales_data_desc'] = cmd_line_args['w']
+    if cmd_line_args['x'] is not None:
+        sj_config['purge_staging_cache'] = True
 
     return app_cfg, plotly_cfg
 
@@ -360,6 +368,14 @@ def main():
 
     sj_config = app_cfg['sales_journal']
 
+    if sj_config.get('purge_staging_cache', False):
+        cache = get_staging_cache(sj_config.get('staging_cache'))
+        if cache is None:
+            print('Staging cache not configured')
+        else:
+            print(f'Removed {cache.purge()} file set(s) from staging cache {cache.cache_dir}')
+        return
+
     # resource entries for environment_dict
     postgres_warehouse = {'config': {'postgres_cfg': app_cfg['postgresdb']}}
 
@@ -423,6 +439,8 @@ def main():
         call_execute_create_currency_data_postgres_pipeline()
     elif pipeline == 'clean_currency_data_postgres_pipeline':
         call_execute_clean_currency_data_postgres_pipeline()
+    elif pipeline == 'watch':
+        execute_watch_pipeline(sj_config, postgres_warehouse)
 
 
 if __name__ == '__main__':
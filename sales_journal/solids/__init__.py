@@ -43,15 +43,32 @@ from .read_cvs_node import (
     load_list_of_csv_files,
     create_csv_file_sets,
     generate_dtypes,
+    generate_read_plan,
     filter_load_file_sets,
     read_sj_csv_file_sets,
+    read_join_csv_file_sets,
     merge_promo_csv_file_sets,
     merge_segs_csv_file_sets,
 )
+from .validate_node import (
+    validate_file_sets,
+)
+from .stream_node import (
+    stream_csv_file_sets,
+)
+from .parallel_node import (
+    process_file_sets_parallel,
+)
+from .staging_node import (
+    load_staged_file_sets,
+    stage_file_sets,
+)
 from .tracking_table import (
     generate_tracking_table_fields_str,
     upload_tracking_table,
     transform_loaded_records,
+    transform_warm_loaded_records,
+    clear_warm_uploaded_ids,
 )
 from .read_currency_node import (
     read_currency_codes,
@@ -92,14 +109,24 @@ __all__ = [
     'load_list_of_csv_files',
     'create_csv_file_sets',
     'generate_dtypes',
+    'generate_read_plan',
     'filter_load_file_sets',
     'read_sj_csv_file_sets',
+    'read_join_csv_file_sets',
     'merge_promo_csv_file_sets',
     'merge_segs_csv_file_sets',
 
+    'validate_file_sets',
+    'stream_csv_file_sets',
+    'process_file_sets_parallel',
+    'load_staged_file_sets',
+    'stage_file_sets',
+
     'generate_tracking_table_fields_str',
     'upload_tracking_table',
     'transform_loaded_records',
+    'transform_warm_loaded_records',
+    'clear_warm_uploaded_ids',
 
     'read_currency_codes',
     'read_sdr_per_currency',
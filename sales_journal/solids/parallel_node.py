@@ -0,0 +1,226 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from dagster_pandas import DataFrame
+from dagster import (
+    solid,
+    String,
+    List,
+    Dict,
+    Int,
+    OutputDefinition,
+    Output,
+    Optional,
+    Bool,
+)
+
+from .read_cvs_node import (
+    get_root_dtypes,
+    get_root_read_plan,
+    filter_sj_df,
+    read_sj_data_file,
+    read_child_file,
+    get_child_joins,
+    uploaded_id_flags,
+    mark_uploaded_ids,
+)
+from .process_node import transform_set_df
+from sales_journal.misc_sj import DataSet
+
+
+# snapshot of the uploaded sales_data primary keys in a worker process, taken when the worker starts
+_worker_uploaded_ids = None
+
+
+class BufferedLog:
+    """
+    Log which records messages in a worker process, so they can be replayed on the execution context log
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def debug(self, msg):
+        self.messages.append(('debug', msg))
+
+    def info(self, msg):
+        self.messages.append(('info', msg))
+
+    def warn(self, msg):
+        self.messages.append(('warn', msg))
+
+    def error(self, msg):
+        self.messages.append(('error', msg))
+
+
+def init_set_worker(uploaded_ids: dict):
+    """
+    Initialise a file set worker process
+    :param uploaded_ids: sales_data primary keys
+    """
+    global _worker_uploaded_ids
+    _worker_uploaded_ids = uploaded_ids
+
+
+def process_file_set(set_id: str, entries: list, dtypes_by_root: dict, read_plan: dict, prev_uploaded: DataFrame,
+                     table_desc: DataFrame, table_desc_by_type: dict, table_type_limits: dict,
+                     regex_patterns_dict: dict, csv_engine: str, read_workers: int,
+                     parallel_read_min_size: int) -> tuple:
+    """
+    Read, merge and transform the files in an import set. Runs in a worker process; previously uploaded entries are
+    removed using the worker's snapshot of the uploaded sales_data primary keys
+    :param set_id: id of set
+    :param entries: list of dictionaries of the files in the set
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :param prev_uploaded: details of previously loaded data sets
+    :param table_desc: pandas DataFrame containing details of the database table
+    :param table_desc_by_type: dict of pandas DataFrames of data types in database table with data type as the key
+    :param table_type_limits: dict of type limits with field name as the key
+    :param regex_patterns_dict: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
+    :param read_workers: max number of processes to use to read an uncompressed sales journal file
+    :param parallel_read_min_size: minimum size in bytes of a sales journal file to read in parallel
+    :return: tuple of transformed DataFrame, or None if the set couldn't be loaded, and list of log messages
+    """
+    context = SimpleNamespace(log=BufferedLog())
+    regex_sj = re.compile(regex_patterns_dict['set_sj_pattern'])
+    regex_file_set = re.compile(regex_patterns_dict['set_common_pattern'])
+
+    sj_entry = next((entry for entry in entries if regex_sj.search(entry['name'])), None)
+    df = None
+    if sj_entry is None:
+        context.log.warn(f"No sales journal file in data set '{set_id}'")
+    elif not regex_file_set.search(sj_entry['name']):
+        context.log.warn(f'No type match for {sj_entry["path"]}')
+    else:
+        entry = sj_entry
+        try:
+            context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
+            df = read_sj_data_file(entry['path'], get_root_dtypes(regex_sj, dtypes_by_root),
+                                   get_root_read_plan(regex_sj, read_plan), csv_engine, read_workers,
+                                   parallel_read_min_size)
+            df = filter_sj_df(context, df, prev_uploaded, _worker_uploaded_ids)
+
+            # child files, in join order
+            for regex_item, prepare, merge in get_child_joins(regex_patterns_dict, read_plan):
+                entry = next((entry for entry in entries if regex_item.search(entry['name'])), None)
+                if entry is not None:
+                    context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
+                    df = merge(df, read_child_file(entry, prepare, get_root_dtypes(regex_item, dtypes_by_root),
+                                                   get_root_read_plan(regex_item, read_plan), csv_engine))
+                    context.log.info(f"Merged '{entry['path']}' in data set '{set_id}'")
+
+            context.log.info(f"Transform data set '{set_id}'")
+            df = transform_set_df(df, table_desc, table_desc_by_type, table_type_limits)
+        except IOError as ioe:
+            context.log.warn(f'Error loading {entry["path"]}: {ioe}')
+            df = None
+
+    return df, context.log.messages
+
+
+@solid(
+    output_defs=[
+        OutputDefinition(dagster_type=List, name='sets_list', is_optional=False),
+        OutputDefinition(dagster_type=Dict, name='sets_df', is_optional=False),
+    ],
+)
+def process_file_sets_parallel(context, sets_list: List, dtypes_by_root: Dict, read_plan: Dict,
+                               prev_uploaded: Optional[DataFrame], uploaded_ids: Dict, table_desc: DataFrame,
+                               table_desc_by_type: Dict, table_type_limits: Dict, regex_patterns: Dict,
+                               csv_engine: String, set_workers: Int, read_workers: Int, parallel_read_min_size: Int,
+                               filter_uploaded: Bool):
+    """
+    Read, merge and transform all import sets, each set in its own worker process.
+    Workers remove entries uploaded before this run using a snapshot of the uploaded sales_data primary keys. Entries
+    duplicated across sets in this run are removed here as the results are collected, in the order of the sets list,
+    so the outcome is the same as processing the sets one after another
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set;
+                 [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
+                             {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
+                   {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
+                              {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :param table_desc: pandas DataFrame containing details of the database table
+    :param table_desc_by_type: dict of pandas DataFrames of data types in database table with data type as the key
+    :param table_type_limits: dict of type limits with field name as the key
+    :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
+    :param set_workers: max number of worker processes
+    :param read_workers: max number of processes each worker uses to read an uncompressed sales journal file
+    :param parallel_read_min_size: minimum size in bytes of a sales journal file to read in parallel
+    :param filter_uploaded: remove previously uploaded entries; False if they are removed by stage_file_sets, so the
+                            staging cache holds complete sets
+    :return: dict of data with set ids as key and DataSet as value
+    """
+    regex_patterns_dict = regex_patterns['value']
+    regex_sj = re.compile(regex_patterns_dict['set_sj_pattern'])
+
+    sets_df = {}
+    sets = [(set_id, set_entry[set_id]) for set_entry in sets_list for set_id in set_entry.keys()]
+    if len(sets) > 0:
+        workers = max(1, min(set_workers, len(sets)))
+        context.log.info(f'Processing {len(sets)} data sets with {workers} worker(s)')
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_set_worker,
+                                 initargs=(uploaded_ids,)) as executor:
+            futures = [executor.submit(process_file_set, set_id, entries, dtypes_by_root, read_plan,
+                                       prev_uploaded if filter_uploaded else None, table_desc, table_desc_by_type,
+                                       table_type_limits, regex_patterns_dict, csv_engine, read_workers,
+                                       parallel_read_min_size)
+                       for set_id, entries in sets]
+
+            # collect in the order of the sets list, so the results don't depend on which worker finishes first
+            for (set_id, entries), future in zip(sets, futures):
+                df, messages = future.result()
+                for level, msg in messages:
+                    getattr(context.log, level)(msg)
+                if df is None:
+                    continue
+
+                if filter_uploaded and prev_uploaded is not None and len(prev_uploaded) > 0 and len(df) > 0:
+                    # remove entries loaded by sets earlier in this run, and record this set's entries
+                    duplicated = uploaded_id_flags(uploaded_ids, df['ID'].values)
+                    if duplicated.any():
+                        df = df[~duplicated]
+                        context.log.info(f"Removed {duplicated.sum()} records in data set '{set_id}' already loaded "
+                                         f"from another data set")
+                    mark_uploaded_ids(uploaded_ids, df['ID'].values)
+
+                sj_entry = next(entry for entry in entries if regex_sj.search(entry['name']))
+                sets_df[set_id] = DataSet(sj_entry['name'], sj_entry['path'], start_date=sj_entry['start_date'],
+                                          end_date=sj_entry['end_date'], df=df, min_id=df['ID'].min(),
+                                          max_id=df['ID'].max())
+
+    context.log.info(f'{len(sets_df)} DataFrames loaded from {len(sets_list)} data sets')
+
+    yield Output(sets_list, 'sets_list')
+    yield Output(sets_df, 'sets_df')
@@ -23,14 +23,15 @@ from datetime import date, datetime
 
 import math
 import numpy as np
-import pandas as pd
 import sys
+from pandas.api.types import is_categorical_dtype
 from dagster import (
     solid,
     lambda_solid,
     Dict,
     Failure)
 from dagster_pandas import DataFrame
+from sales_journal.misc_sj import parse_timestamps
 
 
 @lambda_solid()
@@ -106,67 +107,87 @@ def transform_sets_df(context, sets_df: Dict, table_desc: DataFrame, table_desc_
 
         context.log.info(f"Transform data set {set_id}'")
 
-        set_df = sets_df[set_id].df
+        sets_df[set_id].df = transform_set_df(sets_df[set_id].df, table_desc, table_desc_by_type,
+                                              table_type_limits)
+
+    return sets_df
 
-        # generate a list of the names of fields with the date types
-        # also a list of formats for the date fields
-        date_fields = np.concatenate((table_desc_by_type['date']['field'].values,
-                                      table_desc_by_type['timestamp']['field'].values)).tolist()
-        date_fields_formats = np.concatenate((table_desc_by_type['date']['format'].values,
-                                              table_desc_by_type['timestamp']['format'].values)).tolist()
-        # generate numpy arrays of the names of fields with the same type
-        int_fields = table_desc_by_type['int']['field'].values
-        long_fields = table_desc_by_type['long']['field'].values
-        real_fields = table_desc_by_type['real']['field'].values
-        double_precision_fields = table_desc_by_type['double precision']['field'].values
-        text_fields = np.concatenate((table_desc_by_type['text']['field'].values,
-                                      table_desc_by_type['varchar']['field'].values))
-
-        # TODO needs work, type coercion is really only for the types known to need it rather than a general method
-        for label, content in set_df.items():  # Iterator over (column name, Series) pairs
-            row = table_desc[table_desc['field'] == label].iloc[0]  # will only be one
-            load_type = row['loadtype'].lower()
-            data_type = row['datatype'].lower()
-            if load_type != '':
-                # loaded as different type to required
-                new_type = data_type
+
+def transform_set_df(set_df: DataFrame, table_desc: DataFrame, table_desc_by_type: dict,
+                     table_type_limits: dict) -> DataFrame:
+    """
+    Perform any necessary transformations on a set panda DataFrame
+    :param set_df: panda DataFrame to transform
+    :param table_desc: pandas DataFrame containing details of the database table
+    :param table_desc_by_type: dict of pandas DataFrames of data types in database table with data type as the key
+    :param table_type_limits: dict of type limits with field name as the key
+    :return: transformed panda DataFrame
+    """
+    # generate a list of the names of fields with the date types
+    # also a list of formats for the date fields
+    date_fields = np.concatenate((table_desc_by_type['date']['field'].values,
+                                  table_desc_by_type['timestamp']['field'].values)).tolist()
+    date_fields_formats = np.concatenate((table_desc_by_type['date']['format'].values,
+                                          table_desc_by_type['timestamp']['format'].values)).tolist()
+    # generate numpy arrays of the names of fields with the same type
+    int_fields = table_desc_by_type['int']['field'].values
+    long_fields = table_desc_by_type['long']['field'].values
+    real_fields = table_desc_by_type['real']['field'].values
+    double_precision_fields = table_desc_by_type['double precision']['field'].values
+    text_fields = np.concatenate((table_desc_by_type['text']['field'].values,
+                                  table_desc_by_type['varchar']['field'].values))
+
+    # TODO needs work, type coercion is really only for the types known to need it rather than a general method
+    for label, content in set_df.items():  # Iterator over (column name, Series) pairs
+        row = table_desc[table_desc['field'] == label].iloc[0]  # will only be one
+        load_type = row['loadtype'].lower()
+        data_type = row['datatype'].lower()
+        if load_type != '':
+            # loaded as different type to required
+            new_type = data_type
+        else:
+            new_type = ''
+
+        if label in date_fields:
+            if new_type == 'timestamp':
+                # transform date strings to dates
+                try:
+                    fidx = date_fields.index(label)
+                    set_df[label] = parse_timestamps(set_df[label], date_fields_formats[fidx])
+                except ValueError:
+                    pass  # ignore, no format was found
+        elif label in int_fields or label in long_fields:
+            if new_type != '' and load_type == 'text':
+                # replace nan and coerce to int
+                content.fillna('0', inplace=True)
+                set_df[label] = set_df[label].astype(int)  # no diff between int & long in python 3
+            # transform empty integer fields
+            content.fillna(0, inplace=True)
+        elif label in real_fields or label in double_precision_fields:
+            # transform empty real field
+            content.fillna(0, inplace=True)
+        elif label in text_fields:
+            # transform empty text field
+            if is_categorical_dtype(content.dtype):
+                # the empty text value needs to be a category before it can be used as a fill value
+                if '' not in content.cat.categories:
+                    content = content.cat.add_categories([''])
+                set_df[label] = content.fillna('')
             else:
-                new_type = ''
-
-            if label in date_fields:
-                if new_type == 'timestamp':
-                    # transform date strings to dates
-                    try:
-                        fidx = date_fields.index(label)
-                        set_df[label] = pd.to_datetime(set_df[label], format=date_fields_formats[fidx])
-                    except ValueError:
-                        pass  # ignore, no format was found
-            elif label in int_fields or label in long_fields:
-                if new_type != '' and load_type == 'text':
-                    # replace nan and coerce to int
-                    content.fillna('0', inplace=True)
-                    set_df[label] = set_df[label].astype(int)  # no diff between int & long in python 3
-                # transform empty integer fields
-                content.fillna(0, inplace=True)
-            elif label in real_fields or label in double_precision_fields:
-                # transform empty real field
-                content.fillna(0, inplace=True)
-            elif label in text_fields:
-                # transform empty text field
                 content.fillna('', inplace=True)
 
-            # do check on data to ensure doesn't exceed type limits
-            if data_type.startswith('varchar'):
-                limit = table_type_limits[label]
-                failed = content.str.len() > limit['max_size']
-                if failed.any():
-                    raise Failure(f"Type limit check failure for '{label}': {failed.value_counts()[True]} "
-                                  f"entries exceeded max size {limit['max_size']}")
-            elif data_type != 'text':
-                # TODO min max value checks
-                pass
-
-    return sets_df
+        # do check on data to ensure doesn't exceed type limits
+        if data_type.startswith('varchar'):
+            limit = table_type_limits[label]
+            failed = content.str.len() > limit['max_size']
+            if failed.any():
+                raise Failure(f"Type limit check failure for '{label}': {failed.value_counts()[True]} "
+                              f"entries exceeded max size {limit['max_size']}")
+        elif data_type != 'text':
+            # TODO min max value checks
+            pass
+
+    return set_df
 
 
 @solid()
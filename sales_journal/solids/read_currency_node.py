@@ -31,6 +31,7 @@ import xml.etree.ElementTree as eT
 from dagster_pandas import DataFrame
 
 from db_toolkit.misc import test_file_path
+from sales_journal.misc_sj import read_csv_file, ENGINE_C
 from dagster import (
     solid,
     String,
@@ -101,8 +102,11 @@ def read_imf_per_currency(context, cur_config: Dict, tsv_path: String) -> DataFr
 
     context.log.info(f"Reading '{tsv_path}'")
 
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html#pandas.read_csv
-    df = pd.read_csv(tsv_path, encoding=cfg['encoding'], sep='\t', skiprows=2)
+    csv_engine = ENGINE_C
+    if 'csv_engine' in cfg:
+        csv_engine = cfg['csv_engine']
+
+    df = read_csv_file(tsv_path, encoding=cfg['encoding'], sep='\t', skiprows=2, engine=csv_engine)
 
     # drop unnamed columns
     df = drop_unnamed_columns(df)
@@ -22,17 +22,31 @@
 import re
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_extension_array_dtype
 import os.path as path
-from os import listdir
-from os.path import isfile, join
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from gzip import GzipFile
 
 from dagster_pandas import DataFrame
 
 from db_toolkit.misc import test_dir_path
-from sales_journal.misc_sj import DataSet
+from sales_journal.misc_sj import (
+    DataSet,
+    read_data_file,
+    read_csv_file_parallel,
+    is_columnar_file,
+    FileManifest,
+    get_data_roots,
+    parse_date_window,
+    hash_files,
+    read_cost,
+    get_work_claims,
+    start_claim_heartbeat,
+    get_memory_governor,
+    format_bytes,
+    get_file_set_scheduler,
+)
 from dagster import (
     solid,
     String,
@@ -42,50 +56,64 @@ from dagster import (
     OutputDefinition,
     Output,
     lambda_solid,
-    Optional
+    Optional,
+    Failure,
+    Bool,
 )
 
+# there was a bug in the TDP code which generated incorrect SEQUENCE values in promo files prior to this date
+PROMO_SEQ_BUG_FIX_DATE = datetime(2019, 4, 1)
+
 
 @solid()
-def load_list_of_csv_files(context, db_data_path: String, date_in_name_pattern: String,
-                           date_in_name_format: String) -> List:
+def load_list_of_csv_files(context, db_data_path: Dict, date_in_name_pattern: String,
+                           date_in_name_format: String, file_manifest: String, date_window: Dict,
+                           list_workers: Int) -> List:
     """
     Load csv file and convert into a panda DataFrame
     :param context: execution context
-    :param db_data_path: directory containing database csv files
+    :param db_data_path: directory containing database csv files, and/or zip or tar archives of csv files, or list of
+                         directories; directories may include glob patterns, e.g. 'archive/**' to search all
+                         subdirectories of 'archive'
     :param date_in_name_pattern: regex to match dates in csv filenames
     :param date_in_name_format: datetime format to convert dates in csv filenames
+    :param file_manifest: path to manifest of files in db_data_path, or '' to examine all files on every run
+    :param date_window: date window configuration, or None to list all files; files and subdirectories dated outside
+                        the window are skipped
+    :param list_workers: number of threads listing directories
     :return: list of dictionaries of file details; {
                 'name': filename, 'path': path including filename,
                 'start_date': start date in filename, 'end_date': end date in filename
                 }
     :rtype: list
     """
-    # verify csv path
-    if not path.exists(db_data_path):
-        raise ValueError(f'Invalid io directory path: {db_data_path}')
-    if not test_dir_path(db_data_path):
-        raise ValueError(f'Not a directory path: {db_data_path}')
+    data_paths = db_data_path['value']
 
-    # use list comprehension to get listing of files
-    files_lst = [{'name': f, 'path': join(db_data_path, f)}
-                 for f in listdir(db_data_path)
-                 if isfile(join(db_data_path, f))]
+    # verify csv paths
+    for base, _ in get_data_roots(data_paths):
+        if not path.exists(base):
+            raise ValueError(f'Invalid io directory path: {base}')
+        if not test_dir_path(base):
+            raise ValueError(f'Not a directory path: {base}')
 
-    regex = re.compile(date_in_name_pattern)
-    for file in files_lst:
-        match = regex.search(file['name'])
-        if match:
-            file['start_date'] = datetime.strptime(match.group(1), date_in_name_format)
-            file['end_date'] = datetime.strptime(match.group(2), date_in_name_format)
+    # files in archives are listed as virtual files, which the readers stream directly from the archive
+    manifest = FileManifest(file_manifest if file_manifest else None, data_paths, date_in_name_pattern,
+                            date_in_name_format, date_window=parse_date_window(date_window['value'],
+                                                                               date_in_name_format),
+                            list_workers=list_workers)
+    examined = manifest.refresh(on_error=context.log.warn)
+    manifest.save()
 
-    context.log.info(f'Loaded {len(files_lst)} filenames from {db_data_path}')
+    files_lst = manifest.files()
+
+    context.log.info(f'Loaded {len(files_lst)} filenames from {data_paths}, {examined} new or changed')
 
     return files_lst
 
 
 @solid()
-def create_csv_file_sets(context, files_lst: List, prev_uploaded: Optional[DataFrame], regex_patterns: Dict) -> List:
+def create_csv_file_sets(context, files_lst: List, prev_uploaded: Optional[DataFrame], regex_patterns: Dict,
+                         hash_workers: Int) -> List:
     """
     Group all files into import sets
     :param context: execution context
@@ -94,6 +122,7 @@ def create_csv_file_sets(context, files_lst: List, prev_uploaded: Optional[DataF
                  'start_date': start date in filename, 'end_date': end date in filename}
     :param prev_uploaded: details of previously loaded data sets
     :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param hash_workers: number of threads used to hash the contents of duplicated files
     :return: list of, dictionaries of dictionaries of all the files in an import set;
              [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
                          {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
@@ -101,62 +130,7 @@ def create_csv_file_sets(context, files_lst: List, prev_uploaded: Optional[DataF
                           {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
     :rtype: list
     """
-
-    regex_patterns_dict = regex_patterns['value']
-
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.from_records.html#pandas.DataFrame.from_records
-    df = pd.DataFrame.from_records(files_lst)
-
-    # add a column with the set link
-    df['set'] = df['name'].str.extract(regex_patterns_dict['set_link_pattern'])
-
-    # only files matching set pattern
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.Series.str.contains.html
-    all_set_entries = df[df['name'].str.contains(regex_patterns_dict['set_common_pattern'])]
-
-    # TODO doesn't currently handle duplicate csv & gz file sets
-
-    # get unique set identifiers
-    set_links = all_set_entries['set'].unique()
-    all_set_entries = all_set_entries.drop(['set'], axis=1)  # drop set link column no longer required
-
-    context.log.info(f'{len(set_links)} data set(s) identified')
-
-    sets_list = []
-    for set_id in set_links:
-        # df of all entries with same set link
-        set_entity = all_set_entries[all_set_entries['name'].str.contains(set_id, regex=False)]
-
-        counts = {'total': 0}
-        for pattern in regex_patterns_dict['set_required_elements']:
-            counts[pattern] = len(set_entity[set_entity['name'].str.contains(regex_patterns_dict[pattern])])
-            counts['total'] += counts[pattern]
-
-        if counts['total'] == len(regex_patterns_dict['set_required_elements']):
-            set_ok = True
-            for pattern in regex_patterns_dict['set_required_elements']:
-                if counts[pattern] != 1:
-                    set_ok = False
-                    break
-
-            if set_ok:
-                ignore = False
-                if prev_uploaded is not None and len(prev_uploaded) > 0:
-                    ignore = prev_uploaded['fileset'].isin([set_id]).any()
-
-                if ignore:
-                    context.log.info(f'Ignoring previously loaded data set: {set_id}')
-                else:
-                    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_dict.html
-                    sets_list.append({
-                        set_id: set_entity.to_dict('records')
-                    })
-            else:
-                context.log.info(f"Discarding inconsistent data set '{set_id}': {counts}")
-        else:
-            context.log.info(f"Discarding incomplete data set '{set_id}': {counts}")
-
-    return sets_list
+    return group_file_sets(files_lst, prev_uploaded, regex_patterns['value'], hash_workers, context.log)
 
 
 @lambda_solid
@@ -198,7 +172,10 @@ def generate_dtypes(table_desc: DataFrame, table_desc_by_type: Dict) -> Dict:
                     for idx in range(len(type_df)):
                         row = type_df.iloc[idx]
 
-                        if row['loadtype'] == '':
+                        if row['category'].lower() == 'y':
+                            # few distinct values, so load as categorical to save memory
+                            dtype = 'category'
+                        elif row['loadtype'] == '':
                             dtype = field_type_to_dtype(field_type)
                         else:
                             # required different loadtype before conversion later
@@ -208,8 +185,34 @@ def generate_dtypes(table_desc: DataFrame, table_desc_by_type: Dict) -> Dict:
     return dtypes
 
 
-@solid()
-def filter_load_file_sets(context, sets_list: List, load_file_sets: Dict, max_file_sets_per_run: Int) -> List:
+@lambda_solid
+def generate_read_plan(table_desc: DataFrame) -> Dict:
+    """
+    Generate a dictionary of lists of the columns to read from each file, with the root table identifier as the key.
+    Only columns which are saved, are join keys, or are required to generate a saved column are read.
+    :param table_desc: pandas DataFrame containing details of the database table
+    :return: dict of column name lists with root table identifier as the key
+    """
+    read_plan = {}
+
+    roots = table_desc['root'].unique()
+    for root in roots:
+        root_desc = table_desc[table_desc['root'] == root]
+        columns = []
+        for row in root_desc.itertuples(index=False, name='FieldDef'):
+            if row.source.upper() != 'G' and (row.save.lower() == 'y' or row.join_key.lower() == 'y'):
+                columns.append(row.field)
+            for field in row.depends.split():
+                columns.append(field)
+        # remove any duplicates, preserving order
+        read_plan[root] = list(dict.fromkeys(columns))
+
+    return read_plan
+
+
+@solid(required_resource_keys={'postgres_warehouse'})
+def filter_load_file_sets(context, sets_list: List, load_file_sets: Dict, max_file_sets_per_run: Int,
+                          work_claims: Dict, memory_governor: Dict, schedule: Dict) -> List:
     """
     Filter to detected data sets list to remove data sets not specified in load requirements
     :param context: execution context
@@ -220,54 +223,171 @@ def filter_load_file_sets(context, sets_list: List, load_file_sets: Dict, max_fi
                               {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
     :param load_file_sets: list of data sets to load, others will be ignored
     :param max_file_sets_per_run: max number of file sets to process at the same time
+    :param work_claims: work claims configuration, or None if sets aren't claimed; if configured only sets claimed by
+                        this worker are kept, and the run size is checked on the claimed sets
+    :param memory_governor: memory governor configuration, or None if the number of sets isn't limited by memory
+    :param schedule: file set schedule configuration, or None to process sets in listing order up to
+                     max_file_sets_per_run
     :return: filtered sets list
     """
     load_file_sets_list = load_file_sets['value']
-    filtered = []
-    selected_sets = 0
-
-    def add_set(set_to_add) -> bool:
-        nonlocal filtered
-        filtered.append(set_to_add)
-        nonlocal selected_sets
-        selected_sets += 1
-        full = selected_sets >= max_file_sets_per_run
-        if full:
-            context.log.info(f"Maximum sets per run threshold ({max_file_sets_per_run}) reached")
-        return full
 
     if load_file_sets_list is not None:
         if len(load_file_sets_list) > max_file_sets_per_run:
             raise ValueError(f'Length of load file sets list ({len(load_file_sets_list)}) exceeds '
                              f'max file sets per run ({max_file_sets_per_run})')
 
-        is_full = False
+        candidates = []
         for set_entry in sets_list:  # dict in list
             for set_id in set_entry.keys():  # key in dict.keys (there's only one)
                 if set_id not in load_file_sets_list:
                     context.log.info(f"Ignoring data set '{set_id}' as not in load data set list")
                 else:
-                    is_full = add_set(set_entry)
-                    if is_full:
-                        break
-            if is_full:
-                break
+                    candidates.append(set_entry)
     else:
-        for set_entry in sets_list:  # dict in list
-            if add_set(set_entry):
-                break
+        candidates = sets_list
+
+    scheduler = get_file_set_scheduler(schedule['value'])
+    if scheduler is not None:
+        candidates = scheduler.sort(candidates)
+    governor = get_memory_governor(memory_governor['value'])
+
+    claims = get_work_claims(work_claims['value'])
+    if claims is None:
+        filtered = candidates[:size_file_sets(context, candidates, max_file_sets_per_run, scheduler, governor)]
+    else:
+        # the sets claimed by other workers aren't known until claimed, so the run is sized on the claimed sets
+        candidates_by_id = {set_id: set_entry for set_entry in candidates for set_id in set_entry.keys()}
+        claimed = claim_file_sets(context, claims, list(candidates_by_id.keys()), max_file_sets_per_run,
+                                  size=lambda set_ids: size_file_sets(
+                                      context, [candidates_by_id[set_id] for set_id in set_ids],
+                                      max_file_sets_per_run, scheduler, governor))
+        filtered = [set_entry for set_entry in candidates if list(set_entry.keys())[0] in claimed]
+
+    if len(filtered) >= max_file_sets_per_run:
+        context.log.info(f"Maximum sets per run threshold ({max_file_sets_per_run}) reached")
 
     return filtered
 
 
+def size_file_sets(context, candidates: list, max_sets: int, scheduler, governor) -> int:
+    """
+    Get the number of file sets to process in this run, within the scheduler's run budget and the available memory
+    :param context: execution context
+    :param candidates: list of, dictionaries of dictionaries of all the files in an import set, in order of processing
+    :param max_sets: max number of sets
+    :param scheduler: file set scheduler, or None if the run size isn't limited by a budget
+    :param governor: memory governor, or None if the run size isn't limited by memory
+    :return: number of sets to process
+    """
+    limit = max_sets
+    if scheduler is not None:
+        limit, total_bytes, total_rows = scheduler.pack(candidates, max_sets)
+        totals = []
+        if total_bytes is not None:
+            totals.append(format_bytes(total_bytes))
+        if total_rows is not None:
+            totals.append(f'~{total_rows} rows')
+        context.log.info(f"Scheduled {limit} of {len(candidates)} data sets in '{scheduler.order}' order"
+                         f"{' (' + ', '.join(totals) + ')' if len(totals) > 0 else ''}")
+    if governor is not None:
+        limit = min(limit, admit_file_sets(context, governor, candidates, limit))
+
+    if limit < min(max_sets, len(candidates)):
+        context.log.info(f"Run size threshold reached at {limit} sets")
+    return limit
+
+
+def admit_file_sets(context, governor, candidates: list, max_sets: int) -> int:
+    """
+    Get the number of file sets to process in this run, so their estimated footprint fits in the available memory
+    :param context: execution context
+    :param governor: memory governor
+    :param candidates: list of, dictionaries of dictionaries of all the files in an import set, in order of processing
+    :param max_sets: max number of sets
+    :return: number of sets to process
+    """
+    estimates = []
+    for set_entry in candidates[:max_sets]:  # dict in list
+        for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+            estimates.append(governor.estimate_set(set_entry[set_id]))
+
+    available = governor.available()
+    admitted = governor.admit(estimates, max_sets)
+    if admitted > 0:
+        context.log.info(f"Memory governor: {format_bytes(available)} available, admitting {admitted} of "
+                         f"{len(candidates)} data sets with an estimated footprint of "
+                         f"{format_bytes(sum(estimates[:admitted]))}")
+        if sum(estimates[:admitted]) > available:
+            context.log.warn(f"Estimated footprint of data set ({format_bytes(estimates[0])}) exceeds available "
+                             f"memory ({format_bytes(available)})")
+    return admitted
+
+
+def claim_file_sets(context, claims, set_ids: list, limit: int, size=None) -> list:
+    """
+    Register file sets in the work table and claim up to a limit of them. The claims are renewed by a heartbeat
+    thread until the sets are recorded in the tracking table, or released by stop_claim_heartbeats()
+    :param context: execution context
+    :param claims: work claims
+    :param set_ids: ids of sets to claim, in order of preference
+    :param limit: max number of sets to claim
+    :param size: function to get the number of claimed sets to keep from their ids, in order of preference, or None
+                 to keep all the claimed sets; the others are returned to the pool
+    :return: ids of claimed sets
+    """
+    claimed = []
+    if len(set_ids) > 0:
+        client = context.resources.postgres_warehouse.get_connection(context)
+        if client is None:
+            raise Failure('Unable to connect to database to claim data sets')
+
+        cursor = client.cursor()
+        try:
+            claims.create_table(cursor)
+            claims.register(cursor, set_ids)
+            client.commit()
+            claimed = claims.claim(cursor, set_ids, limit)
+            client.commit()
+
+            if len(claimed) < limit:
+                # not limited by the max sets per run, so any others are claimed by other workers, or already uploaded
+                for set_id in set_ids:
+                    if set_id not in claimed:
+                        context.log.info(f"Ignoring data set '{set_id}' as claimed by another worker")
+
+            if size is not None and len(claimed) > 0:
+                keep = size(claimed)
+                if keep < len(claimed):
+                    context.log.info(f"Returning data sets {claimed[keep:]} to the pool, as over the run size")
+                    claims.release(cursor, claimed[keep:])
+                    client.commit()
+                    claimed = claimed[:keep]
+        except Exception:
+            client.rollback()
+            client.close_connection()
+            raise
+        finally:
+            cursor.close()
+
+        if len(claimed) > 0:
+            context.log.info(f"Worker '{claims.worker_id}' claimed data sets {claimed}")
+            start_claim_heartbeat(claims, client, claimed)
+        else:
+            client.close_connection()
+    return claimed
+
+
 @solid(
     output_defs=[
         OutputDefinition(dagster_type=List, name='sets_list', is_optional=False),
         OutputDefinition(dagster_type=Dict, name='sets_df', is_optional=False),
     ],
 )
-def read_sj_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, prev_uploaded: Optional[DataFrame],
-                          uploaded_ids: Dict, regex_patterns: Dict):
+def read_sj_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, read_plan: Dict,
+                          prev_uploaded: Optional[DataFrame], uploaded_ids: Dict, regex_patterns: Dict,
+                          csv_engine: String, read_workers: Int, parallel_read_min_size: Int, memory_governor: Dict,
+                          filter_uploaded: Bool):
     """
     Read the sales journal file in all import sets
     :param context: execution context
@@ -277,24 +397,24 @@ def read_sj_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, prev_u
                    {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
                               {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
     :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
     :param prev_uploaded: details of previously loaded data sets
     :param uploaded_ids: sales_data primary keys
     :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
+    :param read_workers: max number of processes to use to read an uncompressed sales journal file
+    :param parallel_read_min_size: minimum size in bytes of a sales journal file to read in parallel
+    :param memory_governor: memory governor configuration, or None if memory usage isn't observed
+    :param filter_uploaded: remove previously uploaded entries; False if they are removed by stage_file_sets, so the
+                            staging cache holds complete sets
     :return: dict of data with set ids as key and DataSet as value
     """
+    governor = get_memory_governor(memory_governor['value'])
     regex_patterns_dict = regex_patterns['value']
     regex_item = re.compile(regex_patterns_dict['set_sj_pattern'])
-    regex_csv_set = re.compile(regex_patterns_dict['set_pattern'])
-    regex_gz_set = re.compile(regex_patterns_dict['gz_set_pattern'])
+    regex_file_set = re.compile(regex_patterns_dict['set_common_pattern'])
 
     sets_df = {}
-    min_sj_pk_value = uploaded_ids['min_sj_pk_value']
-    max_sj_pk_value = uploaded_ids['max_sj_pk_value']
-    ids = uploaded_ids['ids']
-
-    def set_ba(id_to_set):
-        ids[id_to_set - min_sj_pk_value] = True
-        return id_to_set
 
     for set_entry in sets_list:  # dict in list
         for set_id in set_entry.keys():  # key in dict.keys (there's only one)
@@ -302,63 +422,21 @@ def read_sj_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, prev_u
                 if regex_item.search(entry['name']):
                     # found matching file, read it as DataFrame in a dict with set_id as key
 
-                    # get the dtypes values to use when reading the csv
-                    dtypes = {}
-                    for key in dtypes_by_root.keys():
-                        if regex_item.match(key):
-                            dtypes = dtypes_by_root[key]
-                            break
+                    # get the dtypes values & columns to use when reading the csv
+                    dtypes = get_root_dtypes(regex_item, dtypes_by_root)
+                    usecols = get_root_read_plan(regex_item, read_plan)
 
-                    csv_match = regex_csv_set.search(entry['name'])
-                    gz_match = regex_gz_set.search(entry['name'])
                     try:
-                        if csv_match or gz_match:
-                            if gz_match:
-                                filepath_or_buffer = GzipFile(entry['path'])
-                            else:
-                                filepath_or_buffer = entry['path']
-
+                        if regex_file_set.search(entry['name']):
                             context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
 
-                            # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html#pandas.read_csv
-                            df = pd.read_csv(filepath_or_buffer, dtype=dtypes)
-
-                            df.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
-
-                            # remove non-USD entity amounts which shouldn't be in the data, can replace once currency
-                            # functionality is completely implemented
-                            pre_len = len(df)
-                            df = df[df['ENTITYCURRENCYCODE'] == 'USD']
-                            post_len = len(df)
-                            if pre_len > post_len:
-                                context.log.info(f"Removed '{pre_len-post_len}' non-USD ENTITYCURRENCYCODE")
-
-                            df.sort_values(by=['ID'], inplace=True)
-
-                            # filter previously uploaded
-                            if prev_uploaded is not None and len(prev_uploaded) > 0:
-                                duplicated = 0
-                                if len(df) > 0:
-
-                                    min_id = df['ID'].min()
-                                    if min_id < min_sj_pk_value:
-                                        raise ValueError(f'Minimum id value {min_id} out of range')
-                                    max_id = df['ID'].max()
-                                    if max_id > max_sj_pk_value:
-                                        raise ValueError(f'Maximum id value {max_id} out of range')
-
-                                    pre_len = len(df)
-                                    # get series of true/false for intersection of previously uploaded and df being
-                                    prev_matches = df['ID'].apply(lambda id_to_chk: ids[id_to_chk - min_sj_pk_value])
-
-                                    df.drop(prev_matches[prev_matches].index, inplace=True)
-                                    duplicated += (pre_len - len(df))
+                            df = read_sj_data_file(entry['path'], dtypes, usecols, csv_engine, read_workers,
+                                                   parallel_read_min_size)
+                            if governor is not None:
+                                governor.observe(entry['path'], df)
 
-                                    # add new ids to uploaded check
-                                    df['ID'].apply(set_ba)
-
-                                if duplicated > 0:
-                                    context.log.info(f'Removed {duplicated} previously uploaded records')
+                            df = filter_sj_df(context, df, prev_uploaded if filter_uploaded else None,
+                                              uploaded_ids)
 
                             sets_df[set_id] = DataSet(entry['name'], entry['path'],
                                                       start_date=entry['start_date'], end_date=entry['end_date'], df=df,
@@ -375,13 +453,167 @@ def read_sj_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, prev_u
     yield Output(sets_df, 'sets_df')
 
 
+def read_sj_data_file(filepath: str, dtypes: dict, usecols: list, csv_engine: str, read_workers: int,
+                      parallel_read_min_size: int) -> DataFrame:
+    """
+    Read a sales journal file
+    :param filepath: path of file
+    :param dtypes: dtypes to use when reading the file
+    :param usecols: columns to read, or None to read all columns
+    :param csv_engine: csv parse engine to use
+    :param read_workers: max number of processes to use to read an uncompressed csv file
+    :param parallel_read_min_size: minimum size in bytes of a csv file to read in parallel
+    :return: DataFrame
+    """
+    if is_columnar_file(filepath):
+        df = read_data_file(filepath, dtype=dtypes, usecols=usecols)
+    else:
+        # compressed files are decompressed by the reader, and always read serially
+        df = read_csv_file_parallel(filepath, read_workers, dtype=dtypes, usecols=usecols, engine=csv_engine,
+                                    min_size=parallel_read_min_size)
+    df.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
+    return df
+
+
 @solid(
     output_defs=[
         OutputDefinition(dagster_type=List, name='sets_list', is_optional=False),
         OutputDefinition(dagster_type=Dict, name='sets_df', is_optional=False),
     ],
 )
-def merge_promo_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_root: Dict, regex_patterns: Dict):
+def read_join_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, read_plan: Dict,
+                            prev_uploaded: Optional[DataFrame], uploaded_ids: Dict, regex_patterns: Dict,
+                            csv_engine: String, read_workers: Int, parallel_read_min_size: Int,
+                            memory_governor: Dict, filter_uploaded: Bool):
+    """
+    Read the sales journal file in all import sets and join the promo, segs & ref files of each set to it, in a single
+    pass over the set. The child files of a set are read while its sales journal file is being read.
+    Performs the same processing as read_sj_csv_file_sets, merge_promo_csv_file_sets & merge_segs_csv_file_sets
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set;
+                 [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
+                             {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
+                   {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
+                              {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
+    :param read_workers: max number of processes to use to read an uncompressed sales journal file
+    :param parallel_read_min_size: minimum size in bytes of a sales journal file to read in parallel
+    :param memory_governor: memory governor configuration, or None if memory usage isn't observed
+    :param filter_uploaded: remove previously uploaded entries; False if they are removed by stage_file_sets, so the
+                            staging cache holds complete sets
+    :return: dict of data with set ids as key and DataSet as value
+    """
+    governor = get_memory_governor(memory_governor['value'])
+    regex_patterns_dict = regex_patterns['value']
+    regex_sj = re.compile(regex_patterns_dict['set_sj_pattern'])
+    regex_file_set = re.compile(regex_patterns_dict['set_common_pattern'])
+    children = get_child_joins(regex_patterns_dict, read_plan)
+
+    dtypes = get_root_dtypes(regex_sj, dtypes_by_root)
+    usecols = get_root_read_plan(regex_sj, read_plan)
+
+    sets_df = {}
+
+    with ThreadPoolExecutor(max_workers=len(children)) as executor:
+        for set_entry in sets_list:  # dict in list
+            for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+                entries = set_entry[set_id]
+                sj_entry = next((entry for entry in entries if regex_sj.search(entry['name'])), None)
+                if sj_entry is None:
+                    context.log.warn(f"No sales journal file in data set '{set_id}'")
+                    continue
+                if not regex_file_set.search(sj_entry['name']):
+                    context.log.warn(f'No type match for {sj_entry["path"]}')
+                    continue
+
+                # start reading the child files, in join order
+                pending = []
+                for regex_item, prepare, merge in children:
+                    entry = next((entry for entry in entries if regex_item.search(entry['name'])), None)
+                    if entry is not None:
+                        context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
+                        pending.append((entry, merge, executor.submit(
+                            read_child_file, entry, prepare, get_root_dtypes(regex_item, dtypes_by_root),
+                            get_root_read_plan(regex_item, read_plan), csv_engine)))
+
+                entry = sj_entry
+                try:
+                    context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
+                    df = read_sj_data_file(entry['path'], dtypes, usecols, csv_engine, read_workers,
+                                           parallel_read_min_size)
+                    if governor is not None:
+                        governor.observe(entry['path'], df)
+
+                    df = filter_sj_df(context, df, prev_uploaded if filter_uploaded else None, uploaded_ids)
+
+                    for entry, merge, future in pending:
+                        df = merge(df, future.result())
+                        context.log.info(f"Merged '{entry['path']}' in data set '{set_id}'")
+
+                    sets_df[set_id] = DataSet(sj_entry['name'], sj_entry['path'],
+                                              start_date=sj_entry['start_date'], end_date=sj_entry['end_date'], df=df,
+                                              min_id=df['ID'].min(), max_id=df['ID'].max())
+                except IOError as ioe:
+                    context.log.warn(f'Error loading {entry["path"]}: {ioe}')
+                    for _, _, future in pending:
+                        future.cancel()
+
+    context.log.info(f'{len(sets_df)} DataFrames loaded and joined from {len(sets_list)} data sets')
+
+    yield Output(sets_list, 'sets_list')
+    yield Output(sets_df, 'sets_df')
+
+
+def get_child_joins(regex_patterns_dict: dict, read_plan: dict) -> list:
+    """
+    Get the child files to join to the sales journal, in join order. The ref file is only joined if the table
+    description has columns from it
+    :param regex_patterns_dict: dict of regex pattern representing filenames and file sets
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :return: list of tuples of compiled regex matching the file, function to prepare the file DataFrame for joining,
+             and function to join it to the sales journal DataFrame
+    """
+    children = [
+        (re.compile(regex_patterns_dict['set_sjpromo_pattern']),
+         lambda df, entry: prepare_promo_df(df, entry['start_date']), merge_promo_df),
+        (re.compile(regex_patterns_dict['set_sjseg_pattern']),
+         lambda df, entry: aggregate_segments_df(df), merge_segments_df),
+    ]
+    if 'set_sjref_pattern' in regex_patterns_dict:
+        regex_ref = re.compile(regex_patterns_dict['set_sjref_pattern'])
+        if any(regex_ref.match(root) for root in read_plan.keys()):
+            children.append((regex_ref, lambda df, entry: df, merge_ref_df))
+    return children
+
+
+def read_child_file(entry: dict, prepare, dtypes: dict, usecols: list, csv_engine: str) -> DataFrame:
+    """
+    Read a child file of a set, and prepare it for joining to the sales journal
+    :param entry: dictionary of the file details
+    :param prepare: function to prepare the file DataFrame for joining
+    :param dtypes: dtypes to use when reading the file
+    :param usecols: columns to read, or None to read all columns
+    :param csv_engine: csv parse engine to use
+    :return: DataFrame
+    """
+    df = read_data_file(entry['path'], dtype=dtypes, usecols=usecols, engine=csv_engine)
+    df.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
+    return prepare(df, entry)
+
+
+@solid(
+    output_defs=[
+        OutputDefinition(dagster_type=List, name='sets_list', is_optional=False),
+        OutputDefinition(dagster_type=Dict, name='sets_df', is_optional=False),
+    ],
+)
+def merge_promo_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_root: Dict, read_plan: Dict,
+                              regex_patterns: Dict, csv_engine: String):
     """
     Merge the promo file in all import sets
     :param context: execution context
@@ -392,11 +624,12 @@ def merge_promo_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by
                               {'name': filename2_set2, 'path': path including filename2_set2}, ...]}, ... ]
     :param sets_df: dict of DataSet with set ids as key
     :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
     :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
     :return: dict of data with set ids as key and DataSet as value
     """
     count = 0
-    promo_seq_bug_fix_date = datetime(2019, 4, 1)
     regex_patterns_dict = regex_patterns['value']
     regex_item = re.compile(regex_patterns_dict['set_sjpromo_pattern'])
     for set_entry in sets_list:  # dict in list
@@ -404,50 +637,20 @@ def merge_promo_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by
             for entry in set_entry[set_id]:  # DataSet in list
                 if regex_item.search(entry['name']):
 
-                    # get dtypes for file
-                    dtypes = {}
-                    for key in dtypes_by_root.keys():
-                        if regex_item.match(key):
-                            dtypes = dtypes_by_root[key]
-                            break
+                    # get dtypes & columns for file
+                    dtypes = get_root_dtypes(regex_item, dtypes_by_root)
+                    usecols = get_root_read_plan(regex_item, read_plan)
 
                     context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
 
                     # found matching file, read it as DataFrame
-                    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html#pandas.read_csv
-                    df = pd.read_csv(entry['path'], dtype=dtypes)
+                    df = read_data_file(entry['path'], dtype=dtypes, usecols=usecols, engine=csv_engine)
 
                     df.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
 
-                    # there was a bug in the TDP code which generated incorrect SEQUENCE values in promo files prior to
-                    # April 2019. These values need to be corrected by being replaced with 1, as only one promo may be
-                    # applied at a time
-                    if entry['start_date'] < promo_seq_bug_fix_date:
-                        df['SEQUENCE'] = 1
-
-                    # SJ has the following header
-                    # ID,SOURCE,SALESDATE,RESVCODE,RESVCOMPSEQUENCE,ENTRYTYPE,SEQUENCE,RESVCOMPTYPE,RESVCOMPSUBTYPE,DESCRIPTION,REMOTEREFTYPE,REMOTEREFCODE,DOCUMENTED,FARECONSTRUCTION,PROVIDERCODE, CUSTOMERPROFILE,AGENCY,AGENT,DOCTYPE,TRANSACTIONCURRENCYCODE,TRANSACTIONBASEAMOUNT,TRANSACTIONTOTALTAXAMOUNT,ENTITYCURRENCYCODE,ENTITYBASEAMOUNT,ENTITYTOTALTAXAMOUNT, TRANSACTIONMILESAMOUNTPAID,TRANSACTIONMONEYAMOUNTPAID,CUSTOMERTYPE,MARKET,PAYMENTTYPE,TRAVELERTYPE,ENTITYTOTALPROMOTIONAMOUNT,INTERNALAGENT, FIRSTDATEOFTRAVEL,LASTDATEOFTRAVEL,PROVIDERNAME,FEETYPEDESCRIPTION, FEESUBTYPEDESCRIPTION,NONREFUNDABLE,REFERENCEDCOMPONENTTYPE,TRANSACTIONBASEREDEMPTIONAMT,TRANSACTIONBASEREDEMPTIONEQUIV,INVOICED, LOYALTYNUMBER
-                    # SJPromo has the following header
-                    # ID,SALESJOURNALID,SEQUENCE,TRANSACTIONPROMOTIONAMOUNT,ENTITYPROMOTIONAMOUNT,PROMOCODE,EXTERNALPROMOCODE,CERTIFICATE
-
-                    # TODO columns to drop should really be defined in config in sales_data_desc.csv
-                    # ID is not required
-                    df = df.drop(['ID'], axis=1)
-
-                    # SALESJOURNALID,SEQUENCE represents a unique sequence of a row within a SalesJournal, so will be
-                    # used to match SJ entries but is not required in merged DataFrame
-                    # Other column names do not conflict with existing SJ column names
-
-                    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.merge.html#pandas.DataFrame.merge
-                    # merge DataFrame using only keys from left frame, similar to a SQL left outer join &
-                    # preserve key order.
-                    merged = sets_df[set_id].df.merge(df, left_on=['ID', 'SEQUENCE'],
-                                                      right_on=['SALESJOURNALID', 'SEQUENCE'],
-                                                      how='left', suffixes=('_left', '_right'))
-                    # in result SEQUENCE from the right is automatically dropped as its exactly the same as
-                    # SEQUENCE from the left, but SALESJOURNALID from the right is included but not needed
-                    # (same as ID from the left), so drop
-                    merged = merged.drop(['SALESJOURNALID'], axis=1)
+                    df = prepare_promo_df(df, entry['start_date'])
+
+                    merged = merge_promo_df(sets_df[set_id].df, df)
                     sets_df[set_id].df = merged
 
                     context.log.info(f"Merged '{entry['path']}' in data set '{set_id}'")
@@ -467,7 +670,8 @@ def merge_promo_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by
         OutputDefinition(dagster_type=Dict, name='sets_df', is_optional=False),
     ],
 )
-def merge_segs_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_root: Dict, regex_patterns: Dict):
+def merge_segs_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_root: Dict, read_plan: Dict,
+                             regex_patterns: Dict, csv_engine: String):
     """
     Merge the segs file in all import sets
     :param context: execution context
@@ -478,7 +682,9 @@ def merge_segs_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_
                               {'name': filename2_set2, 'path': path including filename2_set2}, ...]}, ... ]
     :param sets_df: dict of DataSet with set ids as key
     :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
     :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
     :return: dict of data with set ids as key and DataSet as value
     """
     count = 0
@@ -489,77 +695,472 @@ def merge_segs_csv_file_sets(context, sets_list: List, sets_df: Dict, dtypes_by_
             for entry in set_entry[set_id]:  # DataSet in list
                 if regex_item.search(entry['name']):
 
-                    # get dtypes for file
-                    dtypes = {}
-                    for key in dtypes_by_root.keys():
-                        if regex_item.match(key):
-                            dtypes = dtypes_by_root[key]
-                            break
+                    # get dtypes & columns for file
+                    dtypes = get_root_dtypes(regex_item, dtypes_by_root)
+                    usecols = get_root_read_plan(regex_item, read_plan)
 
                     context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
 
                     # found matching file, read it as DataFrame
-                    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html#pandas.read_csv
-                    df = pd.read_csv(entry['path'], dtype=dtypes)
+                    df = read_data_file(entry['path'], dtype=dtypes, usecols=usecols, engine=csv_engine)
 
                     df.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
 
-                    # SJ has the following header
-                    # ID,SOURCE,SALESDATE,RESVCODE,RESVCOMPSEQUENCE,ENTRYTYPE,SEQUENCE,RESVCOMPTYPE,RESVCOMPSUBTYPE,DESCRIPTION,REMOTEREFTYPE,REMOTEREFCODE,DOCUMENTED,FARECONSTRUCTION,PROVIDERCODE, CUSTOMERPROFILE,AGENCY,AGENT,DOCTYPE,TRANSACTIONCURRENCYCODE,TRANSACTIONBASEAMOUNT,TRANSACTIONTOTALTAXAMOUNT,ENTITYCURRENCYCODE,ENTITYBASEAMOUNT,ENTITYTOTALTAXAMOUNT, TRANSACTIONMILESAMOUNTPAID,TRANSACTIONMONEYAMOUNTPAID,CUSTOMERTYPE,MARKET,PAYMENTTYPE,TRAVELERTYPE,ENTITYTOTALPROMOTIONAMOUNT,INTERNALAGENT, FIRSTDATEOFTRAVEL,LASTDATEOFTRAVEL,PROVIDERNAME,FEETYPEDESCRIPTION, FEESUBTYPEDESCRIPTION,NONREFUNDABLE,REFERENCEDCOMPONENTTYPE,TRANSACTIONBASEREDEMPTIONAMT,TRANSACTIONBASEREDEMPTIONEQUIV,INVOICED, LOYALTYNUMBER
-                    # SJSeg has the following header
-                    # ID,SALESJOURNALID,ORIGINCODE,DESTINATIONCODE,OPERATINGCARRIER,MARKETINGCARRIER,FAREFAMILY,FLIGHTSEQUENCE,BOOKINGCLASS,FLIGHTNUMBER
+                    context.log.debug(f"Start segments aggregation for data set '{set_id}'")
 
-                    # combine origin & destination
-                    df['SEG'] = df['ORIGINCODE'] + '-' + df['DESTINATIONCODE']
+                    segments = aggregate_segments_df(df)
 
-                    # ID is not required
-                    df = df.drop(['ID', 'ORIGINCODE', 'DESTINATIONCODE'], axis=1)
+                    context.log.debug(f"Start df.merge dfs for data set '{set_id}'")
 
-                    # SALESJOURNALID represents a unique row within a SalesJournal, so will be
-                    # used to match SJ entries but is not required in merged DataFrame
-                    # Other column names do not conflict with existing SJ column names
+                    merged = merge_segments_df(sets_df[set_id].df, segments)
+                    sets_df[set_id].df = merged
 
-                    df.sort_values(by=['SALESJOURNALID', 'FLIGHTSEQUENCE'], inplace=True)
+                    context.log.info(f"Merged '{entry['path']}' in data set '{set_id}'")
 
-                    context.log.debug(f"Start df.groupby segments for data set '{set_id}'")
+                    count += 1
+                    break
 
-                    # series of combined segments with salesjournalid as index
-                    segments = df.groupby(['SALESJOURNALID'])['SEG']. \
-                        apply(lambda segs: segs.str.cat(sep=','))
+    context.log.info(f'{count} segs DataFrames merged from {len(sets_list)} data sets')
 
-                    context.log.debug(f"Start df.merge segments for data set '{set_id}'")
+    yield Output(sets_list, 'sets_list')
+    yield Output(sets_df, 'sets_df')
 
-                    # dataframe with multiple rows for sales with multiple segments
-                    segments = df.merge(segments.to_frame(), left_on=['SALESJOURNALID'], right_index=True,
-                                        how='left', suffixes=('_left', '_right'))
 
-                    segments = segments.drop(['FLIGHTSEQUENCE', 'SEG_left'], axis=1)
-                    segments = segments.rename(columns={'SEG_right': 'SEGMENTS'})
+def group_file_sets(files_lst: list, prev_uploaded: DataFrame, regex_patterns_dict: dict, hash_workers: int,
+                    log) -> list:
+    """
+    Group all files into import sets, discarding incomplete & inconsistent sets and previously loaded sets
+    :param files_lst: list of dictionaries of file details;
+                {'name': filename, 'path': path including filename,
+                 'start_date': start date in filename, 'end_date': end date in filename}
+    :param prev_uploaded: details of previously loaded data sets
+    :param regex_patterns_dict: dict of regex pattern representing filenames and file sets
+    :param hash_workers: number of threads used to hash the contents of duplicated files
+    :param log: logger
+    :return: list of, dictionaries of dictionaries of all the files in an import set, as returned by
+             create_csv_file_sets()
+    :rtype: list
+    """
+    required_elements = regex_patterns_dict['set_required_elements']
+
+    df, counts = tally_file_sets(files_lst, regex_patterns_dict)
+    if df is None:
+        log.info('0 data set(s) identified')
+        return []
+    columns = [column for column in df.columns if column != 'set' and column not in required_elements]
+
+    log.info(f'{len(counts)} data set(s) identified')
+
+    # pick one copy of any duplicated files, e.g. csv & gz copies of the same file, in sets yet to be loaded
+    duplicated = (counts[required_elements] >= 1).all(axis=1) & (counts[required_elements] > 1).any(axis=1)
+    if prev_uploaded is not None and len(prev_uploaded) > 0:
+        duplicated &= ~counts.index.isin(prev_uploaded['fileset'])
+    if duplicated.any():
+        df, counts = dedupe_file_sets(df, counts.index[duplicated], required_elements, hash_workers, log)
+
+    complete = counts['total'] == len(required_elements)
+    consistent = complete & (counts[required_elements] == 1).all(axis=1)
+    for set_id in counts.index[~complete]:
+        log.info(f"Discarding incomplete data set '{set_id}': {counts.loc[set_id].to_dict()}")
+    for set_id in counts.index[complete & ~consistent]:
+        log.info(f"Discarding inconsistent data set '{set_id}': {counts.loc[set_id].to_dict()}")
+
+    set_links = counts.index[consistent]
+    if prev_uploaded is not None and len(prev_uploaded) > 0:
+        # hashed anti-join against the previously loaded sets
+        uploaded = set_links.isin(prev_uploaded['fileset'])
+        for set_id in set_links[uploaded]:
+            log.info(f'Ignoring previously loaded data set: {set_id}')
+        set_links = set_links[~uploaded]
+
+    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_dict.html
+    groups = df[df['set'].isin(set_links)].groupby('set', sort=False)
+    sets_list = [{set_id: set_entity[columns].to_dict('records')} for set_id, set_entity in groups]
 
-                    segments.drop_duplicates(subset='SALESJOURNALID', keep='first', inplace=True)
-                    segments = segments.reset_index(drop=True)
+    return sets_list
 
-                    context.log.debug(f"Start df.merge dfs for data set '{set_id}'")
 
-                    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.merge.html#pandas.DataFrame.merge
-                    # merge DataFrame using only keys from left frame, similar to a SQL left outer join &
-                    # preserve key order.
-                    merged = sets_df[set_id].df.merge(segments,
-                                                      left_on=['ID'],
-                                                      right_on=['SALESJOURNALID'],
-                                                      how='left', suffixes=('_left', '_right'))
-                    # SALESJOURNALID from the right is included but not needed
-                    # (same as ID from the left), so drop
-                    merged = merged.drop(['SALESJOURNALID'], axis=1)
+def tally_file_sets(files_lst: list, regex_patterns_dict: dict) -> tuple:
+    """
+    Count the files matching each required element of all import sets
+    :param files_lst: list of dictionaries of file details;
+                {'name': filename, 'path': path including filename,
+                 'start_date': start date in filename, 'end_date': end date in filename}
+    :param regex_patterns_dict: dict of regex pattern representing filenames and file sets
+    :return: tuple of DataFrame of the files in sets, with a column with the set link and a column per required element
+             flagging the files matching it, and DataFrame of the counts of files matching each required element, plus
+             a 'total' column, with the set link as the index in order of appearance; or (None, None) if no files
+    :rtype: tuple
+    """
+    required_elements = regex_patterns_dict['set_required_elements']
 
-                    sets_df[set_id].df = merged
+    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.from_records.html#pandas.DataFrame.from_records
+    df = pd.DataFrame.from_records(files_lst)
+    if len(df) == 0:
+        return None, None
 
-                    context.log.info(f"Merged '{entry['path']}' in data set '{set_id}'")
+    # only files matching set pattern
+    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.Series.str.contains.html
+    df = df[df['name'].str.contains(regex_patterns_dict['set_common_pattern'])].copy()
 
-                    count += 1
-                    break
+    # add a column with the set link, and a column per required element flagging the files matching it
+    df['set'] = df['name'].str.extract(regex_patterns_dict['set_link_pattern'], expand=False)
+    df = df[df['set'].notna()]
+    for pattern in required_elements:
+        df[pattern] = df['name'].str.contains(regex_patterns_dict[pattern])
 
-    context.log.info(f'{count} segs DataFrames merged from {len(sets_list)} data sets')
+    # count of files matching each required element per set, in order of appearance
+    counts = df.groupby('set', sort=False)[required_elements].sum()
+    counts['total'] = counts.sum(axis=1)
 
-    yield Output(sets_list, 'sets_list')
-    yield Output(sets_df, 'sets_df')
+    return df, counts
+
+
+def dedupe_file_sets(df: DataFrame, set_ids, required_elements: list, hash_workers: int, log=None) -> tuple:
+    """
+    Remove duplicate copies of files from import sets. Where all the files matching a required element of a set have the
+    same contents, e.g. csv & gz copies of the same file, only the copy which is cheapest to read is kept. Files with
+    different contents are left, so the set is discarded as inconsistent
+    :param df: DataFrame of the files in sets, as returned by tally_file_sets()
+    :param set_ids: ids of sets to remove duplicates from
+    :param required_elements: names of the regex patterns of the required elements of a set
+    :param hash_workers: number of threads used to hash file contents
+    :param log: logger
+    :return: tuple of DataFrame of the files in sets, and DataFrame of the counts of files matching each required
+             element per set, as returned by tally_file_sets()
+    :rtype: tuple
+    """
+    in_sets = df['set'].isin(set_ids)
+    duplicates = []     # lists of the indices of the copies of a file
+    for pattern in required_elements:
+        matching = df[in_sets & df[pattern]]
+        duplicates.extend([group.index.tolist() for _, group in matching.groupby('set', sort=False) if len(group) > 1])
+
+    hashes = hash_files(df.loc[[idx for copies in duplicates for idx in copies], 'path'].tolist(), workers=hash_workers)
+
+    drop = []
+    for copies in duplicates:
+        paths = df.loc[copies, 'path']
+        copy_hashes = set([hashes[path] for path in paths])
+        if None in copy_hashes:
+            if log is not None:
+                log.warn(f'Unable to compare copies of file: {paths.tolist()}')
+        elif len(copy_hashes) == 1:
+            keep = min(copies, key=lambda idx: read_cost(paths[idx]))
+            drop.extend([idx for idx in copies if idx != keep])
+            if log is not None:
+                log.info(f"Using '{paths[keep]}', ignoring identical copies: "
+                         f"{[paths[idx] for idx in copies if idx != keep]}")
+        elif log is not None:
+            log.warn(f'Copies of file have different contents: {paths.tolist()}')
+
+    df = df.drop(index=drop)
+    counts = df.groupby('set', sort=False)[required_elements].sum()
+    counts['total'] = counts.sum(axis=1)
+
+    return df, counts
+
+
+def get_root_dtypes(regex_item, dtypes_by_root: dict) -> dict:
+    """
+    Get the dtypes to use when reading a file
+    :param regex_item: compiled regex matching the file type
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :return: dtypes dict
+    """
+    dtypes = {}
+    for key in dtypes_by_root.keys():
+        if regex_item.match(key):
+            dtypes = dtypes_by_root[key]
+            break
+    return dtypes
+
+
+def get_root_read_plan(regex_item, read_plan: dict) -> list:
+    """
+    Get the columns to read from a file
+    :param regex_item: compiled regex matching the file type
+    :param read_plan: dict of column name lists with root table identifier as the key
+    :return: list of column names, or None if all columns are to be read
+    """
+    usecols = None
+    for key in read_plan.keys():
+        if regex_item.match(key):
+            usecols = read_plan[key]
+            break
+    return usecols
+
+
+def filter_sj_df(context, df: DataFrame, prev_uploaded: DataFrame, uploaded_ids: dict) -> DataFrame:
+    """
+    Filter a sales journal DataFrame, removing non-USD and previously uploaded entries
+    :param context: execution context
+    :param df: sales journal DataFrame
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :return: filtered DataFrame
+    """
+    min_sj_pk_value = uploaded_ids['min_sj_pk_value']
+    max_sj_pk_value = uploaded_ids['max_sj_pk_value']
+
+    # remove non-USD entity amounts which shouldn't be in the data, can replace once currency
+    # functionality is completely implemented
+    pre_len = len(df)
+    df = df[df['ENTITYCURRENCYCODE'] == 'USD']
+    post_len = len(df)
+    if pre_len > post_len:
+        context.log.info(f"Removed '{pre_len-post_len}' non-USD ENTITYCURRENCYCODE")
+
+    df.sort_values(by=['ID'], inplace=True)
+
+    # filter previously uploaded
+    if prev_uploaded is not None and len(prev_uploaded) > 0:
+        duplicated = 0
+        if len(df) > 0:
+
+            min_id = df['ID'].min()
+            if min_id < min_sj_pk_value:
+                raise ValueError(f'Minimum id value {min_id} out of range')
+            max_id = df['ID'].max()
+            if max_id > max_sj_pk_value:
+                raise ValueError(f'Maximum id value {max_id} out of range')
+
+            pre_len = len(df)
+            # flags for intersection of previously uploaded and df being
+            prev_matches = uploaded_id_flags(uploaded_ids, df['ID'].values)
+
+            df = df[~prev_matches]
+            duplicated += (pre_len - len(df))
+
+            # add new ids to uploaded check
+            mark_uploaded_ids(uploaded_ids, df['ID'].values)
+
+        if duplicated > 0:
+            context.log.info(f'Removed {duplicated} previously uploaded records')
+
+    return df
+
+
+def uploaded_id_flags(uploaded_ids: dict, id_values) -> np.ndarray:
+    """
+    Check which sales_data primary keys are recorded as uploaded
+    :param uploaded_ids: sales_data primary keys
+    :param id_values: array-like of primary keys
+    :return: numpy array of flags, True if the corresponding key is recorded as uploaded
+    """
+    ids = uploaded_ids['ids']
+    offsets = np.asarray(id_values, dtype=np.int64) - uploaded_ids['min_sj_pk_value']
+    shifts = _bit_shifts(ids, offsets)
+    # view the bitarray buffer as bytes, so all keys are checked in one go
+    buffer = np.frombuffer(ids, dtype=np.uint8)
+    return ((buffer[offsets >> 3] >> shifts) & 1).astype(bool)
+
+
+def mark_uploaded_ids(uploaded_ids: dict, id_values):
+    """
+    Record sales_data primary keys as uploaded
+    :param uploaded_ids: sales_data primary keys
+    :param id_values: array-like of primary keys
+    """
+    ids = uploaded_ids['ids']
+    offsets = np.asarray(id_values, dtype=np.int64) - uploaded_ids['min_sj_pk_value']
+    shifts = _bit_shifts(ids, offsets)
+    buffer = np.frombuffer(ids, dtype=np.uint8)
+    np.bitwise_or.at(buffer, offsets >> 3, (np.uint8(1) << shifts.astype(np.uint8)))
+
+
+def _bit_shifts(ids, offsets: np.ndarray) -> np.ndarray:
+    endian = ids.endian() if callable(ids.endian) else ids.endian
+    bits = offsets & 7
+    return 7 - bits if endian == 'big' else bits
+
+
+def prepare_promo_df(df: DataFrame, start_date: datetime) -> DataFrame:
+    """
+    Prepare a promo DataFrame for merging into the sales journal
+    :param df: promo DataFrame
+    :param start_date: start date of the data set
+    :return: promo DataFrame
+    """
+    # there was a bug in the TDP code which generated incorrect SEQUENCE values in promo files prior to
+    # April 2019. These values need to be corrected by being replaced with 1, as only one promo may be
+    # applied at a time
+    if start_date < PROMO_SEQ_BUG_FIX_DATE:
+        df['SEQUENCE'] = 1
+
+    # SJ has the following header
+    # ID,SOURCE,SALESDATE,RESVCODE,RESVCOMPSEQUENCE,ENTRYTYPE,SEQUENCE,RESVCOMPTYPE,RESVCOMPSUBTYPE,DESCRIPTION,REMOTEREFTYPE,REMOTEREFCODE,DOCUMENTED,FARECONSTRUCTION,PROVIDERCODE, CUSTOMERPROFILE,AGENCY,AGENT,DOCTYPE,TRANSACTIONCURRENCYCODE,TRANSACTIONBASEAMOUNT,TRANSACTIONTOTALTAXAMOUNT,ENTITYCURRENCYCODE,ENTITYBASEAMOUNT,ENTITYTOTALTAXAMOUNT, TRANSACTIONMILESAMOUNTPAID,TRANSACTIONMONEYAMOUNTPAID,CUSTOMERTYPE,MARKET,PAYMENTTYPE,TRAVELERTYPE,ENTITYTOTALPROMOTIONAMOUNT,INTERNALAGENT, FIRSTDATEOFTRAVEL,LASTDATEOFTRAVEL,PROVIDERNAME,FEETYPEDESCRIPTION, FEESUBTYPEDESCRIPTION,NONREFUNDABLE,REFERENCEDCOMPONENTTYPE,TRANSACTIONBASEREDEMPTIONAMT,TRANSACTIONBASEREDEMPTIONEQUIV,INVOICED, LOYALTYNUMBER
+    # SJPromo has the following header
+    # ID,SALESJOURNALID,SEQUENCE,TRANSACTIONPROMOTIONAMOUNT,ENTITYPROMOTIONAMOUNT,PROMOCODE,EXTERNALPROMOCODE,CERTIFICATE
+
+    # ID is not required, and is not read unless the read plan includes it
+    df = df.drop(['ID'], axis=1, errors='ignore')
+
+    # SALESJOURNALID,SEQUENCE represents a unique sequence of a row within a SalesJournal, so will be
+    # used to match SJ entries but is not required in merged DataFrame
+    # Other column names do not conflict with existing SJ column names
+    return df
+
+
+def merge_promo_df(sj_df: DataFrame, promo_df: DataFrame) -> DataFrame:
+    """
+    Merge a prepared promo DataFrame into a sales journal DataFrame
+    :param sj_df: sales journal DataFrame
+    :param promo_df: promo DataFrame
+    :return: merged DataFrame
+    """
+    # similar to a SQL left outer join on ID & SEQUENCE, preserving the sales journal order. SALESJOURNALID & SEQUENCE
+    # from the right are not included as they are the same as ID & SEQUENCE from the left
+    indexer = sorted_join_indexer(sj_df['ID'].to_numpy(), promo_df['SALESJOURNALID'].to_numpy(),
+                                  sj_df['SEQUENCE'].to_numpy(), promo_df['SEQUENCE'].to_numpy())
+    if indexer is None:
+        # ids aren't unique, so a row may match several promos
+        merged = sj_df.merge(promo_df, left_on=['ID', 'SEQUENCE'],
+                             right_on=['SALESJOURNALID', 'SEQUENCE'],
+                             how='left', suffixes=('_left', '_right'))
+        return merged.drop(['SALESJOURNALID'], axis=1)
+    return attach_columns(sj_df, promo_df, indexer, ['SALESJOURNALID', 'SEQUENCE'])
+
+
+def sorted_join_indexer(left_ids: np.ndarray, right_ids: np.ndarray, left_keys: np.ndarray = None,
+                        right_keys: np.ndarray = None) -> np.ndarray:
+    """
+    Match the rows of a child DataFrame to the rows of a parent DataFrame with unique ids, by searching for the child
+    ids in the sorted parent ids. Sales journal DataFrames are sorted by ID when they are read, so the parent ids don't
+    normally need to be sorted
+    :param left_ids: parent ids
+    :param right_ids: child ids
+    :param left_keys: optional secondary parent key, which must also match
+    :param right_keys: optional secondary child key
+    :return: array of the position of the first matching child row for each parent row, or -1 if no match; None if the
+             parent ids aren't unique
+    """
+    count = len(left_ids)
+    indexer = np.full(count, -1, dtype=np.intp)
+    if count == 0 or len(right_ids) == 0:
+        return indexer
+
+    sorter = None
+    sorted_ids = left_ids
+    if (left_ids[1:] < left_ids[:-1]).any():
+        sorter = np.argsort(left_ids, kind='stable')
+        sorted_ids = left_ids[sorter]
+    if (sorted_ids[1:] == sorted_ids[:-1]).any():
+        return None
+
+    positions = np.minimum(np.searchsorted(sorted_ids, right_ids), count - 1)
+    right_rows = np.flatnonzero(sorted_ids[positions] == right_ids)
+    left_rows = positions[right_rows] if sorter is None else sorter[positions[right_rows]]
+    if left_keys is not None:
+        matched = left_keys[left_rows] == right_keys[right_rows]
+        right_rows = right_rows[matched]
+        left_rows = left_rows[matched]
+
+    # first matching child row for each parent row
+    left_rows, first = np.unique(left_rows, return_index=True)
+    indexer[left_rows] = right_rows[first]
+    return indexer
+
+
+def attach_columns(df: DataFrame, child_df: DataFrame, indexer: np.ndarray, exclude: list) -> DataFrame:
+    """
+    Add the columns of a child DataFrame to a DataFrame, without copying the existing columns. Rows without a matching
+    child row are filled with NaN, as in a left join
+    :param df: DataFrame to add columns to
+    :param child_df: child DataFrame
+    :param indexer: position of the child row for each row of df, or -1 if no match
+    :param exclude: child columns not to add, e.g. join keys
+    :return: new DataFrame with the columns of df, the added columns and a default index, as returned by
+             DataFrame.merge()
+    """
+    # shallow copy, so df may be a filtered slice without later updates raising a SettingWithCopyWarning
+    df = df.copy(deep=False)
+    for column in child_df.columns:
+        if column in exclude:
+            continue
+        values = pd.api.extensions.take(child_df[column].array if is_extension_array_dtype(child_df[column].dtype)
+                                        else child_df[column].to_numpy(), indexer, allow_fill=True)
+        name = column
+        if column in df.columns:
+            df.rename(columns={column: f'{column}_left'}, inplace=True)
+            name = f'{column}_right'
+        df.insert(len(df.columns), name, values)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def aggregate_segments_df(df: DataFrame) -> DataFrame:
+    """
+    Aggregate a segs DataFrame to one row per sales journal id, with the combined segments in a SEGMENTS column
+    :param df: segs DataFrame
+    :return: segments DataFrame
+    """
+    # SJSeg has the following header
+    # ID,SALESJOURNALID,ORIGINCODE,DESTINATIONCODE,OPERATINGCARRIER,MARKETINGCARRIER,FAREFAMILY,FLIGHTSEQUENCE,BOOKINGCLASS,FLIGHTNUMBER
+
+    # combine origin & destination
+    df['SEG'] = df['ORIGINCODE'] + '-' + df['DESTINATIONCODE']
+
+    # ID is not required, and is not read unless the read plan includes it
+    df = df.drop(['ID', 'ORIGINCODE', 'DESTINATIONCODE'], axis=1, errors='ignore')
+
+    # SALESJOURNALID represents a unique row within a SalesJournal, so will be
+    # used to match SJ entries but is not required in merged DataFrame
+    # Other column names do not conflict with existing SJ column names
+
+    df.sort_values(by=['SALESJOURNALID', 'FLIGHTSEQUENCE'], inplace=True)
+
+    # one row per sales journal id, from the first flight
+    keys = df['SALESJOURNALID'].to_numpy()
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) > 0 else \
+        np.empty(0, dtype=np.intp)
+    segments = df.iloc[starts].drop(['FLIGHTSEQUENCE', 'SEG'], axis=1)
+
+    # combine the segments of each id in a single pass, by summing 'seg,' strings between the group boundaries;
+    # missing segments are omitted
+    seg = df['SEG']
+    pieces = np.where(seg.isna().to_numpy(), '', (seg + ',').to_numpy(dtype=object)).astype(object)
+    combined = np.add.reduceat(pieces, starts) if len(starts) > 0 else np.empty(0, dtype=object)
+    segments['SEGMENTS'] = pd.Series(combined, index=segments.index, dtype=object).str[:-1]
+
+    return segments.reset_index(drop=True)
+
+
+def merge_segments_df(sj_df: DataFrame, segments: DataFrame) -> DataFrame:
+    """
+    Merge an aggregated segments DataFrame into a sales journal DataFrame
+    :param sj_df: sales journal DataFrame
+    :param segments: segments DataFrame
+    :return: merged DataFrame
+    """
+    return merge_on_sj_id(sj_df, segments)
+
+
+def merge_ref_df(sj_df: DataFrame, ref_df: DataFrame) -> DataFrame:
+    """
+    Merge a ref DataFrame into a sales journal DataFrame
+    :param sj_df: sales journal DataFrame
+    :param ref_df: ref DataFrame
+    :return: merged DataFrame
+    """
+    return merge_on_sj_id(sj_df, ref_df)
+
+
+def merge_on_sj_id(sj_df: DataFrame, child_df: DataFrame) -> DataFrame:
+    """
+    Merge a child DataFrame with one row per sales journal id into a sales journal DataFrame
+    :param sj_df: sales journal DataFrame
+    :param child_df: child DataFrame
+    :return: merged DataFrame
+    """
+    # similar to a SQL left outer join on ID, preserving the sales journal order. SALESJOURNALID from the right is not
+    # included as it is the same as ID from the left
+    indexer = sorted_join_indexer(sj_df['ID'].to_numpy(), child_df['SALESJOURNALID'].to_numpy())
+    if indexer is None:
+        # ids aren't unique
+        merged = sj_df.merge(child_df,
+                             left_on=['ID'],
+                             right_on=['SALESJOURNALID'],
+                             how='left', suffixes=('_left', '_right'))
+        return merged.drop(['SALESJOURNALID'], axis=1)
+    return attach_columns(sj_df, child_df, indexer, ['SALESJOURNALID'])
@@ -131,7 +131,7 @@ def upload_sales_table(context, sets_df: Dict, insert_columns: String, table_nam
             # insert data sql
             for set_id in sets_df.keys():
                 data_set = sets_df[set_id]
-                tuples = [tuple(x) for x in data_set.df.values]
+                tuples = df_to_tuples(data_set.df)
 
                 if len(tuples) > 0:
                     cursor = client.cursor()
@@ -193,6 +193,17 @@ def upload_sales_table(context, sets_df: Dict, insert_columns: String, table_nam
     return results
 
 
+def df_to_tuples(df: DataFrame) -> list:
+    """
+    Convert a DataFrame to a list of tuples for upload
+    :param df: DataFrame to convert
+    :return: list of tuples
+    """
+    # iterate by column rather than via DataFrame.values, which would first copy the whole frame, including any
+    # categorical columns, into a single object array
+    return list(df.itertuples(index=False, name=None))
+
+
 @composite_solid()
 def query_sales_data(sql: String) -> Optional[DataFrame]:
     """
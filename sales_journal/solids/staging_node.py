@@ -0,0 +1,130 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import re
+
+from dagster_pandas import DataFrame
+from dagster import (
+    solid,
+    String,
+    List,
+    Dict,
+    OutputDefinition,
+    Output,
+    Optional
+)
+
+from .read_cvs_node import filter_sj_df
+from sales_journal.misc_sj import DataSet, get_staging_cache
+
+
+@solid(
+    output_defs=[
+        OutputDefinition(dagster_type=List, name='sets_list', is_optional=False),
+        OutputDefinition(dagster_type=Dict, name='staged_sets', is_optional=False),
+    ],
+)
+def load_staged_file_sets(context, sets_list: List, prev_uploaded: Optional[DataFrame], uploaded_ids: Dict,
+                          staging_cache: Dict, sales_data_desc: String, regex_patterns: Dict):
+    """
+    Load previously transformed file sets from the staging cache
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set;
+                 [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
+                             {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
+                   {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
+                              {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :param staging_cache: staging cache configuration
+    :param sales_data_desc: path to file containing details of the database table
+    :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :return: list of the sets not in the cache, and dict of DataSet of the staged sets with set ids as key
+    """
+    cache = get_staging_cache(staging_cache['value'])
+    regex_sj = re.compile(regex_patterns['value']['set_sj_pattern'])
+
+    staged_sets = {}
+    unstaged_list = []
+    for set_entry in sets_list:  # dict in list
+        for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+            df = None
+            if cache is not None:
+                df = cache.load(cache.fingerprint(set_entry[set_id], sales_data_desc))
+
+            if df is None:
+                unstaged_list.append(set_entry)
+            else:
+                context.log.info(f"Loaded data set '{set_id}' from staging cache")
+
+                # records may have been uploaded since the set was staged
+                df = filter_sj_df(context, df, prev_uploaded, uploaded_ids)
+
+                for entry in set_entry[set_id]:  # dict in list
+                    if regex_sj.search(entry['name']):
+                        staged_sets[set_id] = DataSet(entry['name'], entry['path'], start_date=entry['start_date'],
+                                                      end_date=entry['end_date'], df=df,
+                                                      min_id=df['ID'].min(), max_id=df['ID'].max())
+                        break
+
+    if cache is not None:
+        context.log.info(f'{len(staged_sets)} data sets loaded from staging cache, '
+                         f'{len(unstaged_list)} to be read')
+
+    yield Output(unstaged_list, 'sets_list')
+    yield Output(staged_sets, 'staged_sets')
+
+
+@solid()
+def stage_file_sets(context, sets_list: List, sets_df: Dict, staged_sets: Dict, prev_uploaded: Optional[DataFrame],
+                    uploaded_ids: Dict, staging_cache: Dict, sales_data_desc: String) -> Dict:
+    """
+    Save transformed file sets to the staging cache, remove previously uploaded entries from them, and combine them
+    with the sets loaded from the cache. Sets are saved before the previously uploaded entries are removed, as
+    whether an entry is uploaded may change before the set is next loaded from the cache. Without a cache, the
+    previously uploaded entries have already been removed when the sets were read
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set
+    :param sets_df: dict of DataSet of the transformed sets with set ids as key
+    :param staged_sets: dict of DataSet of the sets loaded from the staging cache with set ids as key
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :param staging_cache: staging cache configuration
+    :param sales_data_desc: path to file containing details of the database table
+    :return: dict of DataSet of all sets with set ids as key
+    """
+    cache = get_staging_cache(staging_cache['value'])
+    for set_entry in sets_list:  # dict in list
+        for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+            if set_id in sets_df:
+                data_set = sets_df[set_id]
+                if cache is not None:
+                    cache.save(cache.fingerprint(set_entry[set_id], sales_data_desc), data_set.df)
+                    context.log.info(f"Saved data set '{set_id}' to staging cache")
+
+                    data_set.df = filter_sj_df(context, data_set.df, prev_uploaded, uploaded_ids)
+                    data_set.min_id = data_set.df['ID'].min()
+                    data_set.max_id = data_set.df['ID'].max()
+
+    all_sets = dict(staged_sets)
+    all_sets.update(sets_df)
+    return all_sets
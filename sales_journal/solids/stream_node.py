@@ -0,0 +1,390 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from dagster_pandas import DataFrame
+from dagster import (
+    solid,
+    String,
+    List,
+    Dict,
+    Int,
+    Field,
+    Bool,
+    Optional
+)
+from psycopg2.extras import execute_values
+
+from .read_cvs_node import (
+    get_root_dtypes,
+    get_root_read_plan,
+    filter_sj_df,
+    get_child_joins,
+    read_child_file,
+)
+from .process_node import transform_set_df
+from sales_journal.misc_sj import (
+    iter_data_file,
+    get_memory_governor,
+    ExternalSorter,
+    get_external_sorter,
+    is_file_sorted,
+)
+from .sales_table import df_to_tuples
+
+
+class OrderedChildStream:
+    """
+    Reader for a child file of a set, which reads the file in step with the chunks of the sales journal file. The file
+    is checked to be in SALESJOURNALID order before any rows are taken, so only the rows for the id range of the
+    current sales journal chunk are held in memory. If the file isn't in id order, it is sorted on disk if it's large
+    enough for the external sorter, otherwise the whole file is read. If the sales journal chunks turn out not to be
+    in id order, the whole file is read
+    :param entry: dictionary of the file details
+    :param prepare: function to prepare the file DataFrame for joining
+    :param dtypes: dtypes to use when reading the file
+    :param usecols: columns to read, or None to read all columns
+    :param csv_engine: csv parse engine to use
+    :param chunk_size: number of rows to read at a time
+    :param sorter: external sorter, or None to never sort the file on disk
+    """
+
+    def __init__(self, entry: dict, prepare, dtypes: dict, usecols: list, csv_engine: str, chunk_size: int,
+                 sorter=None):
+        self.entry = entry
+        self._prepare = prepare
+        self._dtypes = dtypes
+        self._usecols = usecols
+        self._csv_engine = csv_engine
+        self._chunk_size = chunk_size
+        self._sorter = sorter
+        self._sorted_path = None    # file sorted on disk
+        self._chunks = None
+        self._pending = None        # rows read from the file but not yet taken
+        self._empty = None          # DataFrame with the file columns & no rows
+        self._last_id = None        # last id read from the file
+        self._max_taken = None      # max id of the last range taken
+        self._full_df = None        # whole file, prepared & sorted by id, if not streaming
+        self._full_ids = None       # ids of the whole file
+        self.fallback = None        # how the file is read, if it can't be streamed as is
+
+        # check the order up front, as rows for earlier chunks may already be uploaded when disorder is found
+        if is_file_sorted(entry['path'], ['SALESJOURNALID'], chunk_size, dtype=dtypes, engine=csv_engine):
+            self._chunks = iter_data_file(entry['path'], chunk_size, dtype=dtypes, usecols=usecols,
+                                          engine=csv_engine)
+        elif sorter is not None and sorter.applies(entry['path']):
+            self._sort_on_disk()
+        else:
+            self._read_all('reading all of the file, as it is not in SALESJOURNALID order')
+
+    def take(self, min_id, max_id) -> DataFrame:
+        """
+        Get the prepared rows of the file for a range of sales journal ids. Ranges must be taken in ascending order
+        :param min_id: min sales journal id
+        :param max_id: max sales journal id
+        :return: DataFrame
+        """
+        if self._full_df is None and self._max_taken is not None and min_id <= self._max_taken:
+            self._read_all('reading all of the file, as the sales journal chunks are not in ID order')
+        self._max_taken = max_id
+
+        parts = []
+        while self._full_df is None:
+            if self._pending is None:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                chunk.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
+                if self._empty is None:
+                    self._empty = chunk.iloc[:0]
+                ids = chunk['SALESJOURNALID'].to_numpy()
+                if len(ids) == 0:
+                    continue
+                if (ids[1:] < ids[:-1]).any() or (self._last_id is not None and ids[0] < self._last_id):
+                    # rows for earlier ranges may have been missed, so the ranges taken so far are invalid
+                    raise IOError(f"'{self.entry['path']}' is no longer in SALESJOURNALID order")
+                self._last_id = ids[-1]
+                self._pending = chunk
+
+            ids = self._pending['SALESJOURNALID'].to_numpy()
+            start = np.searchsorted(ids, min_id, side='left')
+            end = np.searchsorted(ids, max_id, side='right')
+            if start < end:
+                parts.append(self._pending.iloc[start:end])
+            if end < len(ids):
+                self._pending = self._pending.iloc[end:]
+                break
+            self._pending = None
+
+        if self._full_df is not None:
+            start = np.searchsorted(self._full_ids, min_id, side='left')
+            end = np.searchsorted(self._full_ids, max_id, side='right')
+            return self._full_df.iloc[start:end]
+        if self._empty is None:
+            # no rows in the file
+            self._read_all(None)
+            return self._full_df
+        return self._prepare(pd.concat(parts if len(parts) > 0 else [self._empty]), self.entry)
+
+    def close(self):
+        """
+        Stop reading the file, and remove any sorted copy of it
+        """
+        if self._chunks is not None:
+            self._chunks.close()
+        if self._sorted_path is not None:
+            self._sorter.remove(self._sorted_path)
+            self._sorted_path = None
+
+    def _sort_on_disk(self):
+        """
+        Sort the file on disk by SALESJOURNALID, and stream the sorted file instead
+        """
+        self.fallback = 'sorting the file on disk, as it is not in SALESJOURNALID order'
+        self._sorted_path = self._sorter.sort(self.entry['path'], ['SALESJOURNALID'], dtype=self._dtypes,
+                                              usecols=self._usecols, engine=self._csv_engine)
+        if self._sorted_path is None:
+            # file changed since it was read
+            self._read_all('reading all of the file, as it is not in SALESJOURNALID order')
+        else:
+            self._chunks = iter_data_file(self._sorted_path, self._chunk_size, dtype=self._dtypes,
+                                          engine=self._csv_engine)
+
+    def _read_all(self, reason):
+        """
+        Read the whole file, for when it can't be streamed
+        :param reason: reason the file can't be streamed
+        """
+        self.fallback = reason
+        self.close()
+        self._pending = None
+        df = read_child_file(self.entry, self._prepare, self._dtypes, self._usecols, self._csv_engine)
+        self._full_df = df.sort_values(by=['SALESJOURNALID'], kind='stable')
+        self._full_ids = self._full_df['SALESJOURNALID'].to_numpy()
+
+
+@solid(required_resource_keys={'postgres_warehouse'},
+       config={
+           'fatal': Field(
+               Bool,
+               default_value=True,
+               is_optional=True,
+               description='Controls whether exceptions cause a Failure or not',
+           )
+       }
+       )
+def stream_csv_file_sets(context, sets_list: List, dtypes_by_root: Dict, read_plan: Dict,
+                         prev_uploaded: Optional[DataFrame], uploaded_ids: Dict, table_desc: DataFrame,
+                         table_desc_by_type: Dict, table_type_limits: Dict, insert_columns: String,
+                         regex_patterns: Dict, chunk_size: Int, csv_engine: String, table_name: String,
+                         memory_governor: Dict, stream_child_files: Bool, external_sort: Dict) -> Dict:
+    """
+    Read, merge, transform and upload the sales journal file in all import sets, one chunk at a time. Each set is
+    uploaded in a single transaction, which is rolled back if any of its chunks fail
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set;
+                 [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
+                             {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
+                   {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
+                              {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :param prev_uploaded: details of previously loaded data sets
+    :param uploaded_ids: sales_data primary keys
+    :param table_desc: pandas DataFrame containing details of the database table
+    :param table_desc_by_type: dict of pandas DataFrames of data types in database table with data type as the key
+    :param table_type_limits: dict of type limits with field name as the key
+    :param insert_columns: column names for the database table
+    :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param chunk_size: number of sales journal rows to process at a time
+    :param csv_engine: csv parse engine to use
+    :param table_name: name of database table to upload to
+    :param memory_governor: memory governor configuration, or None to always use chunk_size; if configured chunk_size
+                            is the max number of rows in a chunk
+    :param stream_child_files: read the child files in step with the sales journal chunks, only holding the rows for
+                               the id range of the current chunk in memory; requires the sales journal & child files
+                               to be in id order, otherwise the whole of a child file is read. The order of the files
+                               is checked before any of the set is uploaded
+    :param external_sort: external sort configuration, or None to never sort child files on disk; if configured and
+                          streaming child files, child files larger than the threshold which aren't in id order are
+                          sorted on disk, as is a sales journal file which isn't in id order. If not configured, the
+                          whole of the child files is read for a sales journal file which isn't in id order
+    :return: dict of results with set id as the key
+             { <set_id>: { 'uploaded': True|False,
+                           'value': { 'fileset': <set_id>,
+                                      'sj_pk_min': min value of sales journal primary key,
+                                      'sj_pk_max': max value of sales journal primary key  }}}
+    """
+    regex_patterns_dict = regex_patterns['value']
+    regex_sj = re.compile(regex_patterns_dict['set_sj_pattern'])
+    regex_file_set = re.compile(regex_patterns_dict['set_common_pattern'])
+    children = get_child_joins(regex_patterns_dict, read_plan)
+
+    results = {}
+
+    if len(sets_list) == 0:
+        context.log.info(f"No records to upload to '{table_name}'")
+        return results
+
+    client = context.resources.postgres_warehouse.get_connection(context)
+    if client is None:
+        return results
+
+    insert_query = f'INSERT INTO {table_name} ({insert_columns}) VALUES %s;'
+    governor = get_memory_governor(memory_governor['value'])
+    sorter = get_external_sorter(external_sort['value']) if stream_child_files else None
+
+    try:
+        for set_entry in sets_list:  # dict in list
+            for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+                entries = set_entry[set_id]
+                sj_entry = next((entry for entry in entries if regex_sj.search(entry['name'])), None)
+                if sj_entry is None:
+                    context.log.warn(f"No sales journal file in data set '{set_id}'")
+                    continue
+
+                if not regex_file_set.search(sj_entry['name']):
+                    context.log.warn(f'No type match for {sj_entry["path"]}')
+                    continue
+
+                set_chunk_size = chunk_size
+                if governor is not None:
+                    set_chunk_size = governor.chunk_size(sj_entry['path'], chunk_size)
+
+                dtypes = get_root_dtypes(regex_sj, dtypes_by_root)
+                usecols = get_root_read_plan(regex_sj, read_plan)
+                sj_pk_min = 0
+                sj_pk_max = 0
+                uploaded = 0
+                sorted_path = None
+                joins = []
+                # ids are only recorded as uploaded once the set is committed, as it may be rolled back
+                set_uploaded_ids = dict(uploaded_ids, ids=uploaded_ids['ids'].copy())
+                cursor = client.cursor()
+                try:
+                    sj_path = sj_entry['path']
+                    # the child files are streamed in id order, so the sales journal chunks need to be in id order
+                    stream_children = stream_child_files
+                    if sorter is not None:
+                        sorted_path = sorter.sort(sj_path, ['ID'], dtype=dtypes, usecols=usecols, engine=csv_engine)
+                        if sorted_path is not None:
+                            context.log.info(f"Sorted '{sj_path}' in data set '{set_id}' on disk")
+                            sj_path = sorted_path
+                    elif stream_children and \
+                            not is_file_sorted(sj_path, ['ID'], set_chunk_size, dtype=dtypes, engine=csv_engine):
+                        context.log.warn(f"Can't stream the child files in data set '{set_id}', as '{sj_path}' is "
+                                         f"not in ID order")
+                        stream_children = False
+
+                    # child files, in join order, as either the prepared DataFrame or a stream of it
+                    for regex_item, prepare, merge in children:
+                        entry = next((entry for entry in entries if regex_item.search(entry['name'])), None)
+                        if entry is None:
+                            continue
+                        child_dtypes = get_root_dtypes(regex_item, dtypes_by_root)
+                        child_usecols = get_root_read_plan(regex_item, read_plan)
+                        if stream_children:
+                            context.log.info(f"Streaming '{entry['path']}' in data set '{set_id}'")
+                            child = OrderedChildStream(entry, prepare, child_dtypes, child_usecols, csv_engine,
+                                                       set_chunk_size, sorter=sorter)
+                            if child.fallback is not None:
+                                context.log.warn(f"Can't stream '{entry['path']}' in data set '{set_id}', "
+                                                 f"{child.fallback}")
+                        else:
+                            context.log.info(f"Reading '{entry['path']}' in data set '{set_id}'")
+                            child = read_child_file(entry, prepare, child_dtypes, child_usecols, csv_engine)
+                        joins.append((merge, child))
+
+                    context.log.info(f"Streaming '{sj_path}' in data set '{set_id}' in chunks of {set_chunk_size} rows")
+
+                    for chunk in iter_data_file(sj_path, set_chunk_size, dtype=dtypes, usecols=usecols,
+                                               engine=csv_engine):
+                        chunk.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
+
+                        chunk = filter_sj_df(context, chunk, prev_uploaded, set_uploaded_ids)
+                        if len(chunk) == 0:
+                            continue
+
+                        # id range of the chunk, for the child file rows to join
+                        id_min = chunk['ID'].min()
+                        id_max = chunk['ID'].max()
+                        for merge, child in joins:
+                            if isinstance(child, OrderedChildStream):
+                                fallback = child.fallback
+                                chunk = merge(chunk, child.take(id_min, id_max))
+                                if child.fallback != fallback:
+                                    context.log.warn(f"Can't stream '{child.entry['path']}' in data set '{set_id}', "
+                                                     f"{child.fallback}")
+                            else:
+                                chunk = merge(chunk, child)
+                        chunk = transform_set_df(chunk, table_desc, table_desc_by_type, table_type_limits)
+
+                        execute_values(cursor, insert_query, df_to_tuples(chunk))
+
+                        sj_pk_min = id_min if uploaded == 0 else min(sj_pk_min, id_min)
+                        sj_pk_max = id_max if uploaded == 0 else max(sj_pk_max, id_max)
+                        uploaded += len(chunk)
+
+                        context.log.debug(f"Inserted {len(chunk)} records for '{set_id}' into '{table_name}'")
+
+                    # all of the set or none of it is uploaded
+                    client.commit()
+                    uploaded_ids['ids'] |= set_uploaded_ids['ids']
+
+                    results[set_id] = {
+                        'uploaded': True,   # if empty, still saved to tracking table so won't get continually loaded
+                        'value': {
+                            # entries must follow order of tracking_data_columns.names from config
+                            # ignoring the id column
+                            'fileset': set_id,
+                            'sj_pk_min': sj_pk_min,
+                            'sj_pk_max': sj_pk_max
+                        }
+                    }
+
+                    context.log.info(f"Uploaded {uploaded} records from '{set_id}' to '{table_name}'")
+
+                except IOError as ioe:
+                    client.rollback()
+                    context.log.warn(f'Error loading {sj_entry["path"]}: {ioe}')
+                except psycopg2.Error as e:
+                    client.rollback()
+                    context.log.error(f'Error: {e}')
+                    if context.solid_config['fatal']:
+                        raise e
+                except Exception:
+                    client.rollback()
+                    raise
+                finally:
+                    # tidy up
+                    cursor.close()
+                    for _, child in joins:
+                        if isinstance(child, OrderedChildStream):
+                            child.close()
+                    ExternalSorter.remove(sorted_path)
+    finally:
+        client.close_connection()
+
+    return results
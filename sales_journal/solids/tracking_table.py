@@ -27,6 +27,13 @@ from dagster import (
     OutputDefinition, Output, Optional, Field, Bool)
 from dagster_pandas import DataFrame
 from bitarray import bitarray
+import numpy as np
+
+from sales_journal.misc_sj import get_work_claims, complete_claims, stop_claim_heartbeats
+
+
+# uploaded sales_data primary keys kept between pipeline runs in the same process, keyed on primary key range and query
+_warm_uploaded_ids = {}
 
 
 @solid(
@@ -78,7 +85,7 @@ def generate_tracking_table_fields_str(context, tracking_data_columns: Dict):
            )
        }
        )
-def upload_tracking_table(context, results: Dict, insert_columns: String, table_name: String):
+def upload_tracking_table(context, results: Dict, insert_columns: String, table_name: String, work_claims: Dict):
     """
     Upload a DataFrame to the Postgres server, creating the table if it doesn't exist
     :param context: execution context
@@ -89,9 +96,12 @@ def upload_tracking_table(context, results: Dict, insert_columns: String, table_
                                       'sj_pk_max': max value of sales journal primary key  }}}
     :param insert_columns: column names for the database table
     :param table_name: name of database table to upload to
+    :param work_claims: work claims configuration, or None if sets aren't claimed; claims on uploaded sets are
+                        completed in the same transaction as their tracking record, other claims are released
     :return: panda DataFrame or None
     :rtype: panda.DataFrame
     """
+    claimed = get_work_claims(work_claims['value']) is not None
 
     if len(results.keys()) == 0:
         context.log.info(f"No tracking records to upload to '{table_name}'")
@@ -117,6 +127,8 @@ def upload_tracking_table(context, results: Dict, insert_columns: String, table_
                         context.log.info(f"Uploading result record for '{set_id}'")
 
                         cursor.execute(query)
+                        if claimed:
+                            complete_claims(cursor, [set_id])
                         client.commit()
 
             except psycopg2.Error as e:
@@ -129,6 +141,10 @@ def upload_tracking_table(context, results: Dict, insert_columns: String, table_
                 cursor.close()
                 client.close_connection()
 
+    if claimed:
+        # return any sets which weren't uploaded to the pool
+        stop_claim_heartbeats()
+
 
 @solid(
     output_defs=[
@@ -168,3 +184,73 @@ def transform_loaded_records(context, prev_uploaded: Optional[DataFrame], upload
 
     yield Output(prev_uploaded, 'prev_uploaded')
     yield Output(uploaded_ids, 'uploaded_ids')
+
+
+def clear_warm_uploaded_ids():
+    """
+    Discard the sales_data primary keys kept between pipeline runs, so they are queried again on the next run. Must be
+    called if a run fails, as keys are recorded as uploaded before the upload completes
+    """
+    _warm_uploaded_ids.clear()
+
+
+@solid(required_resource_keys={'postgres_warehouse'},
+       output_defs=[
+           OutputDefinition(dagster_type=Optional[DataFrame], name='prev_uploaded', is_optional=False),
+           OutputDefinition(dagster_type=Dict, name='uploaded_ids', is_optional=False),
+       ],
+       )
+def transform_warm_loaded_records(context, prev_uploaded: Optional[DataFrame], tracking_data_columns: Dict,
+                                  sj_pk_range: Dict, sql: String):
+    """
+    Transform information regarding previously uploaded data, keeping the sales_data primary keys in memory so they are
+    only queried on the first run in the process
+    :param context: execution context
+    :param prev_uploaded: details of previously loaded data sets
+    :param tracking_data_columns: details of tracking data table
+    :param sj_pk_range: range of possible primary key values that will be encountered
+    :param sql: query to select the sales_data primary keys
+    """
+    if prev_uploaded is not None and len(prev_uploaded) > 0:
+        names = tracking_data_columns['value']['names']
+        prev_uploaded.columns = names
+
+    min_sj_pk_value = sj_pk_range['value']['min_sj_pk_value']
+    max_sj_pk_value = sj_pk_range['value']['max_sj_pk_value']
+    key = (min_sj_pk_value, max_sj_pk_value, sql)
+    uploaded_ids = _warm_uploaded_ids.get(key)
+    if uploaded_ids is None:
+        ids = np.empty(0, dtype=np.int64)
+        client = context.resources.postgres_warehouse.get_connection(context)
+        if client is not None:
+            cursor = client.cursor()
+            try:
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+                ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            finally:
+                cursor.close()
+                client.close_connection()
+
+        ids = ids - min_sj_pk_value
+        if len(ids) > 0 and (ids.min() < 0 or ids.max() > max_sj_pk_value - min_sj_pk_value):
+            raise Failure(f'Configuration error: sales_data primary key outside range '
+                          f'{min_sj_pk_value}-{max_sj_pk_value}')
+
+        # set all the bits in one go from a byte per primary key
+        flags = np.zeros(max_sj_pk_value - min_sj_pk_value + 1, dtype=np.uint8)
+        flags[ids] = 1
+        ba = bitarray()
+        ba.pack(flags.tobytes())
+        uploaded_ids = {
+            'min_sj_pk_value': min_sj_pk_value,
+            'max_sj_pk_value': max_sj_pk_value,
+            'ids': ba
+        }
+        _warm_uploaded_ids[key] = uploaded_ids
+        context.log.info(f'Loaded {len(ids)} uploaded sales_data primary keys')
+    else:
+        context.log.info(f"Reusing {uploaded_ids['ids'].count()} uploaded sales_data primary keys from previous run")
+
+    yield Output(prev_uploaded, 'prev_uploaded')
+    yield Output(uploaded_ids, 'uploaded_ids')
@@ -0,0 +1,135 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import re
+
+from dagster import (
+    solid,
+    String,
+    List,
+    Dict,
+    Int,
+)
+
+from .read_cvs_node import (
+    get_root_dtypes,
+    get_root_read_plan,
+)
+from sales_journal.misc_sj import iter_data_file
+
+# default number of rows read from each file to validate it
+PREFLIGHT_SAMPLE_ROWS = 1000
+
+
+def validate_data_file(filepath: str, dtypes: dict, usecols: list, varchar_limits: dict, sample_rows: int,
+                       csv_engine: str) -> list:
+    """
+    Check the header and a sample of rows of a data file against the table description
+    :param filepath: path to file
+    :param dtypes: dtypes dict the file is read with
+    :param usecols: list of names of columns read from the file, or None if all columns are read
+    :param varchar_limits: dict of max sizes of varchar fields with field name as the key
+    :param sample_rows: number of rows to read
+    :param csv_engine: csv parse engine to use
+    :return: list of problems, empty if the file is valid
+    """
+    problems = []
+    chunks = iter_data_file(filepath, sample_rows, dtype=dtypes, usecols=usecols, engine=csv_engine)
+    try:
+        sample = next(chunks, None)
+    except (ValueError, TypeError, OverflowError) as e:
+        # values which can't be converted to the dtype of their column
+        return [f'type mismatch: {e}']
+    finally:
+        chunks.close()
+    if sample is None:
+        return problems     # empty file
+
+    sample.rename(columns=str.strip, inplace=True)  # remove any whitespace in column names
+    if usecols is not None:
+        missing = [column for column in usecols if column not in sample.columns]
+        if len(missing) > 0:
+            problems.append(f'missing columns {missing}')
+
+    for column in sample.columns:
+        max_size = varchar_limits.get(column)
+        if max_size is not None:
+            lengths = sample[column].dropna().astype(str).str.len()
+            if len(lengths) > 0 and lengths.max() > max_size:
+                problems.append(f"'{column}' values up to {lengths.max()} characters exceed max size {max_size}")
+    return problems
+
+
+@solid()
+def validate_file_sets(context, sets_list: List, dtypes_by_root: Dict, read_plan: Dict, table_desc_by_type: Dict,
+                       table_type_limits: Dict, regex_patterns: Dict, csv_engine: String, sample_rows: Int) -> List:
+    """
+    Validate the header and a sample of rows of each file in the import sets against the table description, and
+    remove sets with problems before they are read
+    :param context: execution context
+    :param sets_list: list of, dictionaries of dictionaries of all the files in an import set;
+                 [ {set_id1: [{'name': filename1_set1, 'path': path including filename1_set1, ...},
+                             {'name': filename2_set1, 'path': path including filename2_set1, ...}, ...]},
+                   {set_id2: [{'name': filename1_set2, 'path': path including filename1_set2, ...},
+                              {'name': filename2_set2, 'path': path including filename2_set2, ...}, ...]}, ... ]
+    :param dtypes_by_root: dict of dtypes dicts with root table identifier as the key
+    :param read_plan: dict of lists of columns to read with root table identifier as the key
+    :param table_desc_by_type: dict of pandas DataFrames of data types in database table with data type as the key
+    :param table_type_limits: dict of type limits with field name as the key
+    :param regex_patterns: dict of regex pattern representing filenames and file sets
+    :param csv_engine: csv parse engine to use
+    :param sample_rows: number of rows to read from each file, or 0 to not validate sets
+    :return: list of valid sets
+    """
+    if sample_rows <= 0:
+        return sets_list
+
+    varchar_limits = {field: table_type_limits[field]['max_size'] for field in table_desc_by_type['varchar']['field']}
+
+    regex_patterns_dict = regex_patterns['value']
+    regex_roots = [re.compile(regex_patterns_dict[key])
+                   for key in ['set_sj_pattern', 'set_sjpromo_pattern', 'set_sjseg_pattern']]
+
+    valid = []
+    for set_entry in sets_list:  # dict in list
+        for set_id in set_entry.keys():  # key in dict.keys (there's only one)
+            set_problems = []
+            for entry in set_entry[set_id]:  # dict in list
+                for regex_root in regex_roots:
+                    if regex_root.search(entry['name']):
+                        try:
+                            problems = validate_data_file(entry['path'], get_root_dtypes(regex_root, dtypes_by_root),
+                                                          get_root_read_plan(regex_root, read_plan),
+                                                          varchar_limits, sample_rows, csv_engine)
+                        except IOError as ioe:
+                            problems = [f'unreadable: {ioe}']
+                        set_problems.extend([f"'{entry['path']}' {problem}" for problem in problems])
+                        break
+
+            if len(set_problems) > 0:
+                context.log.warn(f"Rejecting data set '{set_id}': {'; '.join(set_problems)}")
+            else:
+                valid.append(set_entry)
+
+    context.log.info(f'{len(valid)} of {len(sets_list)} data sets passed validation')
+
+    return valid
@@ -0,0 +1,137 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_sales_df(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a DataFrame of sales journal like rows
+    :param rows: number of rows
+    :param seed: random seed
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ID': np.arange(11000001, 11000001 + rows),
+        'ENTITYCURRENCYCODE': rng.choice(['USD', 'EUR'], rows),
+        'AMOUNT': rng.random(rows).round(4),
+        'QUANTITY': rng.integers(0, 10, rows),
+    })
+
+
+def sales_csv_bytes(rows: int = 1500, seed: int = 0) -> bytes:
+    """
+    Generate the contents of a csv file of sales journal like rows
+    :param rows: number of rows
+    :param seed: random seed
+    :return: file contents
+    """
+    return make_sales_df(rows, seed=seed).to_csv(index=False).encode()
+
+
+def write_sales_csv(path, rows: int, seed: int = 0) -> str:
+    """
+    Write a csv file of sales journal like rows
+    :param path: path to file
+    :param rows: number of rows
+    :param seed: random seed
+    :return: path as a string
+    """
+    make_sales_df(rows, seed=seed).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    """
+    Uncompressed csv file of sales journal like rows
+    """
+    path = tmp_path / 'SJ_x.csv'
+    write_sales_csv(path, 2000)
+    return path
+
+
+def make_sj_df(count: int, seed: int = 0, shuffle: bool = False) -> pd.DataFrame:
+    """
+    Generate a sales journal DataFrame
+    :param count: number of rows
+    :param seed: random seed
+    :param shuffle: shuffle the rows, otherwise in ID order
+    :return: sales journal DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'ID': np.sort(rng.choice(np.arange(11000001, 11000001 + count * 3), count, replace=False)),
+        'SEQUENCE': rng.integers(1, 3, count),
+        'DESCRIPTION': rng.choice(['a', 'b', 'c'], count),
+        'AMOUNT': rng.random(count).round(4),
+    })
+    if shuffle:
+        df = df.sample(frac=1, random_state=seed)
+    return df
+
+
+def write_child_csv(path, rows: int, seed: int = 0) -> str:
+    """
+    Write a csv file of child rows in random SALESJOURNALID order, with several rows for some ids
+    :param path: path to file
+    :param rows: number of rows
+    :param seed: random seed
+    :return: path as a string
+    """
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'ID': np.arange(rows),
+        'SALESJOURNALID': rng.integers(11000001, 11000001 + rows // 2, rows),
+        'SEQUENCE': rng.integers(1, 4, rows),
+        'PROMOCODE': rng.choice(['P1', 'P2', 'P3'], rows),
+        'AMOUNT': rng.random(rows).round(4),
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def make_segs_df(ids: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a segs DataFrame, with up to 4 flights per sales journal id in random order
+    :param ids: number of sales journal ids
+    :param seed: random seed
+    :return: segs DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    flights = rng.integers(1, 5, ids)
+    sj_ids = np.repeat(np.arange(11000001, 11000001 + ids), flights)
+    sequence = np.concatenate([np.arange(1, count + 1) for count in flights])
+    count = len(sj_ids)
+    airports = np.array(['DUB', 'LHR', 'JFK', 'CDG'], dtype=object)
+    df = pd.DataFrame({
+        'ID': np.arange(count),
+        'SALESJOURNALID': sj_ids,
+        'ORIGINCODE': rng.choice(airports, count),
+        'DESTINATIONCODE': rng.choice(airports, count),
+        'OPERATINGCARRIER': rng.choice(['EI', 'BA'], count),
+        'FLIGHTSEQUENCE': sequence,
+        'FLIGHTNUMBER': rng.integers(100, 999, count),
+    })
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
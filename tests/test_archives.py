@@ -0,0 +1,123 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import io
+import tarfile
+import zipfile
+
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj.archives import (
+    is_archive,
+    list_archive_members,
+    archive_member_path,
+    split_archive_path,
+    open_archive_member,
+)
+from sales_journal.misc_sj.memory import MemoryGovernor
+from sales_journal.misc_sj.readers import read_csv_file, iter_csv_file
+from .conftest import sales_csv_bytes
+
+
+def write_archive(path, members: dict) -> str:
+    """
+    Write a zip or tar archive, depending on the path extension
+    :param path: path to archive
+    :param members: dict of member contents with member name as the key
+    :return: path as a string
+    """
+    path = str(path)
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(path, 'w:gz' if path.endswith('gz') else 'w') as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.fixture(params=['sets.zip', 'sets.tar', 'sets.tar.gz', 'sets.tgz'])
+def archive(request, tmp_path):
+    """
+    Archive of a csv file, a gzip compressed csv file and a csv file in a sub directory
+    """
+    data = sales_csv_bytes()
+    path = write_archive(tmp_path / request.param, {
+        'SJ_01-04-2019-to-01-05-2019.csv': data,
+        'SJ_01-05-2019-to-01-06-2019.csv.gz': gzip.compress(data),
+        'nested/SJ_01-06-2019-to-01-07-2019.csv': data,
+    })
+    return path, data
+
+
+def test_archive_member_path_round_trip(archive):
+    path, _ = archive
+    member_path = archive_member_path(path, 'nested/SJ_01-06-2019-to-01-07-2019.csv')
+
+    assert is_archive(path)
+    assert split_archive_path(member_path) == (path, 'nested/SJ_01-06-2019-to-01-07-2019.csv')
+    assert split_archive_path(path) is None
+
+
+def test_list_archive_members(archive):
+    path, _ = archive
+    assert sorted(list_archive_members(path)) == ['SJ_01-04-2019-to-01-05-2019.csv',
+                                                  'SJ_01-05-2019-to-01-06-2019.csv.gz',
+                                                  'nested/SJ_01-06-2019-to-01-07-2019.csv']
+
+
+@pytest.mark.parametrize('member', ['SJ_01-04-2019-to-01-05-2019.csv',
+                                    'SJ_01-05-2019-to-01-06-2019.csv.gz',
+                                    'nested/SJ_01-06-2019-to-01-07-2019.csv'])
+def test_read_archive_member_matches_read_csv(archive, member):
+    path, data = archive
+    member_path = archive_member_path(path, member)
+    expected = pd.read_csv(io.BytesIO(data))
+
+    pd.testing.assert_frame_equal(read_csv_file(member_path), expected)
+    pd.testing.assert_frame_equal(pd.concat(iter_csv_file(member_path, 400)), expected)
+
+
+def test_open_archive_member_missing(archive):
+    path, _ = archive
+    with pytest.raises(FileNotFoundError):
+        open_archive_member(archive_member_path(path, 'SJ_missing.csv'))
+
+
+def test_estimate_set_counts_archive_once(archive, tmp_path):
+    path, data = archive
+    members = [{'path': archive_member_path(path, member)}
+               for member in ['SJ_01-04-2019-to-01-05-2019.csv', 'nested/SJ_01-06-2019-to-01-07-2019.csv']]
+    plain = tmp_path / 'SJ_01-07-2019-to-01-08-2019.csv'
+    plain.write_bytes(data)
+    governor = MemoryGovernor()
+    archive_estimate = governor.estimate_file(members[0]['path'])
+
+    assert governor.estimate_set(members[:1]) == archive_estimate
+    assert governor.estimate_set(members) == (archive_estimate // 2) * 2
+    assert governor.estimate_set(members + [{'path': str(plain)}]) == \
+        (archive_estimate // 2) * 2 + governor.estimate_file(str(plain))
@@ -0,0 +1,112 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import bz2
+import gzip
+import lzma
+import os
+
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj import compression
+from sales_journal.misc_sj.compression import (
+    BackgroundReader,
+    get_compression,
+    is_compressed_source,
+    open_decompressed,
+    register_decompressor,
+)
+from sales_journal.misc_sj.readers import read_csv_file, iter_csv_file
+
+# module used to write each compression type
+WRITERS = {
+    '.gz': gzip,
+    '.xz': lzma,
+    '.bz2': bz2,
+}
+EXTENSIONS = list(WRITERS.keys()) + [
+    pytest.param('.zst', marks=pytest.mark.skipif(compression.zstandard is None, reason='requires zstandard'))
+]
+
+
+def write_compressed(path, extension: str, data: bytes) -> str:
+    """
+    Write a compressed file
+    :param path: path to file, without the compression extension
+    :param extension: compression extension
+    :param data: uncompressed contents
+    :return: path of the compressed file
+    """
+    filepath = f'{path}{extension}'
+    if extension == '.zst':
+        with compression.zstandard.open(filepath, 'wb') as fhandle:
+            fhandle.write(data)
+    else:
+        with WRITERS[extension].open(filepath, 'wb') as fhandle:
+            fhandle.write(data)
+    return filepath
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+@pytest.mark.parametrize('background', [True, False])
+def test_open_decompressed_matches_contents(sales_csv, extension, background):
+    data = sales_csv.read_bytes()
+    filepath = write_compressed(sales_csv, extension, data)
+
+    assert get_compression(filepath) is not None and is_compressed_source(filepath)
+    with open_decompressed(filepath, background=background) as fhandle:
+        assert fhandle.read() == data
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_read_compressed_csv_matches_read_csv(sales_csv, extension):
+    filepath = write_compressed(sales_csv, extension, sales_csv.read_bytes())
+    expected = pd.read_csv(sales_csv)
+
+    pd.testing.assert_frame_equal(read_csv_file(filepath), expected)
+    pd.testing.assert_frame_equal(pd.concat(iter_csv_file(filepath, 300)), expected)
+
+
+def test_uncompressed_file_not_compressed_source(sales_csv):
+    assert get_compression(str(sales_csv)) is None
+    assert not is_compressed_source(str(sales_csv))
+
+
+def test_background_reader_small_blocks(sales_csv):
+    data = sales_csv.read_bytes()
+    reader = BackgroundReader(open(sales_csv, 'rb'), block_size=100, queue_blocks=2)
+    try:
+        assert reader.read() == data
+    finally:
+        reader.close()
+
+
+def test_register_decompressor(sales_csv, monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_EXTENSIONS', dict(compression.COMPRESSION_EXTENSIONS))
+    monkeypatch.setattr(compression, 'DECOMPRESSORS', dict(compression.DECOMPRESSORS))
+    filepath = f'{sales_csv}.gzz'
+    os.rename(write_compressed(sales_csv, '.gz', sales_csv.read_bytes()), filepath)
+
+    register_decompressor('.GZZ', 'gzz', lambda path, threads: gzip.open(path, 'rb'))
+
+    assert get_compression(filepath) == 'gzz'
+    pd.testing.assert_frame_equal(read_csv_file(filepath), pd.read_csv(sales_csv))
@@ -0,0 +1,157 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj import external_sort
+from sales_journal.misc_sj.external_sort import (
+    ExternalSorter,
+    get_external_sorter,
+    is_file_sorted,
+    lex_less_equal,
+)
+from sales_journal.misc_sj.readers import pa_parquet
+from .conftest import write_child_csv
+
+requires_arrow = pytest.mark.skipif(pa_parquet is None, reason='requires pyarrow')
+
+
+@pytest.fixture(autouse=True)
+def small_merge_buffers(monkeypatch):
+    """
+    Buffer a few rows of each run while merging, so small files are merged over several rounds
+    """
+    monkeypatch.setattr(external_sort, 'MIN_MERGE_ROWS', 7)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_lex_less_equal_matches_tuples(seed):
+    rng = np.random.default_rng(seed)
+    left = [rng.integers(0, 3, 200), rng.integers(0, 3, 200)]
+    right = [rng.integers(0, 3, 200), rng.integers(0, 3, 200)]
+    bound = (1, 1)
+
+    assert lex_less_equal(left, right).tolist() == \
+        [(a, b) <= (c, d) for a, b, c, d in zip(left[0], left[1], right[0], right[1])]
+    assert lex_less_equal(left, bound).tolist() == [(a, b) <= bound for a, b in zip(left[0], left[1])]
+
+
+def test_is_file_sorted(tmp_path):
+    path = tmp_path / 'SJPromo_x.csv'
+    pd.DataFrame({'SALESJOURNALID': [1, 2, 2, 3, 5, 8], 'SEQUENCE': [1, 1, 2, 1, 1, 1]}).to_csv(path, index=False)
+    assert is_file_sorted(str(path), ['SALESJOURNALID'], 4)
+    assert is_file_sorted(str(path), ['SALESJOURNALID', 'SEQUENCE'], 1)
+
+    # out of order within a chunk, and across a chunk boundary
+    pd.DataFrame({'SALESJOURNALID': [1, 5, 2]}).to_csv(path, index=False)
+    assert not is_file_sorted(str(path), ['SALESJOURNALID'], 3)
+    assert not is_file_sorted(str(path), ['SALESJOURNALID'], 2)
+    assert not is_file_sorted(str(path), ['SALESJOURNALID'], 1)
+
+    # second key out of order
+    path.write_text('SALESJOURNALID, SEQUENCE\n1,2\n1,1\n')
+    assert is_file_sorted(str(path), ['SALESJOURNALID'], 1)
+    assert not is_file_sorted(str(path), ['SALESJOURNALID', 'SEQUENCE'], 1)
+
+
+@pytest.mark.parametrize('keys', [['SALESJOURNALID'], ['SALESJOURNALID', 'SEQUENCE']])
+@pytest.mark.parametrize('run_rows', [50, 333, 10000])
+def test_sort_matches_sort_values(tmp_path, keys, run_rows):
+    path = write_child_csv(tmp_path / 'SJPromo_x.csv', 1000)
+    sorter = ExternalSorter(0, run_rows=run_rows, tmp_dir=str(tmp_path))
+
+    sorted_path = sorter.sort(path, keys)
+    try:
+        assert os.path.dirname(os.path.dirname(sorted_path)) == str(tmp_path)
+        expected = pd.read_csv(path).sort_values(by=keys, kind='stable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(pd.read_csv(sorted_path), expected)
+        assert is_file_sorted(sorted_path, keys, 100)
+        # only the sorted file is left
+        assert sorted(os.listdir(tmp_path)) == sorted(['SJPromo_x.csv', os.path.basename(os.path.dirname(sorted_path))])
+    finally:
+        sorter.remove(sorted_path)
+    assert not os.path.exists(sorted_path)
+
+
+def test_sort_compressed_file_with_projection(tmp_path):
+    path = write_child_csv(tmp_path / 'SJPromo_x.csv', 500, seed=1)
+    with open(path, 'rb') as src, gzip.open(f'{path}.gz', 'wb') as dst:
+        dst.write(src.read())
+    dtype = {'SALESJOURNALID': np.int64, 'SEQUENCE': np.int32, 'PROMOCODE': 'category'}
+    sorter = ExternalSorter(0, run_rows=64, tmp_dir=str(tmp_path))
+
+    sorted_path = sorter.sort(f'{path}.gz', ['SALESJOURNALID'], dtype=dtype,
+                              usecols=['SALESJOURNALID', 'SEQUENCE', 'PROMOCODE'])
+    try:
+        expected = pd.read_csv(path, usecols=['SALESJOURNALID', 'SEQUENCE', 'PROMOCODE']) \
+            .sort_values(by=['SALESJOURNALID'], kind='stable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(pd.read_csv(sorted_path), expected)
+    finally:
+        sorter.remove(sorted_path)
+
+
+@requires_arrow
+@pytest.mark.parametrize('extension', ['parquet', 'feather'])
+def test_sort_columnar_file_keeps_types(tmp_path, extension):
+    df = pd.read_csv(write_child_csv(tmp_path / 'SJPromo_x.csv', 400, seed=2))
+    df['CREATED'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(df['ID'], unit='min')
+    df.loc[3, 'PROMOCODE'] = None
+    path = str(tmp_path / f'SJPromo_x.{extension}')
+    getattr(df, f'to_{extension}')(path)
+    sorter = ExternalSorter(0, run_rows=64, tmp_dir=str(tmp_path))
+
+    sorted_path = sorter.sort(path, ['SALESJOURNALID'], dtype={'SALESJOURNALID': np.int64})
+    try:
+        assert sorted_path.endswith('.parquet')
+        expected = df.sort_values(by=['SALESJOURNALID'], kind='stable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(pd.read_parquet(sorted_path), expected)
+        assert is_file_sorted(sorted_path, ['SALESJOURNALID'], 100)
+    finally:
+        sorter.remove(sorted_path)
+
+
+def test_sort_already_sorted_file(tmp_path):
+    path = tmp_path / 'SJPromo_x.csv'
+    pd.read_csv(write_child_csv(path, 200)).sort_values(by=['SALESJOURNALID']).to_csv(path, index=False)
+    sorter = ExternalSorter(0, run_rows=10, tmp_dir=str(tmp_path))
+
+    assert sorter.sort(str(path), ['SALESJOURNALID']) is None
+    assert os.listdir(tmp_path) == ['SJPromo_x.csv']
+
+
+def test_applies_and_config(tmp_path):
+    path = write_child_csv(tmp_path / 'SJPromo_x.csv', 200)
+    size = os.path.getsize(path)
+
+    assert ExternalSorter(size).applies(path)
+    assert not ExternalSorter(size + 1).applies(path)
+    assert not ExternalSorter(0).applies(str(tmp_path / 'missing.csv'))
+
+    assert get_external_sorter(None) is None
+    assert get_external_sorter({'threshold_mb': None}) is None
+    sorter = get_external_sorter({'threshold_mb': '0.5', 'run_rows': '1000', 'tmp_dir': ''})
+    assert (sorter.threshold, sorter.run_rows, sorter.tmp_dir) == (512 * 1024, 1000, None)
+    assert get_external_sorter({'threshold_mb': 1}).run_rows == external_sort.DEFAULT_RUN_ROWS
@@ -0,0 +1,246 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import bz2
+import gzip
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.solids.read_cvs_node import group_file_sets, tally_file_sets, dedupe_file_sets
+
+REGEX_PATTERNS = {
+    'set_common_pattern': r'^(\w+)_(\d{2}-\d{2}-\d{4})-to-(\d{2}-\d{2}-\d{4})\.(csv(\.gz|\.zst|\.xz|\.bz2)?|parquet|feather)$',
+    'set_link_pattern': r'.*(\d{2}-\d{2}-\d{4}-to-\d{2}-\d{2}-\d{4}).*',
+    'set_sj_pattern': '^SJ_.*',
+    'set_sjpromo_pattern': '^SJPromo_.*',
+    'set_sjref_pattern': '^SJRef_.*',
+    'set_sjseg_pattern': '^SJSeg_.*',
+    'set_required_elements': ['set_sj_pattern', 'set_sjpromo_pattern', 'set_sjref_pattern', 'set_sjseg_pattern'],
+}
+PREFIXES = ['SJ', 'SJPromo', 'SJRef', 'SJSeg']
+
+
+class RecordingLog:
+    """
+    Log which keeps messages
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+    def warn(self, msg):
+        self.messages.append(msg)
+
+
+def per_set_file_sets(files_lst: list, prev_uploaded: pd.DataFrame, regex_patterns_dict: dict) -> list:
+    """
+    Group files into import sets a set at a time, as create_csv_file_sets did before grouping in a single pass
+    """
+    df = pd.DataFrame.from_records(files_lst)
+    df['set'] = df['name'].str.extract(regex_patterns_dict['set_link_pattern'])
+    all_set_entries = df[df['name'].str.contains(regex_patterns_dict['set_common_pattern'])]
+    set_links = all_set_entries['set'].unique()
+    all_set_entries = all_set_entries.drop(['set'], axis=1)
+
+    sets_list = []
+    for set_id in set_links:
+        set_entity = all_set_entries[all_set_entries['name'].str.contains(set_id, regex=False)]
+        counts = {'total': 0}
+        for pattern in regex_patterns_dict['set_required_elements']:
+            counts[pattern] = len(set_entity[set_entity['name'].str.contains(regex_patterns_dict[pattern])])
+            counts['total'] += counts[pattern]
+
+        if counts['total'] == len(regex_patterns_dict['set_required_elements']) and \
+                all([counts[pattern] == 1 for pattern in regex_patterns_dict['set_required_elements']]):
+            if prev_uploaded is None or len(prev_uploaded) == 0 or \
+                    not prev_uploaded['fileset'].isin([set_id]).any():
+                sets_list.append({set_id: set_entity.to_dict('records')})
+    return sets_list
+
+
+def set_name(index: int) -> str:
+    start = datetime(2019, 1, 1) + pd.Timedelta(days=index)
+    end = start + pd.Timedelta(days=1)
+    return f"{start.strftime('%d-%m-%Y')}-to-{end.strftime('%d-%m-%Y')}"
+
+
+def write_set_files(data_dir, sets: int, seed: int = 0) -> list:
+    """
+    Write the files of import sets, some of which are missing a file or have an extra copy of a file with different
+    contents, plus some files not in any set
+    :param data_dir: directory to write to
+    :param sets: number of sets
+    :param seed: random seed
+    :return: list of dictionaries of file details, in random order
+    """
+    rng = np.random.default_rng(seed)
+    names = ['readme.txt', 'SJ_latest.csv', 'notes_01-01-2019-to-02-01-2019.txt']
+    for index in range(sets):
+        link = set_name(index)
+        kind = rng.choice(['complete', 'incomplete', 'extra', 'inconsistent'], p=[0.55, 0.15, 0.15, 0.15])
+        prefixes = list(PREFIXES)
+        if kind in ['incomplete', 'inconsistent']:
+            prefixes.remove(rng.choice(PREFIXES))
+        if kind in ['extra', 'inconsistent']:
+            prefixes.append(rng.choice(prefixes))
+        for number, prefix in enumerate(prefixes):
+            extension = 'csv' if prefix not in prefixes[:number] else 'csv.gz'
+            names.append(f'{prefix}_{link}.{extension}')
+
+    files_lst = []
+    for index in rng.permutation(len(names)):
+        name = names[index]
+        path = os.path.join(str(data_dir), name)
+        # copies of a file have different contents
+        with open(path, 'wb') as fhandle:
+            fhandle.write(f'{name}\n'.encode())
+        files_lst.append({'name': name, 'path': path, 'start_date': datetime(2019, 1, 1),
+                          'end_date': datetime(2019, 1, 2)})
+    return files_lst
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_group_file_sets_matches_per_set_loop(tmp_path, seed):
+    files_lst = write_set_files(tmp_path, 40, seed=seed)
+    log = RecordingLog()
+
+    sets_list = group_file_sets(files_lst, None, REGEX_PATTERNS, 2, log)
+
+    assert sets_list == per_set_file_sets(files_lst, None, REGEX_PATTERNS)
+    assert len(sets_list) > 0
+    assert any([msg.startswith('Discarding incomplete') for msg in log.messages])
+    assert any([msg.startswith('Discarding inconsistent') for msg in log.messages])
+
+
+def test_group_file_sets_ignores_previously_uploaded(tmp_path):
+    files_lst = write_set_files(tmp_path, 30, seed=5)
+    all_sets = [set_id for set_entry in group_file_sets(files_lst, None, REGEX_PATTERNS, 2, RecordingLog())
+                for set_id in set_entry.keys()]
+    # a previously uploaded set with extra copies isn't deduped or reported as inconsistent
+    prev_uploaded = pd.DataFrame({'fileset': all_sets[::2] + [set_name(index) for index in range(30)][1::3]})
+    log = RecordingLog()
+
+    sets_list = group_file_sets(files_lst, prev_uploaded, REGEX_PATTERNS, 2, log)
+
+    assert sets_list == per_set_file_sets(files_lst, prev_uploaded, REGEX_PATTERNS)
+    assert [set_id for set_entry in sets_list for set_id in set_entry.keys()] == \
+        [set_id for set_id in all_sets if set_id not in prev_uploaded['fileset'].tolist()]
+    assert f'Ignoring previously loaded data set: {all_sets[0]}' in log.messages
+    assert not any([msg.startswith('Copies of file') for msg in log.messages])
+
+
+def test_group_file_sets_no_files():
+    log = RecordingLog()
+    assert group_file_sets([], None, REGEX_PATTERNS, 2, log) == []
+    assert log.messages == ['0 data set(s) identified']
+
+
+def write_copies(data_dir, link: str, copies: dict) -> list:
+    """
+    Write the files of an import set, with copies of some of its files
+    :param data_dir: directory to write to
+    :param link: set link
+    :param copies: dict of lists of the extensions & contents of the copies of a file, with the file prefix as the key;
+                   files not in the dict are written once as csv
+    :return: list of dictionaries of file details
+    """
+    files_lst = []
+    for prefix in PREFIXES:
+        for extension, data in copies.get(prefix, [('csv', f'{prefix}\n')]):
+            name = f'{prefix}_{link}.{extension}'
+            path = os.path.join(str(data_dir), name)
+            with open(path, 'wb') as fhandle:
+                compress = {'gz': gzip.compress, 'bz2': bz2.compress}.get(extension.split('.')[-1], bytes)
+                fhandle.write(compress(data.encode()))
+            files_lst.append({'name': name, 'path': path})
+    return files_lst
+
+
+def test_dedupe_keeps_cheapest_identical_copy(tmp_path):
+    link = set_name(0)
+    files_lst = write_copies(tmp_path, link, {'SJ': [('csv.gz', 'ID\n1\n'), ('csv', 'ID\n1\n')],
+                                              'SJSeg': [('csv.bz2', 'ID\n2\n'), ('csv.gz', 'ID\n2\n')]})
+    log = RecordingLog()
+    df, counts = tally_file_sets(files_lst, REGEX_PATTERNS)
+
+    df, counts = dedupe_file_sets(df, [link], REGEX_PATTERNS['set_required_elements'], 2, log)
+
+    assert (counts.loc[link, REGEX_PATTERNS['set_required_elements']] == 1).all()
+    assert sorted(df['name']) == sorted([f'SJ_{link}.csv', f'SJPromo_{link}.csv', f'SJRef_{link}.csv',
+                                         f'SJSeg_{link}.csv.gz'])
+    assert len([msg for msg in log.messages if msg.startswith('Using')]) == 2
+
+    # the deduped set is grouped with the cheapest copies
+    sets_list = group_file_sets(files_lst, None, REGEX_PATTERNS, 2, RecordingLog())
+    assert [entry['name'] for entry in sets_list[0][link]] == \
+        [f'SJ_{link}.csv', f'SJPromo_{link}.csv', f'SJRef_{link}.csv', f'SJSeg_{link}.csv.gz']
+
+
+def test_dedupe_rejects_differing_copies(tmp_path):
+    link = set_name(1)
+    files_lst = write_copies(tmp_path, link, {'SJ': [('csv', 'ID\n1\n'), ('csv.gz', 'ID\n2\n')]})
+    log = RecordingLog()
+    df, counts = tally_file_sets(files_lst, REGEX_PATTERNS)
+
+    deduped, deduped_counts = dedupe_file_sets(df, [link], REGEX_PATTERNS['set_required_elements'], 2, log)
+
+    assert deduped.equals(df) and deduped_counts.equals(counts)
+    assert any([msg.startswith('Copies of file have different contents') for msg in log.messages])
+    log = RecordingLog()
+    assert group_file_sets(files_lst, None, REGEX_PATTERNS, 2, log) == []
+    assert any([msg.startswith('Discarding incomplete') for msg in log.messages])
+
+
+def test_dedupe_unreadable_copy(tmp_path):
+    link = set_name(2)
+    files_lst = write_copies(tmp_path, link, {'SJ': [('csv', 'ID\n1\n'), ('csv.gz', 'ID\n1\n')]})
+    # corrupt compressed copy
+    with open(os.path.join(str(tmp_path), f'SJ_{link}.csv.gz'), 'wb') as fhandle:
+        fhandle.write(b'not gzip')
+    log = RecordingLog()
+
+    assert group_file_sets(files_lst, None, REGEX_PATTERNS, 2, log) == []
+    assert any([msg.startswith('Unable to compare copies of file') for msg in log.messages])
+
+
+def test_dedupe_only_named_sets(tmp_path):
+    files_lst = write_copies(tmp_path, set_name(3), {'SJ': [('csv', 'ID\n1\n'), ('csv.gz', 'ID\n1\n')]}) + \
+        write_copies(tmp_path, set_name(4), {'SJ': [('csv', 'ID\n1\n'), ('csv.gz', 'ID\n1\n')]})
+    df, counts = tally_file_sets(files_lst, REGEX_PATTERNS)
+
+    df, counts = dedupe_file_sets(df, [set_name(4)], REGEX_PATTERNS['set_required_elements'], 1)
+
+    assert counts['total'].tolist() == [5, 4]
+
+    # sets previously uploaded aren't deduped
+    prev_uploaded = pd.DataFrame({'fileset': [set_name(3)]})
+    log = RecordingLog()
+    sets_list = group_file_sets(files_lst, prev_uploaded, REGEX_PATTERNS, 2, log)
+    assert [set_id for set_entry in sets_list for set_id in set_entry.keys()] == [set_name(4)]
+    assert len([msg for msg in log.messages if msg.startswith('Using')]) == 1
@@ -0,0 +1,137 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.solids.read_cvs_node import (
+    sorted_join_indexer,
+    merge_promo_df,
+    merge_segments_df,
+    merge_ref_df,
+)
+from .conftest import make_sj_df
+
+
+def make_child_df(sj_df: pd.DataFrame, seed: int = 0, duplicates: bool = False) -> pd.DataFrame:
+    """
+    Generate a child DataFrame matching some of the sales journal ids, plus ids not in the sales journal
+    :param sj_df: sales journal DataFrame
+    :param seed: random seed
+    :param duplicates: include several rows for some ids
+    :return: child DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    ids = sj_df['ID'].to_numpy()
+    matched = rng.choice(ids, len(ids) // 2, replace=duplicates) if len(ids) > 0 else ids
+    unmatched = np.arange(10000001, 10000011)
+    sj_ids = rng.permutation(np.concatenate([matched, unmatched]))
+    count = len(sj_ids)
+    return pd.DataFrame({
+        'SALESJOURNALID': sj_ids,
+        'SEQUENCE': rng.integers(1, 3, count),
+        'PROMOCODE': rng.choice(['P1', 'P2', 'P3'], count),
+        'AMOUNT': rng.random(count),
+        'QUANTITY': rng.integers(0, 10, count),
+    })
+
+
+def reference_merge(sj_df: pd.DataFrame, child_df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Left join with pandas merge, using the first matching child row
+    :param sj_df: sales journal DataFrame
+    :param child_df: child DataFrame
+    :param keys: child join keys, SALESJOURNALID first
+    :return: merged DataFrame
+    """
+    child_df = child_df.drop_duplicates(subset=keys, keep='first')
+    merged = sj_df.merge(child_df, left_on=['ID'] + keys[1:], right_on=keys, how='left', suffixes=('_left', '_right'))
+    return merged.drop(['SALESJOURNALID'], axis=1)
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_sorted_join_indexer_matches_merge(shuffle):
+    sj_df = make_sj_df(500, shuffle=shuffle)
+    child_df = make_child_df(sj_df, duplicates=True)
+    left_ids = sj_df['ID'].to_numpy()
+    right_ids = child_df['SALESJOURNALID'].to_numpy()
+
+    indexer = sorted_join_indexer(left_ids, right_ids)
+
+    right = pd.DataFrame({'SALESJOURNALID': right_ids, 'ROW': np.arange(len(right_ids))})
+    expected = pd.DataFrame({'ID': left_ids}).merge(right.drop_duplicates('SALESJOURNALID'), left_on='ID',
+                                                    right_on='SALESJOURNALID', how='left')
+    assert indexer.tolist() == expected['ROW'].fillna(-1).astype(int).tolist()
+
+
+def test_sorted_join_indexer_edge_cases():
+    ids = np.array([3, 1, 2])
+    assert sorted_join_indexer(ids, np.array([], dtype=int)).tolist() == [-1, -1, -1]
+    assert sorted_join_indexer(np.array([], dtype=int), ids).tolist() == []
+    assert sorted_join_indexer(np.array([1, 2, 2]), ids) is None
+    assert sorted_join_indexer(ids, np.array([4, 0, 2, 2])).tolist() == [-1, -1, 2]
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+@pytest.mark.parametrize('duplicates', [False, True])
+def test_merge_promo_matches_merge(shuffle, duplicates):
+    sj_df = make_sj_df(1000, shuffle=shuffle)
+    promo_df = make_child_df(sj_df, seed=1, duplicates=duplicates)
+
+    merged = merge_promo_df(sj_df, promo_df)
+
+    pd.testing.assert_frame_equal(merged, reference_merge(sj_df, promo_df, ['SALESJOURNALID', 'SEQUENCE']))
+
+
+def test_merge_promo_non_unique_ids_falls_back_to_merge():
+    sj_df = make_sj_df(100)
+    sj_df = pd.concat([sj_df, sj_df.iloc[:5]])
+    promo_df = make_child_df(sj_df, seed=2)
+
+    merged = merge_promo_df(sj_df, promo_df)
+
+    expected = sj_df.merge(promo_df, left_on=['ID', 'SEQUENCE'], right_on=['SALESJOURNALID', 'SEQUENCE'],
+                           how='left', suffixes=('_left', '_right')).drop(['SALESJOURNALID'], axis=1)
+    pd.testing.assert_frame_equal(merged, expected)
+
+
+@pytest.mark.parametrize('merge', [merge_segments_df, merge_ref_df])
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_merge_on_sj_id_matches_merge(merge, shuffle):
+    sj_df = make_sj_df(1000, shuffle=shuffle)
+    child_df = make_child_df(sj_df, seed=3).drop(['SEQUENCE'], axis=1)
+
+    merged = merge(sj_df, child_df)
+
+    pd.testing.assert_frame_equal(merged, reference_merge(sj_df, child_df, ['SALESJOURNALID']))
+
+
+def test_merge_filtered_slice_leaves_input_unchanged():
+    sj_df = make_sj_df(200)
+    sliced = sj_df[sj_df['DESCRIPTION'] != 'a']
+    columns = list(sliced.columns)
+    child_df = make_child_df(sliced, seed=4).drop(['SEQUENCE'], axis=1)
+
+    merged = merge_segments_df(sliced, child_df)
+
+    assert list(sliced.columns) == columns
+    pd.testing.assert_frame_equal(merged, reference_merge(sliced, child_df, ['SALESJOURNALID']))
@@ -0,0 +1,228 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from sales_journal.misc_sj.archives import archive_member_path
+from sales_journal.misc_sj.manifest import (
+    FileManifest,
+    split_data_root,
+    match_path,
+    may_match_below,
+)
+
+DATE_PATTERN = r'.*(\d{2}-\d{2}-\d{4})-to-(\d{2}-\d{2}-\d{4}).*'
+DATE_FORMAT = '%d-%m-%Y'
+
+
+def write_file(path, data: str = 'ID\n1\n') -> str:
+    """
+    Write a file, creating its directory
+    :param path: path to file
+    :param data: file contents
+    :return: path as a string
+    """
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), 'w') as fhandle:
+        fhandle.write(data)
+    return str(path)
+
+
+def make_manifest(root, manifest_path=None, date_window: tuple = None) -> FileManifest:
+    return FileManifest(str(manifest_path) if manifest_path is not None else None, root, DATE_PATTERN, DATE_FORMAT,
+                        date_window=date_window, list_workers=2)
+
+
+def names(manifest: FileManifest) -> list:
+    return sorted([file['name'] for file in manifest.files()])
+
+
+def test_split_data_root():
+    assert split_data_root('data') == ('data', ['*'])
+    assert split_data_root('archive/**') == ('archive', ['**'])
+    assert split_data_root('archive/*/*/*.csv.gz') == ('archive', ['*', '*', '*.csv.gz'])
+    assert split_data_root('/data/20[12]?/**/SJ*') == ('/data', ['20[12]?', '**', 'SJ*'])
+    assert split_data_root('*.csv') == (os.curdir, ['*.csv'])
+    assert split_data_root('/*.csv') == (os.sep, ['*.csv'])
+
+
+@pytest.mark.parametrize('pattern, parts, expected', [
+    (['*'], ['SJ_x.csv'], True),
+    (['*'], ['2019', 'SJ_x.csv'], False),
+    (['**'], ['SJ_x.csv'], True),
+    (['**'], ['2019', '04', 'SJ_x.csv'], True),
+    (['**', '*.gz'], ['2019', 'SJ_x.csv.gz'], True),
+    (['**', '*.gz'], ['SJ_x.csv.gz'], True),
+    (['**', '*.gz'], ['2019', 'SJ_x.csv'], False),
+    (['*', '**', '*.csv'], ['SJ_x.csv'], False),
+    (['*', '**', '*.csv'], ['2019', '04', '01', 'SJ_x.csv'], True),
+    (['20??', '*', '*.csv'], ['2019', '04', 'SJ_x.csv'], True),
+    (['20??', '*', '*.csv'], ['1999', '04', 'SJ_x.csv'], False),
+])
+def test_match_path(pattern, parts, expected):
+    assert match_path(pattern, parts) == expected
+
+
+def test_may_match_below():
+    assert may_match_below(['**', '*.csv'], ['2019', '04'])
+    assert may_match_below(['20??', '*', '*.csv'], ['2019'])
+    assert not may_match_below(['20??', '*', '*.csv'], ['1999'])
+    assert not may_match_below(['*'], ['2019'])
+
+
+def test_files_with_dates(tmp_path):
+    write_file(tmp_path / 'SJ_01-04-2019-to-01-05-2019.csv')
+    write_file(tmp_path / 'readme.txt')
+    write_file(tmp_path / '2019' / 'SJ_01-05-2019-to-01-06-2019.csv')   # not matched by the root
+    manifest = make_manifest(str(tmp_path))
+
+    assert manifest.refresh() == 2
+    files = {file['name']: file for file in manifest.files()}
+    assert sorted(files.keys()) == ['SJ_01-04-2019-to-01-05-2019.csv', 'readme.txt']
+    sj_file = files['SJ_01-04-2019-to-01-05-2019.csv']
+    assert (sj_file['start_date'], sj_file['end_date']) == (datetime(2019, 4, 1), datetime(2019, 5, 1))
+    assert sj_file['path'] == os.path.join(str(tmp_path), 'SJ_01-04-2019-to-01-05-2019.csv')
+    assert 'start_date' not in files['readme.txt']
+
+
+def test_double_star_root(tmp_path):
+    write_file(tmp_path / 'SJ_01-04-2019-to-01-05-2019.csv')
+    write_file(tmp_path / '2019' / '05' / 'SJ_01-05-2019-to-01-06-2019.csv')
+    write_file(tmp_path / '2019' / '05' / 'SJ_01-05-2019-to-01-06-2019.txt')
+    manifest = make_manifest(f'{tmp_path}/**/*.csv')
+
+    manifest.refresh()
+    assert names(manifest) == ['SJ_01-04-2019-to-01-05-2019.csv', 'SJ_01-05-2019-to-01-06-2019.csv']
+
+
+def test_incremental_refresh(tmp_path):
+    path = write_file(tmp_path / 'SJ_01-04-2019-to-01-05-2019.csv')
+    write_file(tmp_path / 'SJ_01-05-2019-to-01-06-2019.csv')
+    manifest_path = tmp_path.parent / f'{tmp_path.name}.json'
+    manifest = make_manifest(str(tmp_path), manifest_path)
+    assert manifest.refresh() == 2
+    manifest.save()
+
+    # a new manifest loads the saved one, and an unchanged directory isn't relisted
+    manifest = make_manifest(str(tmp_path), manifest_path)
+    assert manifest.refresh() == 0
+    assert names(manifest) == ['SJ_01-04-2019-to-01-05-2019.csv', 'SJ_01-05-2019-to-01-06-2019.csv']
+
+    # rewriting a file doesn't change the directory modification time, so is only seen when forced
+    dir_mtime_ns = os.stat(tmp_path).st_mtime_ns
+    write_file(path, 'ID\n1\n2\n')
+    os.utime(tmp_path, ns=(dir_mtime_ns, dir_mtime_ns))
+    assert manifest.refresh() == 0
+    assert manifest.refresh(force=True) == 1
+    assert manifest.refresh(force=True) == 0
+
+    # adding a file changes the directory modification time, only the new file is examined
+    write_file(tmp_path / 'SJ_01-06-2019-to-01-07-2019.csv')
+    os.utime(tmp_path, ns=(dir_mtime_ns + 1000000000, dir_mtime_ns + 1000000000))
+    assert manifest.refresh() == 1
+    assert len(manifest.files()) == 3
+
+
+def test_header_change_invalidates_manifest(tmp_path):
+    data_dir = tmp_path / 'data'
+    write_file(data_dir / 'SJ_01-04-2019-to-01-05-2019.csv')
+    manifest_path = tmp_path / 'manifest.json'
+    manifest = make_manifest(str(data_dir), manifest_path)
+    manifest.refresh()
+    manifest.save()
+
+    assert make_manifest(str(data_dir), manifest_path).refresh() == 0
+    # different date window, data roots or manifest version
+    assert make_manifest(str(data_dir), manifest_path, date_window=(datetime(2019, 1, 1), None)).refresh() == 1
+    assert make_manifest([str(data_dir), str(tmp_path / 'other')], manifest_path).refresh() == 1
+    with open(manifest_path, 'r') as fhandle:
+        saved = json.load(fhandle)
+    saved['version'] -= 1
+    with open(manifest_path, 'w') as fhandle:
+        json.dump(saved, fhandle)
+    assert make_manifest(str(data_dir), manifest_path).refresh() == 1
+    # unreadable
+    manifest_path.write_text('{')
+    assert make_manifest(str(data_dir), manifest_path).refresh() == 1
+
+
+def test_date_window_prunes_dirs(tmp_path, monkeypatch):
+    for year, month in [(2018, 12), (2019, 3), (2019, 4), (2020, 1)]:
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+        write_file(tmp_path / str(year) / f'{month:02d}' /
+                   f'SJ_{start.strftime(DATE_FORMAT)}-to-{end.strftime(DATE_FORMAT)}.csv')
+    write_file(tmp_path / 'misc' / 'SJ_01-01-2017-to-01-02-2017.csv')
+    write_file(tmp_path / 'misc' / 'SJ_01-04-2019-to-01-05-2019.csv')
+    manifest = make_manifest(f'{tmp_path}/**', date_window=(datetime(2019, 3, 15), datetime(2019, 12, 31)))
+
+    listed = []
+    list_dir = FileManifest._list_dir
+
+    def recording_list_dir(self, dirpath, *args):
+        listed.append(os.path.relpath(dirpath, str(tmp_path)))
+        return list_dir(self, dirpath, *args)
+    monkeypatch.setattr(FileManifest, '_list_dir', recording_list_dir)
+    manifest.refresh()
+
+    # dated files are filtered on their start date, year & month directories on their span
+    assert names(manifest) == ['SJ_01-04-2019-to-01-05-2019.csv', 'SJ_01-04-2019-to-01-05-2019.csv']
+    assert sorted(listed) == sorted(['.', '2019', os.path.join('2019', '03'), os.path.join('2019', '04'), 'misc'])
+
+
+def test_dir_dates(tmp_path):
+    manifest = make_manifest(str(tmp_path))
+    assert manifest._dir_dates(['2019']) == {'start_date': '2019-01-01T00:00:00', 'end_date': '2019-12-31T00:00:00'}
+    assert manifest._dir_dates(['2020', '02']) == \
+        {'start_date': '2020-02-01T00:00:00', 'end_date': '2020-02-29T00:00:00'}
+    assert manifest._dir_dates(['2019', '4', '30']) == \
+        {'start_date': '2019-04-30T00:00:00', 'end_date': '2019-04-30T00:00:00'}
+    assert manifest._dir_dates(['set_01-04-2019-to-01-05-2019']) == \
+        {'start_date': '2019-04-01T00:00:00', 'end_date': '2019-05-01T00:00:00'}
+    # not dates
+    assert manifest._dir_dates(['2019', '13']) == {}
+    assert manifest._dir_dates(['2019', '02', '30']) == {}
+    assert manifest._dir_dates(['archive']) == {}
+    assert manifest._dir_dates(['2019', 'archive']) == {}
+
+
+def test_archive_members(tmp_path):
+    archive_path = str(tmp_path / 'sets.zip')
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        archive.writestr('SJ_01-04-2019-to-01-05-2019.csv', 'ID\n1\n')
+        archive.writestr('nested/SJ_01-05-2019-to-01-06-2019.csv', 'ID\n2\n')
+    write_file(tmp_path / 'broken.zip', 'not a zip')
+    errors = []
+    manifest = make_manifest(str(tmp_path), date_window=(datetime(2019, 5, 1), None))
+
+    manifest.refresh(on_error=errors.append)
+
+    # members are listed as virtual files, filtered by the date window
+    assert manifest.files() == [{'name': 'SJ_01-05-2019-to-01-06-2019.csv',
+                                 'path': archive_member_path(archive_path, 'nested/SJ_01-05-2019-to-01-06-2019.csv'),
+                                 'start_date': datetime(2019, 5, 1), 'end_date': datetime(2019, 6, 1)}]
+    assert len(errors) == 1 and 'broken.zip' in errors[0]
@@ -0,0 +1,148 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj import readers
+from sales_journal.misc_sj.readers import (
+    ENGINE_C,
+    ENGINE_PYARROW,
+    pa_csv,
+    read_csv_file,
+    iter_csv_file,
+    iter_data_file,
+    read_csv_file_parallel,
+    csv_byte_ranges,
+)
+from .conftest import write_sales_csv
+
+requires_arrow = pytest.mark.skipif(pa_csv is None, reason='requires pyarrow')
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 1000])
+def test_iter_data_file_matches_read_csv(tmp_path, chunksize):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 250)
+    chunks = list(iter_data_file(path, chunksize))
+
+    assert all(len(chunk) <= chunksize for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), pd.read_csv(path))
+
+
+def test_iter_data_file_usecols_ignores_whitespace(tmp_path):
+    path = tmp_path / 'SJ_x.csv'
+    path.write_text('ID, AMOUNT ,QUANTITY\n1,1.5,2\n2,2.5,3\n')
+    df = pd.concat(iter_data_file(str(path), 1, usecols=['ID', 'AMOUNT']))
+
+    expected = pd.read_csv(path, usecols=['ID', ' AMOUNT '])
+    pd.testing.assert_frame_equal(df, expected)
+
+
+@requires_arrow
+def test_arrow_engine_matches_c_engine(tmp_path):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 250)
+    dtype = {'ID': 'int64', 'ENTITYCURRENCYCODE': 'category', 'AMOUNT': 'float64', 'QUANTITY': 'int32'}
+    df = read_csv_file(path, dtype=dtype, engine=ENGINE_PYARROW)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(path, dtype=dtype))
+    pd.testing.assert_frame_equal(df, read_csv_file(path, dtype=dtype, engine=ENGINE_C))
+
+
+@requires_arrow
+def test_arrow_engine_text_like_pandas(tmp_path):
+    # pandas leaves untyped dates as text and reads empty fields as NaN
+    path = tmp_path / 'SJ_x.csv'
+    path.write_text('ID,SALESDATE,NOTE\n1,2019-04-01,a\n2,2019-04-02,\n')
+    df = read_csv_file(str(path), engine=ENGINE_PYARROW)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(path))
+
+
+@requires_arrow
+@pytest.mark.parametrize('chunksize', [1, 60, 1000])
+def test_arrow_engine_chunks_match_read_csv(tmp_path, chunksize):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 250)
+    chunks = list(iter_csv_file(path, chunksize, usecols=['ID', 'AMOUNT'], engine=ENGINE_PYARROW))
+
+    assert all(len(chunk) <= chunksize for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), pd.read_csv(path, usecols=['ID', 'AMOUNT']))
+
+
+@pytest.fixture
+def four_cpus(monkeypatch):
+    """
+    Allow parallel reads with 4 processes on machines with fewer cpus
+    """
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+
+
+def test_csv_byte_ranges_cover_file_on_line_boundaries(tmp_path):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 1000)
+    header, ranges = csv_byte_ranges(path, 4)
+    with open(path, 'rb') as fhandle:
+        data = fhandle.read()
+
+    assert data.startswith(header) and len(ranges) > 1
+    assert ranges[0][0] == len(header) and ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+    assert all(data[end - 1:end] == b'\n' for _, end in ranges)
+
+
+@pytest.mark.parametrize('engine', [ENGINE_C, pytest.param(ENGINE_PYARROW, marks=requires_arrow)])
+def test_read_csv_file_parallel_matches_read_csv(tmp_path, four_cpus, engine):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 5000)
+    dtype = {'ID': 'int64', 'ENTITYCURRENCYCODE': 'category', 'AMOUNT': 'float64', 'QUANTITY': 'int32'}
+    df = read_csv_file_parallel(path, 4, dtype=dtype, engine=engine, min_size=1)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(path, dtype=dtype))
+
+
+@pytest.mark.parametrize('quote_row', [0, 3000])
+def test_read_csv_file_parallel_quoted_line_breaks(tmp_path, monkeypatch, four_cpus, quote_row):
+    # quoted fields at the start of the file are found before splitting, later ones when the ranges are read
+    monkeypatch.setattr(readers, 'QUOTE_SAMPLE_SIZE', 64)
+    path = tmp_path / 'SJ_x.csv'
+    rows = [f'{idx},plain' for idx in range(4000)]
+    rows[quote_row] = f'{quote_row},"two\nlines"'
+    path.write_text('ID,NOTE\n' + '\n'.join(rows) + '\n')
+    df = read_csv_file_parallel(str(path), 4, min_size=1)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(path))
+    assert df.loc[quote_row, 'NOTE'] == 'two\nlines'
+
+
+def test_csv_byte_ranges_quoted_start_not_split(tmp_path):
+    path = tmp_path / 'SJ_x.csv'
+    path.write_text('ID,NOTE\n1,"a"\n' + ''.join(f'{idx},b\n' for idx in range(1000)))
+    header, ranges = csv_byte_ranges(str(path), 4)
+
+    assert ranges == [(len(header), os.path.getsize(path))]
+
+
+def test_read_csv_file_parallel_compressed_file(tmp_path, four_cpus):
+    path = write_sales_csv(tmp_path / 'SJ_x.csv', 1000)
+    with open(path, 'rb') as src, gzip.open(f'{path}.gz', 'wb') as dst:
+        dst.write(src.read())
+
+    pd.testing.assert_frame_equal(read_csv_file_parallel(f'{path}.gz', 4, min_size=1), pd.read_csv(path))
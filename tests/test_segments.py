@@ -0,0 +1,72 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.solids.read_cvs_node import aggregate_segments_df
+from .conftest import make_segs_df
+
+
+def reference_segments(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate segments with pandas groupby, as the segs merge originally did
+    :param df: segs DataFrame
+    :return: segments DataFrame
+    """
+    df = df.copy()
+    df['SEG'] = df['ORIGINCODE'] + '-' + df['DESTINATIONCODE']
+    df = df.drop(['ID', 'ORIGINCODE', 'DESTINATIONCODE'], axis=1)
+    df.sort_values(by=['SALESJOURNALID', 'FLIGHTSEQUENCE'], inplace=True)
+    segments = df.groupby(['SALESJOURNALID'])['SEG'].apply(lambda segs: segs.str.cat(sep=','))
+    segments = df.merge(segments.to_frame(), left_on=['SALESJOURNALID'], right_index=True,
+                        how='left', suffixes=('_left', '_right'))
+    segments = segments.drop(['FLIGHTSEQUENCE', 'SEG_left'], axis=1)
+    segments = segments.rename(columns={'SEG_right': 'SEGMENTS'})
+    segments.drop_duplicates(subset='SALESJOURNALID', keep='first', inplace=True)
+    return segments.reset_index(drop=True)
+
+
+@pytest.mark.parametrize('ids', [1, 10, 1000])
+def test_aggregate_segments_matches_groupby(ids):
+    df = make_segs_df(ids)
+    pd.testing.assert_frame_equal(aggregate_segments_df(df.copy()), reference_segments(df))
+
+
+def test_aggregate_segments_missing_codes():
+    df = make_segs_df(200, seed=1)
+    df.loc[df.index[::7], 'ORIGINCODE'] = np.nan
+    # all the segments of the first id missing
+    df.loc[df['SALESJOURNALID'] == 11000001, 'DESTINATIONCODE'] = np.nan
+
+    segments = aggregate_segments_df(df.copy())
+
+    pd.testing.assert_frame_equal(segments, reference_segments(df))
+    assert segments.loc[0, 'SEGMENTS'] == ''
+
+
+def test_aggregate_segments_empty():
+    df = make_segs_df(5).iloc[:0]
+    segments = aggregate_segments_df(df.copy())
+
+    assert len(segments) == 0
+    assert list(segments.columns) == ['SALESJOURNALID', 'OPERATINGCARRIER', 'FLIGHTNUMBER', 'SEGMENTS']
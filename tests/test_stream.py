@@ -0,0 +1,219 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj import ExternalSorter, external_sort
+from sales_journal.solids.read_cvs_node import (
+    prepare_promo_df,
+    merge_promo_df,
+    aggregate_segments_df,
+    merge_segments_df,
+)
+from sales_journal.solids.stream_node import OrderedChildStream
+from .conftest import make_sj_df
+
+START_DATE = datetime(2019, 4, 1)
+
+
+def prepare_promo(df, entry):
+    return prepare_promo_df(df, entry['start_date'])
+
+
+def prepare_segs(df, entry):
+    return aggregate_segments_df(df)
+
+
+def write_promo(path, sj_df: pd.DataFrame, seed: int = 0, in_order: bool = True) -> dict:
+    """
+    Write a promo file for some of the sales journal ids
+    :param path: path to file
+    :param sj_df: sales journal DataFrame
+    :param seed: random seed
+    :param in_order: write in SALESJOURNALID order, otherwise in random order
+    :return: dictionary of the file details
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(sj_df['ID'].to_numpy(), len(sj_df) // 2, replace=False))
+    count = len(ids)
+    df = pd.DataFrame({
+        'ID': np.arange(count),
+        'SALESJOURNALID': ids,
+        'SEQUENCE': rng.integers(1, 3, count),
+        'PROMOCODE': rng.choice(['P1', 'P2', 'P3'], count),
+        'ENTITYPROMOTIONAMOUNT': rng.random(count).round(4),
+    })
+    if not in_order:
+        df = df.sample(frac=1, random_state=seed)
+    df.to_csv(path, index=False)
+    return {'name': os.path.basename(path), 'path': str(path), 'start_date': START_DATE}
+
+
+def write_segs(path, sj_df: pd.DataFrame, seed: int = 0) -> dict:
+    """
+    Write a segs file in SALESJOURNALID order, with up to 3 flights for each sales journal id
+    :param path: path to file
+    :param sj_df: sales journal DataFrame
+    :param seed: random seed
+    :return: dictionary of the file details
+    """
+    rng = np.random.default_rng(seed)
+    flights = rng.integers(1, 4, len(sj_df))
+    count = int(flights.sum())
+    pd.DataFrame({
+        'ID': np.arange(count),
+        'SALESJOURNALID': np.repeat(sj_df['ID'].to_numpy(), flights),
+        'ORIGINCODE': rng.choice(['DUB', 'LHR', 'JFK'], count),
+        'DESTINATIONCODE': rng.choice(['CDG', 'AMS'], count),
+        'FLIGHTSEQUENCE': np.concatenate([np.arange(1, flight + 1) for flight in flights]),
+    }).to_csv(path, index=False)
+    return {'name': os.path.basename(path), 'path': str(path), 'start_date': START_DATE}
+
+
+def stream_join(sj_df: pd.DataFrame, stream: OrderedChildStream, merge, chunk_size: int) -> pd.DataFrame:
+    """
+    Join a child stream to a sales journal DataFrame a chunk at a time, as the streaming upload does
+    :param sj_df: sales journal DataFrame
+    :param stream: child file stream
+    :param merge: function to join the child rows to a chunk
+    :param chunk_size: number of sales journal rows in each chunk
+    :return: joined DataFrame
+    """
+    parts = []
+    try:
+        for start in range(0, len(sj_df), chunk_size):
+            chunk = sj_df.iloc[start:start + chunk_size]
+            parts.append(merge(chunk, stream.take(chunk['ID'].min(), chunk['ID'].max())))
+    finally:
+        stream.close()
+    return pd.concat(parts, ignore_index=True)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1000])
+def test_stream_promo_matches_merge(tmp_path, chunk_size):
+    sj_df = make_sj_df(500)
+    entry = write_promo(tmp_path / 'SJPromo_x.csv', sj_df)
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', chunk_size)
+
+    joined = stream_join(sj_df, stream, merge_promo_df, chunk_size)
+
+    assert stream.fallback is None
+    pd.testing.assert_frame_equal(joined, merge_promo_df(sj_df, prepare_promo(pd.read_csv(entry['path']), entry)))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_stream_segs_matches_merge(tmp_path, chunk_size):
+    # a sales journal id's flights may be split across the chunks read from the segs file
+    sj_df = make_sj_df(300)
+    entry = write_segs(tmp_path / 'SJSeg_x.csv', sj_df)
+    stream = OrderedChildStream(entry, prepare_segs, None, None, 'c', chunk_size)
+
+    joined = stream_join(sj_df, stream, merge_segments_df, chunk_size)
+
+    assert stream.fallback is None
+    pd.testing.assert_frame_equal(joined, merge_segments_df(sj_df, prepare_segs(pd.read_csv(entry['path']), entry)))
+
+
+def test_stream_unordered_file_read_whole_before_taking(tmp_path):
+    path = tmp_path / 'SJPromo_x.csv'
+    pd.DataFrame({'SALESJOURNALID': [1, 5, 2], 'SEQUENCE': [1, 1, 1], 'PROMOCODE': ['a', 'b', 'c']}) \
+        .to_csv(path, index=False)
+    entry = {'name': 'SJPromo_x.csv', 'path': str(path), 'start_date': START_DATE}
+    sj_df = pd.DataFrame({'ID': [1, 2, 5], 'SEQUENCE': [1, 1, 1]})
+
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 2)
+    assert stream.fallback is not None
+
+    joined = stream_join(sj_df, stream, merge_promo_df, 2)
+    assert joined['PROMOCODE'].tolist() == ['a', 'c', 'b']
+
+
+def test_stream_unordered_file_sorted_on_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(external_sort, 'MIN_MERGE_ROWS', 7)
+    sort_dir = tmp_path / 'sort'
+    sort_dir.mkdir()
+    sj_df = make_sj_df(500, seed=1)
+    entry = write_promo(tmp_path / 'SJPromo_x.csv', sj_df, seed=1, in_order=False)
+    sorter = ExternalSorter(0, run_rows=64, tmp_dir=str(sort_dir))
+
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 50, sorter=sorter)
+    assert 'sorting' in stream.fallback and len(os.listdir(sort_dir)) == 1
+
+    joined = stream_join(sj_df, stream, merge_promo_df, 50)
+
+    pd.testing.assert_frame_equal(joined, merge_promo_df(sj_df, prepare_promo(pd.read_csv(entry['path']), entry)))
+    # closing the stream removes the sorted file
+    assert os.listdir(sort_dir) == []
+
+
+def test_stream_unordered_file_below_sort_threshold(tmp_path):
+    sj_df = make_sj_df(200, seed=2)
+    entry = write_promo(tmp_path / 'SJPromo_x.csv', sj_df, seed=2, in_order=False)
+    sorter = ExternalSorter(os.path.getsize(entry['path']) + 1)
+
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 20, sorter=sorter)
+    assert stream.fallback.startswith('reading all')
+
+    joined = stream_join(sj_df, stream, merge_promo_df, 20)
+    pd.testing.assert_frame_equal(joined, merge_promo_df(sj_df, prepare_promo(pd.read_csv(entry['path']), entry)))
+
+
+def test_stream_unordered_chunks_read_whole_file(tmp_path):
+    sj_df = make_sj_df(200, seed=3)
+    entry = write_promo(tmp_path / 'SJPromo_x.csv', sj_df, seed=3)
+    promo_df = prepare_promo(pd.read_csv(entry['path']), entry)
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 20)
+
+    # chunks in descending id order
+    chunks = [sj_df.iloc[start:start + 20] for start in range(0, len(sj_df), 20)][::-1]
+    joined = [merge_promo_df(chunk, stream.take(chunk['ID'].min(), chunk['ID'].max())) for chunk in chunks]
+    stream.close()
+
+    assert stream.fallback is not None
+    for chunk, chunk_joined in zip(chunks, joined):
+        pd.testing.assert_frame_equal(chunk_joined, merge_promo_df(chunk, promo_df))
+
+
+def test_stream_file_reordered_after_check(tmp_path):
+    sj_df = make_sj_df(200, seed=4)
+    entry = write_promo(tmp_path / 'SJPromo_x.csv', sj_df, seed=4)
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 20)
+    write_promo(tmp_path / 'SJPromo_x.csv', sj_df, seed=4, in_order=False)
+
+    with pytest.raises(IOError):
+        stream_join(sj_df, stream, merge_promo_df, 20)
+
+
+def test_stream_empty_file(tmp_path):
+    path = tmp_path / 'SJPromo_x.csv'
+    path.write_text('ID,SALESJOURNALID,SEQUENCE,PROMOCODE\n')
+    entry = {'name': 'SJPromo_x.csv', 'path': str(path), 'start_date': START_DATE}
+    sj_df = make_sj_df(30, seed=5)
+    stream = OrderedChildStream(entry, prepare_promo, None, None, 'c', 10)
+
+    joined = stream_join(sj_df, stream, merge_promo_df, 10)
+
+    assert len(joined) == len(sj_df) and joined['PROMOCODE'].isna().all()
@@ -0,0 +1,128 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj.timestamps import (
+    fixed_width_layout,
+    is_fixed_width_format,
+    parse_fixed_width,
+    parse_timestamps,
+)
+
+SJ_FORMAT = '%d-%m-%Y %H:%M:%S'
+
+
+def make_timestamps(count: int, seed: int = 0) -> pd.Series:
+    """
+    Generate timestamp strings in the sales journal format, repeating as they do within a reservation
+    :param count: number of strings
+    :param seed: random seed
+    :return: Series of strings
+    """
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 10 * 365 * 24 * 3600, count // 4 + 1)
+    timestamps = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.choice(seconds, count), unit='s')
+    return pd.Series(timestamps.strftime(SJ_FORMAT), dtype=object)
+
+
+def test_fixed_width_layout():
+    width, fields, literals = fixed_width_layout(SJ_FORMAT)
+    assert width == 19
+    assert fields['day'] == (0, 2) and fields['year'] == (6, 4) and fields['second'] == (17, 2)
+    assert (2, ord('-')) in literals and (10, ord(' ')) in literals
+
+    assert is_fixed_width_format('%Y%m%d')
+    for fmt in [None, '%d-%m-%y', '%d %b %Y', '%d-%m-%Y %H:%M:%S.%f', '%d-%m %H:%M', '%d-%m-%Y %']:
+        assert not is_fixed_width_format(fmt)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_parse_timestamps_matches_to_datetime(seed):
+    series = make_timestamps(2000, seed=seed)
+    pd.testing.assert_series_equal(parse_timestamps(series, SJ_FORMAT), pd.to_datetime(series, format=SJ_FORMAT))
+
+
+def test_parse_timestamps_leap_days():
+    series = pd.Series(['29-02-2020 23:59:59', '29-02-2000 00:00:00', '28-02-1900 12:00:00', '31-12-2019 00:00:01'])
+    pd.testing.assert_series_equal(parse_timestamps(series, SJ_FORMAT), pd.to_datetime(series, format=SJ_FORMAT))
+
+    # no leap day in a year divisible by 100 but not by 400, or in a year not divisible by 4
+    for invalid in ['29-02-1900 00:00:00', '29-02-2019 00:00:00']:
+        assert parse_fixed_width(np.array([invalid], dtype=object), fixed_width_layout(SJ_FORMAT)) is None
+        with pytest.raises(ValueError):
+            parse_timestamps(pd.Series([invalid]), SJ_FORMAT)
+
+
+@pytest.mark.parametrize('invalid', ['32-01-2020 00:00:00', '00-01-2020 00:00:00', '31-04-2020 00:00:00',
+                                     '01-13-2020 00:00:00', '01-00-2020 00:00:00', '01-01-2020 24:00:00',
+                                     '01-01-2020 00:60:00'])
+def test_parse_timestamps_invalid_fields_raise_like_to_datetime(invalid):
+    series = pd.Series(['01-01-2020 00:00:00', invalid])
+    assert parse_fixed_width(np.asarray(series, dtype=object), fixed_width_layout(SJ_FORMAT)) is None
+    with pytest.raises(ValueError):
+        pd.to_datetime(series, format=SJ_FORMAT)
+    with pytest.raises(ValueError):
+        parse_timestamps(series, SJ_FORMAT)
+
+
+def test_parse_timestamps_nan():
+    series = pd.Series(['01-01-2020 10:00:00', np.nan, None, '01-01-2020 10:00:00'], index=[5, 6, 7, 8], name='TS')
+    parsed = parse_timestamps(series, SJ_FORMAT)
+
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(series, format=SJ_FORMAT))
+    assert parsed.isna().tolist() == [False, True, True, False]
+    assert parse_timestamps(pd.Series([np.nan, None], dtype=object), SJ_FORMAT).isna().all()
+
+
+def test_parse_timestamps_categorical():
+    series = make_timestamps(500, seed=4)
+    series[::7] = np.nan
+    categorical = series.astype('category')
+
+    pd.testing.assert_series_equal(parse_timestamps(categorical, SJ_FORMAT),
+                                   pd.to_datetime(series, format=SJ_FORMAT))
+
+
+@pytest.mark.parametrize('malformed', ['1-1-2020 00:00:00', '01/01/2020 00:00:00', '01-01-2020 0a:00:00',
+                                       '01-01-2020  0:00:00', '01-01-2020 00:00:00 '])
+def test_parse_timestamps_falls_back_to_to_datetime(malformed):
+    series = pd.Series(['02-01-2020 00:00:00', malformed])
+    assert parse_fixed_width(np.asarray(series, dtype=object), fixed_width_layout(SJ_FORMAT)) is None
+
+    try:
+        expected = pd.to_datetime(series, format=SJ_FORMAT)
+    except ValueError:
+        with pytest.raises(ValueError):
+            parse_timestamps(series, SJ_FORMAT)
+    else:
+        pd.testing.assert_series_equal(parse_timestamps(series, SJ_FORMAT), expected)
+
+
+def test_parse_timestamps_not_fixed_width_uses_to_datetime():
+    series = pd.Series(['1 Jan 2020', '29 Feb 2020'])
+    pd.testing.assert_series_equal(parse_timestamps(series, '%d %b %Y'), pd.to_datetime(series, format='%d %b %Y'))
+    # already parsed
+    parsed = pd.to_datetime(make_timestamps(10), format=SJ_FORMAT)
+    pd.testing.assert_series_equal(parse_timestamps(parsed, SJ_FORMAT), parsed)
@@ -0,0 +1,111 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pandas as pd
+import pytest
+from bitarray import bitarray
+
+from sales_journal.solids.read_cvs_node import uploaded_id_flags, mark_uploaded_ids, filter_sj_df
+
+MIN_ID = 11000000
+MAX_ID = 11009999
+
+
+class LogContext:
+    """
+    Execution context with a log which discards messages
+    """
+
+    class Log:
+        def info(self, msg):
+            pass
+
+        def warn(self, msg):
+            pass
+
+    log = Log()
+
+
+def make_uploaded_ids(endian: str, uploaded: list = None) -> dict:
+    """
+    Generate sales_data primary keys
+    :param endian: bit endianness of the bitarray
+    :param uploaded: keys to record as uploaded
+    :return: dict of sales_data primary keys
+    """
+    ids = bitarray(MAX_ID - MIN_ID + 1, endian=endian)
+    ids.setall(False)
+    for value in uploaded or []:
+        ids[value - MIN_ID] = True
+    return {'min_sj_pk_value': MIN_ID, 'max_sj_pk_value': MAX_ID, 'ids': ids}
+
+
+@pytest.fixture(params=['big', 'little'])
+def endian(request):
+    return request.param
+
+
+def test_uploaded_id_flags_matches_bitarray(endian):
+    rng = np.random.default_rng(0)
+    uploaded = rng.choice(np.arange(MIN_ID, MAX_ID + 1), 500, replace=False)
+    uploaded_ids = make_uploaded_ids(endian, [int(value) for value in uploaded])
+    values = np.concatenate([rng.integers(MIN_ID, MAX_ID + 1, 2000), [MIN_ID, MAX_ID], uploaded[:10]])
+
+    flags = uploaded_id_flags(uploaded_ids, values)
+
+    expected = [uploaded_ids['ids'][int(value) - MIN_ID] for value in values]
+    assert flags.dtype == bool
+    assert flags.tolist() == expected
+    assert flags.tolist() == np.isin(values, uploaded).tolist()
+
+
+def test_mark_uploaded_ids_matches_bitarray(endian):
+    rng = np.random.default_rng(1)
+    # duplicates and keys sharing a byte must all be recorded
+    values = np.concatenate([rng.integers(MIN_ID, MAX_ID + 1, 1000), [MIN_ID, MIN_ID + 1, MIN_ID + 7, MAX_ID],
+                             [MIN_ID + 1]])
+    uploaded_ids = make_uploaded_ids(endian, [MIN_ID + 3])
+
+    mark_uploaded_ids(uploaded_ids, values)
+
+    expected = make_uploaded_ids(endian, [MIN_ID + 3] + [int(value) for value in values])
+    assert uploaded_ids['ids'] == expected['ids']
+    assert uploaded_id_flags(uploaded_ids, values).all()
+
+
+def test_filter_sj_df_removes_uploaded(endian):
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({
+        'ID': rng.permutation(np.arange(MIN_ID + 1, MIN_ID + 1001)),
+        'ENTITYCURRENCYCODE': rng.choice(['USD', 'EUR'], 1000, p=[0.9, 0.1]),
+    })
+    uploaded = [int(value) for value in df['ID'].values[:100]]
+    uploaded_ids = make_uploaded_ids(endian, uploaded)
+    prev_uploaded = pd.DataFrame({'fileset': ['01-03-2019-to-01-04-2019']})
+
+    filtered = filter_sj_df(LogContext(), df, prev_uploaded, uploaded_ids)
+
+    expected = df[(df['ENTITYCURRENCYCODE'] == 'USD') & ~df['ID'].isin(uploaded)].sort_values(by=['ID'])
+    pd.testing.assert_frame_equal(filtered, expected)
+    # the remaining keys are recorded as uploaded
+    assert uploaded_id_flags(uploaded_ids, df['ID'].values).tolist() == \
+        ((df['ENTITYCURRENCYCODE'] == 'USD') | df['ID'].isin(uploaded)).tolist()
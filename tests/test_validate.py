@@ -0,0 +1,106 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_journal.misc_sj.readers import pa_csv
+from sales_journal.solids.validate_node import validate_data_file
+
+requires_arrow = pytest.mark.skipif(pa_csv is None, reason='requires pyarrow')
+
+DTYPES = {'ID': np.int64, 'SEQUENCE': np.int32, 'CURRENCY': 'category', 'AMOUNT': np.float64}
+USECOLS = ['ID', 'SEQUENCE', 'CURRENCY', 'AMOUNT']
+VARCHAR_LIMITS = {'CURRENCY': 3}
+
+
+@pytest.fixture
+def sales_file(tmp_path):
+    """
+    Function to write a sales file which matches the table description, with changes to its columns
+    """
+    def write(name: str = 'SJ_01-04-2019-to-01-05-2019.csv', **columns) -> str:
+        df = pd.DataFrame({
+            'ID': np.arange(11000001, 11000051),
+            'SEQUENCE': np.tile([1, 2], 25),
+            'CURRENCY': np.tile(['USD', 'EUR'], 25),
+            'AMOUNT': np.linspace(0, 100, 50).round(2),
+        })
+        for column, values in columns.items():
+            if values is None:
+                df = df.drop(columns=[column])
+            else:
+                df[column] = values
+        path = str(tmp_path / name)
+        df.to_csv(path, index=False, compression='infer')
+        return path
+    return write
+
+
+@pytest.mark.parametrize('engine', ['c', pytest.param('pyarrow', marks=requires_arrow)])
+def test_valid_file(sales_file, engine):
+    assert validate_data_file(sales_file(), DTYPES, USECOLS, VARCHAR_LIMITS, 10, engine) == []
+    assert validate_data_file(sales_file(name='SJ_01-04-2019-to-01-05-2019.csv.gz'), DTYPES, None, VARCHAR_LIMITS,
+                              1000, engine) == []
+
+
+def test_missing_column(sales_file):
+    problems = validate_data_file(sales_file(SEQUENCE=None), DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c')
+    assert problems == ["missing columns ['SEQUENCE']"]
+
+
+def test_type_mismatch(sales_file):
+    path = sales_file(SEQUENCE=np.tile(['1', 'x'], 25))
+    problems = validate_data_file(path, DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c')
+    assert len(problems) == 1 and problems[0].startswith('type mismatch')
+
+    # only the sample is checked
+    values = np.ones(50, dtype=object)
+    values[-1] = 'x'
+    path = sales_file(SEQUENCE=values)
+    assert validate_data_file(path, DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c') == []
+    assert validate_data_file(path, DTYPES, USECOLS, VARCHAR_LIMITS, 50, 'c')[0].startswith('type mismatch')
+
+
+def test_varchar_overflow(sales_file):
+    path = sales_file(CURRENCY=np.tile(['USD', 'EURO'], 25))
+    problems = validate_data_file(path, DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c')
+    assert problems == ["'CURRENCY' values up to 4 characters exceed max size 3"]
+    # nulls don't count towards the size
+    assert validate_data_file(sales_file(CURRENCY=np.nan), DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c') == []
+
+
+def test_unreadable_file(sales_file, tmp_path):
+    with pytest.raises(IOError):
+        validate_data_file(str(tmp_path / 'SJ_missing.csv'), DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c')
+
+    path = tmp_path / 'SJ_01-04-2019-to-01-05-2019.csv.gz'
+    path.write_bytes(b'not gzip')
+    with pytest.raises(IOError):
+        validate_data_file(str(path), DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c')
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'SJ_01-04-2019-to-01-05-2019.csv'
+    path.write_text('ID,SEQUENCE,CURRENCY,AMOUNT\n')
+    assert validate_data_file(str(path), DTYPES, USECOLS, VARCHAR_LIMITS, 10, 'c') == []
@@ -0,0 +1,244 @@
+# The MIT License (MIT)
+# Copyright (c) 2019 Ian Buttimer
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import uuid
+
+import pytest
+
+from sales_journal.misc_sj import work_claims
+from sales_journal.misc_sj.work_claims import (
+    WorkClaims,
+    get_work_claims,
+    start_claim_heartbeat,
+    complete_claims,
+    stop_claim_heartbeats,
+)
+from sales_journal.solids.read_cvs_node import claim_file_sets
+
+# postgres connection string for the tests against a database, e.g. 'dbname=test user=postgres'
+DSN_ENV = 'SJ_TEST_POSTGRES_DSN'
+
+
+class RecordingCursor:
+    """
+    Database cursor which records the statements executed
+    """
+
+    def __init__(self, rows: list = None):
+        self.statements = []
+        self._rows = rows if rows is not None else []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class RecordingClient:
+    """
+    Database connection which records the statements executed on its cursors
+    """
+
+    def __init__(self, rows: list = None):
+        self.cursors = []
+        self.commits = 0
+        self.closed = False
+        self._rows = rows
+
+    def cursor(self):
+        self.cursors.append(RecordingCursor(rows=self._rows))
+        return self.cursors[-1]
+
+    def commit(self):
+        self.commits += 1
+
+    def close_connection(self):
+        self.closed = True
+
+    @property
+    def statements(self):
+        return [statement for cursor in self.cursors for statement in cursor.statements]
+
+
+def test_get_work_claims_config():
+    assert get_work_claims(None) is None
+    assert get_work_claims({'table': None}) is None
+
+    claims = get_work_claims({'table': 'work', 'tracking_table': 'tracking', 'worker_id': 'w1', 'lease_seconds': '60'})
+    assert (claims.table_name, claims.tracking_table, claims.worker_id, claims.lease_seconds) == \
+        ('work', 'tracking', 'w1', 60)
+    assert get_work_claims({'table': 'work', 'tracking_table': 'tracking'}).lease_seconds == \
+        work_claims.WORK_LEASE_SECONDS
+
+
+def test_claim_returns_sets_in_order_of_preference():
+    claims = WorkClaims('work', 'tracking', worker_id='w1', lease_seconds=60)
+    cursor = RecordingCursor(rows=[('set_c',), ('set_a',)])
+
+    claimed = claims.claim(cursor, ('set_a', 'set_b', 'set_c'), 2)
+
+    assert claimed == ['set_a', 'set_c']
+    sql, params = cursor.statements[0]
+    assert 'FOR UPDATE SKIP LOCKED' in sql and 'tracking' in sql
+    assert params == ('w1', 60, ['set_a', 'set_b', 'set_c'], ['set_a', 'set_b', 'set_c'], 2)
+
+
+def test_statements_only_touch_own_claims():
+    claims = WorkClaims('work', 'tracking', worker_id='w1')
+    cursor = RecordingCursor()
+
+    claims.renew(cursor, ('set_a',))
+    claims.release(cursor, ('set_a',))
+    claims.complete(cursor, ('set_a',))
+
+    for sql, params in cursor.statements:
+        assert 'worker = %s' in sql and 'w1' in params and ['set_a'] in params
+
+
+def test_heartbeat_completes_and_releases_claims():
+    claims = WorkClaims('work', 'tracking', worker_id='w1', lease_seconds=3600)
+    client = RecordingClient()
+    start_claim_heartbeat(claims, client, ['set_a', 'set_b'])
+    cursor = RecordingCursor()
+
+    complete_claims(cursor, ['set_a'])
+    stop_claim_heartbeats()
+
+    assert cursor.statements[0][0].startswith('DELETE FROM work') and cursor.statements[0][1] == ('w1', ['set_a'])
+    # only the set not completed is returned to the pool
+    assert len(client.statements) == 1
+    sql, params = client.statements[0]
+    assert 'worker = NULL' in sql and params == ('w1', ['set_b'])
+    assert client.commits == 1 and client.closed
+
+
+class ClaimContext:
+    """
+    Execution context with a postgres resource supplying a connection, and a log which keeps messages
+    """
+
+    def __init__(self, client):
+        self.messages = []
+        self.log = self
+        self.resources = self
+        self.postgres_warehouse = self
+        self._client = client
+
+    def get_connection(self, context):
+        return self._client
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+
+def test_claim_file_sets_returns_sets_over_run_size():
+    claims = WorkClaims('work', 'tracking', worker_id='w1', lease_seconds=3600)
+    client = RecordingClient(rows=[('set_c',), ('set_a',), ('set_d',)])
+    context = ClaimContext(client)
+    sized = []
+
+    def size(set_ids):
+        sized.append(list(set_ids))
+        return 2
+
+    try:
+        claimed = claim_file_sets(context, claims, ['set_a', 'set_b', 'set_c', 'set_d'], 3, size=size)
+    finally:
+        stop_claim_heartbeats()
+
+    # the run is sized on the sets claimed, not on the sets offered
+    assert sized == [['set_a', 'set_c', 'set_d']]
+    assert claimed == ['set_a', 'set_c']
+    released = [params for sql, params in client.statements if 'worker = NULL' in sql]
+    assert released[0] == ('w1', ['set_d'])
+
+
+@pytest.fixture
+def postgres():
+    """
+    Connections to the test database, and names of work & tracking tables which are dropped afterwards
+    """
+    dsn = os.environ.get(DSN_ENV)
+    if not dsn:
+        pytest.skip(f'set {DSN_ENV} to run tests against a postgres database')
+    psycopg2 = pytest.importorskip('psycopg2')
+
+    suffix = uuid.uuid4().hex[:8]
+    tables = (f'sj_test_work_{suffix}', f'sj_test_tracking_{suffix}')
+    connections = [psycopg2.connect(dsn), psycopg2.connect(dsn)]
+    cursor = connections[0].cursor()
+    cursor.execute(f'CREATE TABLE {tables[1]} (fileset TEXT PRIMARY KEY);')
+    connections[0].commit()
+    yield connections, tables
+
+    for connection in connections:
+        connection.rollback()
+    cursor = connections[0].cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {tables[0]}, {tables[1]};')
+    connections[0].commit()
+    for connection in connections:
+        connection.close()
+
+
+def test_claims_in_postgres(postgres):
+    (conn_a, conn_b), (work_table, tracking_table) = postgres
+    worker_a = WorkClaims(work_table, tracking_table, worker_id='a', lease_seconds=3600)
+    worker_b = WorkClaims(work_table, tracking_table, worker_id='b', lease_seconds=3600)
+    cursor_a = conn_a.cursor()
+    cursor_b = conn_b.cursor()
+
+    worker_a.create_table(cursor_a)
+    cursor_a.execute(f"INSERT INTO {tracking_table} (fileset) VALUES ('set_0');")
+    worker_a.register(cursor_a, ['set_0', 'set_1', 'set_2', 'set_3'])
+    conn_a.commit()
+    cursor_a.execute(f'SELECT fileset FROM {work_table} ORDER BY fileset;')
+    assert [row[0] for row in cursor_a.fetchall()] == ['set_1', 'set_2', 'set_3']
+
+    # while a's claim is uncommitted its rows are locked, so b skips them rather than waiting
+    assert worker_a.claim(cursor_a, ['set_0', 'set_3', 'set_1', 'set_2'], 2) == ['set_3', 'set_1']
+    assert worker_b.claim(cursor_b, ['set_0', 'set_1', 'set_2', 'set_3'], 5) == ['set_2']
+    conn_a.commit()
+    conn_b.commit()
+
+    # claims held on unexpired leases aren't claimed again
+    assert worker_b.claim(cursor_b, ['set_1', 'set_3'], 5) == []
+    conn_b.commit()
+
+    # released and expired claims can be claimed again
+    worker_a.release(cursor_a, ['set_1'])
+    cursor_a.execute(f"UPDATE {work_table} SET lease_expires = now() - interval '1 second' "
+                     f"WHERE fileset = 'set_3';")
+    conn_a.commit()
+    assert worker_b.claim(cursor_b, ['set_1', 'set_3'], 5) == ['set_1', 'set_3']
+    conn_b.commit()
+
+    # completing only removes the worker's own claims
+    worker_a.complete(cursor_a, ['set_1', 'set_2', 'set_3'])
+    worker_b.complete(cursor_b, ['set_1'])
+    conn_a.commit()
+    conn_b.commit()
+    cursor_a.execute(f'SELECT fileset, worker FROM {work_table} ORDER BY fileset;')
+    assert cursor_a.fetchall() == [('set_2', 'b'), ('set_3', 'b')]